@@ -0,0 +1,2 @@
+# 非同期スタック(Quart + SQLAlchemy asyncio + asyncpg)
+# ルートと JSON は同期スタック(api/)と同じで、処理本体は services を共有する。
@@ -0,0 +1,445 @@
+import asyncio
+import tempfile
+from functools import wraps
+from typing import Optional
+from quart import Blueprint, g, request, jsonify, make_response
+import cache
+import coalesce
+import encoding
+import events
+import hashing
+import routing
+import sharding
+import tokens
+from ratelimit import login_limiter
+from services import auth as auth_service
+from services import board as board_service
+from services import categories as category_service
+from services import tasks as task_service
+from services import transfer as transfer_service
+from services.utils import parse_if_match
+from .database import async_engine_for, async_session_scope
+
+# api/ と同じルートを Quart で提供する。
+# サービス関数は run_sync で実行され、DB 待ちの間はイベントループを占有しない。
+api_bp = Blueprint("api", __name__)
+
+BUSY_MESSAGE = "混み合っています。しばらくしてから再度お試しください"
+
+
+# エラーレスポンス
+def error(message: str, status: int):
+    return jsonify({"error": message}), status
+
+
+# api.utils.authenticated の非同期版
+def authenticated(view):
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        data = (await request.get_json(silent=True)) or {}
+        claimed = request.args.get("user_id") or data.get("user_id")
+        claims, err = tokens.resolve(request.headers.get("Authorization"), claimed)
+        if err:
+            return jsonify(err[0]), err[1]
+        g.principal = claims
+        return await view(*args, **kwargs)
+
+    return wrapper
+
+
+# クエリパラメータ(トークンがあれば user_id をトークンの値にする。If-Match は version に)
+def request_args():
+    claims = g.get("principal")
+    version = parse_if_match(request.headers.get("If-Match"))
+    if claims is None and version is None:
+        return request.args
+    args = request.args.copy()
+    if claims is not None:
+        args["user_id"] = str(claims["uid"])
+    if version is not None:
+        args["version"] = str(version)
+    return args
+
+
+# リクエストボディ(トークンがあれば user_id をトークンの値にする。If-Match は version に)
+async def body() -> dict:
+    data = (await request.get_json(silent=True)) or {}
+    claims = g.get("principal")
+    if claims is not None:
+        data["user_id"] = claims["uid"]
+    version = parse_if_match(request.headers.get("If-Match"))
+    if version is not None:
+        data["version"] = version
+    return data
+
+
+# パラメータの user_id(接続先の選択用。数値でなければ None)
+def route_user(params) -> Optional[int]:
+    try:
+        return int(params.get("user_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+# 利用者をセッションに紐づける。トークンのカテゴリー一覧と比べるキャッシュバージョンは
+# ここでスレッドで読んでおく(run_sync の中はイベントループ上で動くため)
+async def bind_principal(session, claims: Optional[dict], user_id) -> None:
+    tokens.bind(session.sync_session, claims)
+    if claims is None or user_id is None or not cache.enabled():
+        return
+    scope = cache.categories_scope(user_id)
+    version = await asyncio.to_thread(cache.version, scope)
+    tokens.bind_categories_version(session.sync_session, user_id, version)
+
+
+# サービス関数を非同期セッションで実行し、結果 (body, status[, headers]) を返す。
+# 最後の引数がパラメータ。セッションは user_id のシャード(GET ならレプリカ)につなぐ
+async def execute(fn, *args) -> tuple:
+    readonly = request.method in ("GET", "HEAD")
+    user_id = route_user(args[-1])
+    async with async_session_scope(user_id, readonly) as session:
+        await bind_principal(session, g.get("principal"), user_id)
+        return await session.run_sync(fn, *args)
+
+
+# サービス関数を実行して JSON レスポンスに変換
+async def run(fn, *args):
+    body_, *rest = await execute(fn, *args)
+    return (jsonify(body_), *rest)
+
+
+# api.utils.coalesced の非同期版(まとめた要求はリーダーのタスクで実行する)
+async def coalesced(fn, name: str, params: dict, *fields: str):
+    if not coalesce.eligible(params):
+        return await run(fn, params)
+    error = coalesce.rejected(params, *fields)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    principal = g.get("principal")
+
+    async def apply() -> tuple:
+        user_id = route_user(params)
+        async with async_session_scope(user_id) as session:
+            await bind_principal(session, principal, user_id)
+            return await session.run_sync(fn, params)
+
+    key = coalesce.key(name, params, *fields)
+    outcome, seq, result = await coalesce.reorders.submit_async(
+        key, params["seq"], apply
+    )
+    body_, *rest = coalesce.finish(name, outcome, seq, result)
+    return (jsonify(body_), *rest)
+
+
+# api.utils.encoded_response の非同期版
+async def encoded_response(result: tuple):
+    data, *rest = result
+    data, headers = encoding.content(data, request.accept_encodings)
+    response = await make_response(data, *rest)
+    response.headers.update(headers)
+    response.mimetype = "application/json"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# 結果をキャッシュする(レプリカの遅れで古いかもしれない結果は保存せず False)
+def _store(scope: str, etag: str, result: tuple) -> bool:
+    if not routing.cacheable(scope):
+        return False
+    cache.store(etag, result)
+    return True
+
+
+# api.utils.cached の非同期版(一覧を ETag 付きでキャッシュから返す)
+async def cached(scope, fn, *args):
+    if scope is None:
+        return await run(fn, *args)
+    # キャッシュ(redis)はイベントループを止めないようスレッドで読み書きする
+    etag, result = await asyncio.to_thread(cache.lookup, scope, request.query_string)
+    fresh = True
+    if request.if_none_match.contains(etag):
+        response = await make_response("", 304)
+    else:
+        if result is None:
+            result = encoding.encode(await execute(fn, *args))
+            fresh = await asyncio.to_thread(_store, scope, etag, result)
+        response = await encoded_response(result)
+        if response.status_code != 200 or not fresh:
+            return response
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# シャード間で移動中のユーザーの更新は、移動が終わるまで 503 で待ってもらう
+@api_bp.app_errorhandler(sharding.Moving)
+async def moving(e):
+    body_ = {"error": sharding.MOVING_MESSAGE}
+    return jsonify(body_), 503, {"Retry-After": str(sharding.MOVING_RETRY_AFTER)}
+
+
+# ----- カテゴリー -----
+@api_bp.get("/categories")
+@authenticated
+async def list_categories():
+    args = request_args()
+    user_id = args.get("user_id", type=int)
+    scope = None
+    if user_id is not None:
+        scope = (
+            cache.counts_scope(user_id)
+            if category_service.with_counts(args)
+            else cache.categories_scope(user_id)
+        )
+    return await cached(scope, category_service.list_categories, args)
+
+
+@api_bp.post("/category")
+@authenticated
+async def add_category():
+    return await run(category_service.add_category, await body())
+
+
+@api_bp.route("/category/<int:category_id>", methods=["PUT", "PATCH"])
+@authenticated
+async def rename_category(category_id: int):
+    return await run(category_service.rename_category, category_id, await body())
+
+
+@api_bp.patch("/categories/reorder")
+@authenticated
+async def reorder_categories():
+    return await coalesced(
+        category_service.reorder_categories, "categories.reorder", await body()
+    )
+
+
+@api_bp.delete("/category/<int:category_id>")
+@authenticated
+async def delete_category(category_id: int):
+    return await run(category_service.delete_category, category_id, request_args())
+
+
+@api_bp.get("/category/<int:category_id>/deletion")
+@authenticated
+async def deletion_status(category_id: int):
+    return await run(category_service.deletion_status, category_id, request_args())
+
+
+@api_bp.patch("/category/<int:category_id>/move")
+@authenticated
+async def move_category(category_id: int):
+    return await run(category_service.move_category, category_id, await body())
+
+
+# ----- タスク -----
+@api_bp.get("/tasks")
+@authenticated
+async def list_tasks():
+    args = request_args()
+    user_id = args.get("user_id", type=int)
+    category_id = args.get("category_id", type=int)
+    scope = None
+    if user_id is not None and category_id is not None:
+        scope = cache.tasks_scope(user_id, category_id)
+    return await cached(scope, task_service.list_tasks, args)
+
+
+@api_bp.get("/tasks/search")
+@authenticated
+async def search_tasks():
+    args = request_args()
+    user_id = args.get("user_id", type=int)
+    scope = None if user_id is None else cache.board_scope(user_id)
+    return await cached(scope, task_service.search_tasks, args)
+
+
+@api_bp.post("/task")
+@authenticated
+async def add_task():
+    return await run(task_service.add_task, await body())
+
+
+@api_bp.route("/task/<int:task_id>", methods=["PUT", "PATCH"])
+@authenticated
+async def edit_task(task_id: int):
+    return await run(task_service.edit_task, task_id, await body())
+
+
+@api_bp.delete("/task/<int:task_id>")
+@authenticated
+async def delete_task(task_id: int):
+    return await run(task_service.delete_task, task_id, request_args())
+
+
+@api_bp.patch("/tasks/reorder")
+@authenticated
+async def reorder_tasks():
+    return await coalesced(
+        task_service.reorder_tasks, "tasks.reorder", await body(), "category_id"
+    )
+
+
+@api_bp.post("/task/<int:task_id>/restore")
+@authenticated
+async def restore_task(task_id: int):
+    return await run(task_service.restore_task, task_id, await body())
+
+
+@api_bp.patch("/task/<int:task_id>/move")
+@authenticated
+async def move_task(task_id: int):
+    return await run(task_service.move_task, task_id, await body())
+
+
+@api_bp.post("/tasks/batch")
+@authenticated
+async def batch_tasks():
+    return await run(task_service.batch_tasks, await body())
+
+
+# ----- ボード -----
+@api_bp.get("/board")
+@authenticated
+async def get_board():
+    args = request_args()
+    user_id = args.get("user_id", type=int)
+    scope = None if user_id is None else cache.board_scope(user_id)
+    return await cached(scope, board_service.get_board, args)
+
+
+# ----- エクスポート / インポート -----
+@api_bp.get("/export")
+@authenticated
+async def export():
+    user_id, err = transfer_service.parse_export(request_args())
+    if err:
+        return jsonify(err[0]), err[1]
+
+    async def generate():
+        async with async_session_scope(user_id, readonly=True) as session:
+            for kind, stmt in transfer_service.export_statements(user_id):
+                result = await session.stream(stmt)
+                async for partition in result.partitions():
+                    yield "".join(transfer_service.to_line(kind, r) for r in partition)
+
+    return generate(), 200, {"Content-Type": "application/x-ndjson"}
+
+
+# 本文は一時ファイル(一定サイズまではメモリ)に受けてから 1 行ずつ取り込む
+@api_bp.post("/import")
+@authenticated
+async def import_():
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        async for chunk in request.body:
+            spool.write(chunk)
+        spool.seek(0)
+        return await run(transfer_service.import_lines, spool, request_args())
+
+
+# ----- 変更通知(SSE) -----
+@api_bp.get("/events")
+@authenticated
+async def stream_events():
+    user_id = request_args().get("user_id", type=int)
+    if user_id is None:
+        return error("user_id が必要です", 400)
+    events.ensure_async_listener(async_engine_for(routing.listen_target(user_id)))
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    response = await make_response(
+        events.stream_async(user_id, last_event_id),
+        200,
+        {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+    response.timeout = None  # RESPONSE_TIMEOUT で切らない
+    return response
+
+
+# ----- 認証(ハッシュ計算はプロセスプールで実行してイベントループを止めない) -----
+@api_bp.post("/auth/register")
+async def register():
+    parsed, err = auth_service.parse_registration(await body())
+    if err:
+        return jsonify(err[0]), err[1]
+    name, email, password = parsed
+    try:
+        password_hash = await hashing.hash_password_async(password)
+    except hashing.Busy:
+        return error(BUSY_MESSAGE, 503)
+    async with async_session_scope() as session:
+        result = await session.run_sync(
+            auth_service.create_user, name, email, password_hash
+        )
+        # シャーディング時はコミット前にユーザーのシャードへ写す(失敗すれば登録も取り消す)
+        if result[1] == 201 and routing.is_remote(result[0]["user_id"]):
+            async with async_session_scope(result[0]["user_id"]) as shard:
+                await shard.run_sync(auth_service.copy_user, result[0])
+    body_, *rest = result
+    return (jsonify(body_), *rest)
+
+
+@api_bp.post("/auth/login")
+async def login():
+    parsed, err = auth_service.parse_login(await body())
+    if err:
+        return jsonify(err[0]), err[1]
+    email, password = parsed
+    retry_after = max(
+        login_limiter.hit(f"ip:{request.remote_addr}"),
+        login_limiter.blocked(f"email:{email}"),
+    )
+    if retry_after:
+        message = "ログイン試行が多すぎます。しばらくしてから再度お試しください"
+        return jsonify({"error": message}), 429, {"Retry-After": str(retry_after)}
+    async with async_session_scope() as session:
+        found = await session.run_sync(auth_service.find_login_user, email)
+    try:
+        verified = found is not None and await hashing.verify_password_async(
+            found[1], password
+        )
+    except hashing.Busy:
+        return error(BUSY_MESSAGE, 503)
+    if not verified:
+        login_limiter.hit(f"email:{email}")
+        return error("メールアドレスまたはパスワードが違います", 401)
+    if hashing.needs_rehash(found[1]):
+        try:
+            new_hash = await hashing.hash_password_async(password)
+        except hashing.Busy:
+            pass
+        else:
+            async with async_session_scope() as session:
+                await session.run_sync(
+                    auth_service.update_password_hash, found[0]["user_id"], new_hash
+                )
+    user_id = found[0]["user_id"]
+    async with async_session_scope(user_id, readonly=True) as session:
+        scope = cache.categories_scope(user_id)
+        version = await asyncio.to_thread(cache.version, scope)
+        tokens.bind_categories_version(session.sync_session, user_id, version)
+        token = await session.run_sync(auth_service.issue_token, found[0])
+    return jsonify({**found[0], "token": token}), 200
+
+
+@api_bp.get("/auth/me")
+@authenticated
+async def me():
+    return await run(auth_service.me, request_args())
+
+
+@api_bp.post("/auth/refresh")
+@authenticated
+async def refresh():
+    return await run(auth_service.refresh_token, request_args())
+
+
+@api_bp.post("/auth/logout")
+async def logout():
+    return jsonify({"ok": True}), 200
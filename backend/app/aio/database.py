@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from config import Config
+import cache
+import routing
+
+
+# 同期用の URL を非同期ドライバの URL に変換
+def async_url(url: str) -> str:
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://") :]
+    if url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url[len("postgresql+psycopg2://") :]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://") :]
+    return url
+
+
+# DB接続設定(プール設定は同期スタックと同じ Config の値を使う)
+def build_async_engine(url: str = Config.DATABASE_URL) -> AsyncEngine:
+    url = async_url(url)
+    options = {"echo": Config.SQL_ECHO}
+    connect_args = {}
+    if url.startswith("postgresql"):
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_recycle=Config.DB_POOL_RECYCLE,
+            pool_pre_ping=Config.DB_POOL_PRE_PING,
+        )
+        connect_args["timeout"] = Config.DB_CONNECT_TIMEOUT
+        if Config.DB_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["server_settings"] = {
+                "statement_timeout": str(Config.DB_STATEMENT_TIMEOUT_MS)
+            }
+    return create_async_engine(url, connect_args=connect_args, **options)
+
+
+_async_engines: dict = {}
+_engine_lock = threading.Lock()
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+
+
+# URL ごとのエンジン(同期スタックの engine_for と同じく、最初に使うときに作成する)
+def async_engine_for(url: str) -> AsyncEngine:
+    engine = _async_engines.get(url)
+    if engine is None:
+        with _engine_lock:
+            engine = _async_engines.get(url)
+            if engine is None:
+                engine = _async_engines[url] = build_async_engine(url)
+    return engine
+
+
+# プライマリ(DATABASE_URL)のエンジン
+def get_async_engine() -> AsyncEngine:
+    return async_engine_for(Config.DATABASE_URL)
+
+
+# 終了時に接続プールを閉じる(作成したものだけ)
+async def dispose_async_engine() -> None:
+    for engine in list(_async_engines.values()):
+        await engine.dispose()
+
+
+# コミット後のキャッシュ・接続先の記録の更新(redis に書くためスレッドで実行する)
+def _after_commit(scopes: set, written: Optional[int]) -> None:
+    cache.bump_all(scopes)
+    if written is not None:
+        routing.mark_written(written)
+
+
+# session_scope の非同期版(接続先の選び方も同じ)。接続先の選択(レプリカへの
+# 読み取りは redis の記録を読む)とコミット後の更新は、イベントループを止めないよう
+# スレッドで行う
+@asynccontextmanager
+async def async_session_scope(
+    user_id: Optional[int] = None, readonly: bool = False
+) -> AsyncGenerator[AsyncSession, None]:
+    url = await asyncio.to_thread(routing.target, user_id, readonly)
+    session = AsyncSessionLocal(bind=async_engine_for(url))
+    try:
+        yield session
+        # コミット時の bump(cache._bump_after_commit)を後でまとめて行う
+        scopes = cache.take_touched(session.sync_session)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+    written = user_id if not readonly else None
+    if scopes or written is not None:
+        await asyncio.to_thread(_after_commit, scopes, written)
@@ -1,7 +1,11 @@
-from flask import Blueprint
+from flask import Blueprint, jsonify
+import sharding
 from .categories import categories_bp
 from .tasks import tasks_bp
 from .auth import auth_bp
+from .board import board_bp
+from .transfer import transfer_bp
+from .events import events_bp
 
 # 共通の Blueprint を作成
 api_bp = Blueprint("api", __name__)
@@ -9,5 +13,16 @@ api_bp = Blueprint("api", __name__)
 api_bp.register_blueprint(categories_bp)
 api_bp.register_blueprint(tasks_bp)
 api_bp.register_blueprint(auth_bp)
+api_bp.register_blueprint(board_bp)
+api_bp.register_blueprint(transfer_bp)
+api_bp.register_blueprint(events_bp)
+
+
+# シャード間で移動中のユーザーの更新は、移動が終わるまで 503 で待ってもらう
+@api_bp.app_errorhandler(sharding.Moving)
+def moving(e):
+    body = {"error": sharding.MOVING_MESSAGE}
+    return jsonify(body), 503, {"Retry-After": str(sharding.MOVING_RETRY_AFTER)}
+
 
 __all__ = ["api_bp"]
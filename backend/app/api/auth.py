@@ -1,76 +1,93 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.exc import IntegrityError
+import hashing
+import routing
 from database import session_scope
-from models import User
-
+from ratelimit import login_limiter
+from services import auth as service
+from .utils import authenticated, call, error, respond
 
 auth_bp = Blueprint("auth", __name__)
 
 
-# ユーザー情報を辞書に変換
-def _user_to_dict(user: User) -> dict:
-    return {"user_id": user.user_id, "name": user.name, "email": user.email}
-
-
 # ユーザー登録
 @auth_bp.post("/auth/register")
 def register():
     data = request.get_json() or {}
-    name = (data.get("name") or "").strip()
-    email = (data.get("email") or "").strip().lower()
-    password = data.get("password") or ""
-    if not name or not email or not password:
-        return jsonify({"error": "name, email, password が必要です"}), 400
-    if len(password) < 6:
-        return jsonify({"error": "password は6文字以上にしてください"}), 400
+    parsed, err = service.parse_registration(data)
+    if err:
+        return respond(err)
+    name, email, password = parsed
+    try:
+        password_hash = hashing.hash_password(password)
+    except hashing.Busy:
+        return error("混み合っています。しばらくしてから再度お試しください", 503)
     with session_scope() as session:
-        try:
-            user = User(
-                name=name,
-                email=email,
-                password_hash=generate_password_hash(password),
-            )
-            session.add(user)
-            session.flush()  # to get user_id
-            return jsonify(_user_to_dict(user)), 201
-        except IntegrityError:
-            # email unique violation
-            session.rollback()
-            return jsonify({"error": "このメールアドレスは既に登録されています"}), 409
+        result = service.create_user(session, name, email, password_hash)
+        # シャーディング時はコミット前にユーザーのシャードへ写す(失敗すれば登録も取り消す)
+        if result[1] == 201 and routing.is_remote(result[0]["user_id"]):
+            with session_scope(result[0]["user_id"]) as shard:
+                service.copy_user(shard, result[0])
+        return respond(result)
 
 
 # ログイン
 @auth_bp.post("/auth/login")
 def login():
     data = request.get_json() or {}
-    email = (data.get("email") or "").strip().lower()
-    password = data.get("password") or ""
-    if not email or not password:
-        return jsonify({"error": "email と password が必要です"}), 400
+    parsed, err = service.parse_login(data)
+    if err:
+        return respond(err)
+    email, password = parsed
+    # ハッシュ照合の前に、IP ごとの試行回数とメールアドレスごとの失敗回数で弾く
+    retry_after = max(
+        login_limiter.hit(f"ip:{request.remote_addr}"),
+        login_limiter.blocked(f"email:{email}"),
+    )
+    if retry_after:
+        body = {"error": "ログイン試行が多すぎます。しばらくしてから再度お試しください"}
+        return jsonify(body), 429, {"Retry-After": str(retry_after)}
     with session_scope() as session:
-        user = session.query(User).filter_by(email=email).first()
-        if not user or not check_password_hash(user.password_hash, password):
-            return jsonify({"error": "メールアドレスまたはパスワードが違います"}), 401
-        return jsonify(_user_to_dict(user)), 200
+        found = service.find_login_user(session, email)
+    try:
+        verified = found is not None and hashing.verify_password(found[1], password)
+    except hashing.Busy:
+        return error("混み合っています。しばらくしてから再度お試しください", 503)
+    if not verified:
+        login_limiter.hit(f"email:{email}")
+        return error("メールアドレスまたはパスワードが違います", 401)
+    # ハッシュ方式・パラメータが変わっていれば、平文が手元にある今のうちに再ハッシュ
+    # (混み合っていれば次回のログインに回し、ログインは続ける)
+    if hashing.needs_rehash(found[1]):
+        try:
+            new_hash = hashing.hash_password(password)
+        except hashing.Busy:
+            pass
+        else:
+            with session_scope() as session:
+                service.update_password_hash(session, found[0]["user_id"], new_hash)
+    # パスワードはディレクトリで照合し、トークンに載せるカテゴリーはユーザーのシャードから読む
+    with session_scope(found[0]["user_id"], readonly=True) as session:
+        token = service.issue_token(session, found[0])
+    return jsonify({**found[0], "token": token}), 200
 
 
 # ユーザー情報取得
 @auth_bp.get("/auth/me")
+@authenticated
 def me():
-    """簡易: クエリの user_id でユーザー情報を返す(フロントのローカル保存と併用)。"""
-    user_id = request.args.get("user_id", type=int)
-    if not user_id:
-        return jsonify({"error": "user_id が必要です"}), 400
-    with session_scope() as session:
-        user = session.query(User).filter_by(user_id=user_id).first()
-        if not user:
-            return jsonify({"error": "ユーザーが見つかりません"}), 404
-        return jsonify(_user_to_dict(user)), 200
+    """トークンがあればその内容を、なければクエリの user_id でユーザー情報を返す。"""
+    return call(service.me)
+
+
+# トークンの再発行
+@auth_bp.post("/auth/refresh")
+@authenticated
+def refresh():
+    return call(service.refresh_token)
 
 
 # ログアウト
 @auth_bp.post("/auth/logout")
 def logout():
-    # セッションやトークンを使っていないため、フロント側のローカル削除を期待
+    # トークンはサーバーに状態を持たないため、フロント側のローカル削除を期待
     return jsonify({"ok": True}), 200
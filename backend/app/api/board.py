@@ -0,0 +1,16 @@
+from flask import Blueprint
+import cache
+from services import board as service
+from .utils import authenticated, cached, request_args, run
+
+# ボード関連の Blueprint(処理本体は services.board)
+board_bp = Blueprint("board", __name__)
+
+
+# カテゴリー・未アーカイブのタスク・ステータス別件数をまとめて取得
+@board_bp.get("/board")
+@authenticated
+def get_board():
+    user_id = request_args().get("user_id", type=int)
+    scope = None if user_id is None else cache.board_scope(user_id)
+    return cached(scope, lambda: run(service.get_board))
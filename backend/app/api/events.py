@@ -0,0 +1,35 @@
+from flask import Blueprint, Response, request
+import events
+import routing
+from database import engine_for
+from .utils import authenticated, error, request_args
+
+# 変更通知(SSE)の Blueprint
+events_bp = Blueprint("events", __name__)
+
+
+# ボードの変更差分を Server-Sent Events で配信(再接続時は Last-Event-ID 以降を再送)
+@events_bp.get("/events")
+@authenticated
+def stream():
+    user_id = request_args().get("user_id", type=int)
+    if user_id is None:
+        return error("user_id が必要です", 400)
+    # 通知はユーザーのシャード(シャーディングしていなければプライマリ)から届く
+    events.ensure_listener(engine_for(routing.listen_target(user_id)))
+    # 購読 1 つがスレッドを 1 つ占有するため、上限を超えたら断る
+    if not events.sync_streams.acquire(blocking=False):
+        return error(
+            "変更通知の接続数が上限です。非同期スタック(asgi:app)を使ってください",
+            503,
+        )
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    response = Response(
+        events.stream(user_id, last_event_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(events.sync_streams.release)
+    return response
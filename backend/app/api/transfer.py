@@ -0,0 +1,34 @@
+import io
+from flask import Blueprint, Response, request, stream_with_context
+from database import session_scope
+from services import transfer as service
+from .utils import authenticated, call, request_args, respond
+
+# エクスポート / インポートの Blueprint(処理本体は services.transfer)
+transfer_bp = Blueprint("transfer", __name__)
+
+NDJSON = "application/x-ndjson"
+
+
+# カテゴリー・タスクを NDJSON でストリーミング出力
+@transfer_bp.get("/export")
+@authenticated
+def export():
+    user_id, err = service.parse_export(request_args())
+    if err:
+        return respond(err)
+
+    def generate():
+        with session_scope(user_id, readonly=True) as session:
+            yield from service.export_lines(session, user_id)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+# NDJSON を取り込む(本文は 1 行ずつ読み、全体をメモリに載せない)
+@transfer_bp.post("/import")
+@authenticated
+def import_():
+    # request.stream は行単位で読むと 1 バイトずつの読み込みになるためバッファする
+    lines = io.BufferedReader(request.stream, buffer_size=64 * 1024)
+    return call(service.import_lines, lines)
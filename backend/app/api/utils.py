@@ -1,6 +1,150 @@
-from flask import jsonify
+from functools import wraps
+from typing import Callable, Optional
+from flask import g, jsonify, make_response, request
+import cache
+import coalesce
+import encoding
+import routing
+import tokens
+from database import session_scope
+from services.utils import parse_if_match
 
 
 # 共通のエラーレスポンスを返すユーティリティ関数
 def error(message: str, status: int):
     return jsonify({"error": message}), status
+
+
+# サービス関数の結果 (body, status[, headers]) を JSON レスポンスに変換
+def respond(result: tuple):
+    body, *rest = result
+    return (jsonify(body), *rest)
+
+
+# アクセストークン(Authorization: Bearer)を検証し、利用者を g.principal に保存する。
+# 検証は署名のみで DB は読まない
+def authenticated(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        data = request.get_json(silent=True) or {}
+        claimed = request.args.get("user_id") or data.get("user_id")
+        claims, err = tokens.resolve(request.headers.get("Authorization"), claimed)
+        if err:
+            return respond(err)
+        g.principal = claims
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+# クエリパラメータ(トークンがあれば user_id をトークンの値にする)。
+# If-Match があれば version に入れる(サービス関数はバージョンが一致する場合だけ更新)
+def request_args():
+    claims = g.get("principal")
+    version = parse_if_match(request.headers.get("If-Match"))
+    if claims is None and version is None:
+        return request.args
+    args = request.args.copy()
+    if claims is not None:
+        args["user_id"] = str(claims["uid"])
+    if version is not None:
+        args["version"] = str(version)
+    return args
+
+
+# リクエストボディ(トークンがあれば user_id をトークンの値にする。If-Match は version に)
+def request_body() -> dict:
+    data = request.get_json() or {}
+    claims = g.get("principal")
+    if claims is not None:
+        data["user_id"] = claims["uid"]
+    version = parse_if_match(request.headers.get("If-Match"))
+    if version is not None:
+        data["version"] = version
+    return data
+
+
+# パラメータの user_id(接続先の選択用。数値でなければ None)
+def route_user(params) -> Optional[int]:
+    try:
+        return int(params.get("user_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+# 読み取り専用のリクエストか(レプリカで実行してよいか)
+def readonly() -> bool:
+    return request.method in ("GET", "HEAD")
+
+
+# サービス関数をセッション内で実行し、結果 (body, status[, headers]) を返す。
+# セッションは user_id のシャード(GET ならレプリカ)につなぐ
+def run(fn: Callable, *args, body: bool = False) -> tuple:
+    params = request_body() if body else request_args()
+    with session_scope(route_user(params), readonly()) as session:
+        tokens.bind(session, g.get("principal"))
+        return fn(session, *args, params)
+
+
+# サービス関数を実行して JSON レスポンスを返す
+def call(fn: Callable, *args, body: bool = False):
+    return respond(run(fn, *args, body=body))
+
+
+# seq 付きの並び替えを coalesce.reorders でまとめて実行する(seq がなければ call と同じ)。
+# name はメトリクスの名前、fields はキーに含めるパラメータ。
+# まとめた要求はリーダーのスレッドで実行するため、リクエストの値はここで読んでおく
+def coalesced(fn: Callable, name: str, *fields: str):
+    params = request_body()
+    if not coalesce.eligible(params):
+        return call(fn, body=True)
+    error = coalesce.rejected(params, *fields)
+    if error is not None:
+        return respond(error)
+    principal = g.get("principal")
+
+    def apply() -> tuple:
+        with session_scope(route_user(params)) as session:
+            tokens.bind(session, principal)
+            return fn(session, params)
+
+    key = coalesce.key(name, params, *fields)
+    outcome, seq, result = coalesce.reorders.submit(key, params["seq"], apply)
+    return respond(coalesce.finish(name, outcome, seq, result))
+
+
+# JSON 化済みの結果 (JSON のバイト列, status[, headers]) のレスポンス(圧縮する)
+def encoded_response(result: tuple):
+    data, *rest = result
+    data, headers = encoding.content(data, request.accept_encodings)
+    response = make_response(data, *rest)
+    response.headers.update(headers)
+    response.mimetype = "application/json"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# 一覧をキャッシュ経由で返す(ETag 付き)。If-None-Match が一致すれば DB を読まず 304。
+# キャッシュには JSON 化した本文を置く。scope が None(必須パラメータ不足など)の
+# 場合はキャッシュしない
+def cached(scope: Optional[str], compute: Callable[[], tuple]):
+    if scope is None:
+        return respond(compute())
+    etag, result = cache.lookup(scope, request.query_string)
+    fresh = True
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        if result is None:
+            result = encoding.encode(compute())
+            # レプリカの遅れで古いかもしれない結果は保存せず、ETag も付けない
+            fresh = routing.cacheable(scope)
+            if fresh:
+                cache.store(etag, result)
+        response = encoded_response(result)
+        if response.status_code != 200 or not fresh:
+            return response
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
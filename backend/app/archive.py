@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.orm import Session
+import cache
+import events
+import jobs
+import stats
+from config import Config
+from models import ArchivedTask, Task
+
+# アーカイブ済みタスクの置き場所(archived_tasks)。
+#
+# status を archived にしたタスクは tasks から archived_tasks へ task_id ごと移し、
+# archived 以外に戻したら tasks へ戻す。tasks には未アーカイブの行だけが残るため、
+# 一覧やボードはステータスで絞り込まずに idx_tasks_list だけで読める。
+# archived_tasks は PostgreSQL では user_id のハッシュで分割し、ユーザーの
+# アーカイブ済み一覧は 1 パーティションだけを読む。保存期間
+# (ARCHIVE_RETENTION_DAYS)を過ぎた行はジョブ archive.purge(worker.py が
+# ARCHIVE_PURGE_INTERVAL_SECONDS ごとに実行)が消す。
+
+# 移動時にそのままコピーする列
+MOVED_COLUMNS = [
+    "task_id",
+    "title",
+    "content",
+    "status",
+    "sort_order",
+    "user_id",
+    "category_id",
+    "version",
+]
+
+
+def _move(session: Session, source, target, user_id, task_ids, criterion) -> int:
+    where = [source.user_id == user_id, criterion]
+    if task_ids is not None:
+        where.append(source.task_id.in_(list(task_ids)))
+    columns = [getattr(source, name) for name in MOVED_COLUMNS]
+    session.execute(
+        insert(target).from_select(MOVED_COLUMNS, select(*columns).where(*where))
+    )
+    return session.execute(
+        delete(source).where(*where).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# status が archived の行を tasks から archived_tasks へ移す(task_ids 省略時はユーザーの全行)
+def archive_rows(
+    session: Session, user_id, task_ids: Optional[Iterable[int]] = None
+) -> int:
+    return _move(
+        session, Task, ArchivedTask, user_id, task_ids, Task.status == "archived"
+    )
+
+
+# status が archived 以外になった行を archived_tasks から tasks へ戻す
+def restore_rows(
+    session: Session, user_id, task_ids: Optional[Iterable[int]] = None
+) -> int:
+    return _move(
+        session,
+        ArchivedTask,
+        Task,
+        user_id,
+        task_ids,
+        ArchivedTask.status != "archived",
+    )
+
+
+# archived_at が before より前の行を古い順に最大 limit 件削除し、件数を返す
+def purge_expired(session: Session, before: datetime, limit: int) -> int:
+    expired = (
+        select(ArchivedTask.user_id, ArchivedTask.task_id)
+        .where(ArchivedTask.archived_at < before)
+        .order_by(ArchivedTask.archived_at.asc())
+        .limit(limit)
+    )
+    rows = session.execute(
+        delete(ArchivedTask)
+        .where(tuple_(ArchivedTask.user_id, ArchivedTask.task_id).in_(expired))
+        .returning(ArchivedTask.user_id, ArchivedTask.task_id, ArchivedTask.category_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    for row in rows:
+        stats.count(session, row.category_id, "archived", -1)
+        cache.touch_tasks(session, row.user_id, row.category_id)
+        events.record(
+            session,
+            row.user_id,
+            "task",
+            "delete",
+            row.task_id,
+            category_id=row.category_id,
+        )
+    return len(rows)
+
+
+# 保存期間を過ぎた行をすべて消す(ARCHIVE_PURGE_BATCH 件ごとに別トランザクション)
+def purge(retention_days: int = Config.ARCHIVE_RETENTION_DAYS) -> int:
+    # サービス層(非同期スタックからも読み込まれる)では同期エンジンを作らない
+    from database import session_scope
+
+    if retention_days <= 0:
+        return 0
+    before = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        with session_scope() as session:
+            purged = purge_expired(session, before, Config.ARCHIVE_PURGE_BATCH)
+        total += purged
+        if purged < Config.ARCHIVE_PURGE_BATCH:
+            return total
+
+
+# ジョブ archive.purge
+@jobs.handler("archive.purge")
+def purge_job(payload: dict) -> dict:
+    return {
+        "purged": purge(payload.get("retention_days", Config.ARCHIVE_RETENTION_DAYS))
+    }
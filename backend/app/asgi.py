@@ -0,0 +1,26 @@
+# 非同期スタック(Quart)のエントリーポイント
+# hypercorn --workers 4 --bind 0.0.0.0:5000 asgi:app
+from quart import Quart
+from config import Config
+import health
+import metrics
+from aio.api import api_bp
+from aio.database import dispose_async_engine
+
+app = Quart(__name__)
+app.config.from_object(Config)
+app.register_blueprint(api_bp, url_prefix="/api")
+metrics.init_async_app(app)
+# 死活確認(/healthz)と受け付け可否(/readyz)
+health.init_async_app(app)
+
+
+@app.route("/")
+async def main():
+    return "Hello World"
+
+
+# 終了時に接続プールを閉じる
+@app.after_serving
+async def dispose_engine():
+    await dispose_async_engine()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import Config
+
+try:  # Redis バックエンドを使う場合のみ必要
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+# 一覧レスポンス(GET /categories, GET /tasks)のキャッシュ。
+# ユーザー(・カテゴリー)ごとのバージョンを持ち、更新系はコミット後に
+# バージョンを変える。キャッシュキーと ETag はバージョンを含むため、
+# 古いエントリは参照されなくなり、LRU / TTL で自然に消える。
+# LRU はプロセス内のため、複数ワーカーで動かす場合は Redis を使う(gunicorn は
+# 複数ワーカーでの LRU を起動時に拒否する)。
+
+_TOUCHED = "cache_touched_scopes"
+
+
+# プロセス内 LRU(スレッドセーフ)
+class LRUBackend:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        # LRU では TTL を使わず、件数上限で古いものから捨てる
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+# Redis 互換クライアント(get / set(ex=)を持つもの。テストではフェイクでも可)
+class RedisBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self.client.set(key, value, ex=ttl)
+
+
+# キャッシュなし
+class NullBackend:
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        pass
+
+
+# Config.CACHE_BACKEND からバックエンドを作成
+def build_backend():
+    if Config.CACHE_BACKEND == "redis":
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis には redis パッケージが必要です")
+        if not Config.CACHE_URL:
+            raise RuntimeError("CACHE_BACKEND=redis には CACHE_URL が必要です")
+        return RedisBackend(redis.Redis.from_url(Config.CACHE_URL))
+    if Config.CACHE_BACKEND == "none":
+        return NullBackend()
+    return LRUBackend(Config.CACHE_MAX_ENTRIES)
+
+
+backend = build_backend()
+
+
+# キャッシュのバックエンドがあるか(none でないか)
+def enabled() -> bool:
+    return not isinstance(backend, NullBackend)
+
+
+# キャッシュの対象範囲(バージョンの単位)
+def categories_scope(user_id: int) -> str:
+    return f"categories:{user_id}"
+
+
+def tasks_scope(user_id: int, category_id: int) -> str:
+    return f"tasks:{user_id}:{category_id}"
+
+
+# ボード(GET /board)はユーザーのカテゴリー・タスクのどれが変わっても無効にする
+def board_scope(user_id: int) -> str:
+    return f"board:{user_id}"
+
+
+# 件数付きのカテゴリー一覧(GET /categories?with_counts=1)もボードと同じく無効にする
+def counts_scope(user_id: int) -> str:
+    return f"counts:{user_id}"
+
+
+# 新しいバージョン(作成時刻(ミリ秒、16 進)-ランダムな値)
+def _new_version() -> str:
+    return f"{int(time.time() * 1000):x}-{uuid.uuid4().hex[:8]}"
+
+
+# 範囲の現在のバージョン(未登録なら新しい値で初期化)
+def version(scope: str) -> str:
+    key = f"v:{scope}"
+    value = backend.get(key)
+    if value is None:
+        value = _new_version()
+        backend.set(key, value)
+    return value
+
+
+# 範囲のバージョンを変えて既存のキャッシュと ETag を無効にする
+def bump(scope: str) -> None:
+    backend.set(f"v:{scope}", _new_version())
+
+
+# 範囲のバージョンが seconds 秒以内に変わったか(作成時刻のない古い形式は False)
+def bumped_within(scope: str, seconds: float) -> bool:
+    stamp, sep, _ = version(scope).partition("-")
+    if not sep:
+        return False
+    try:
+        return time.time() - int(stamp, 16) / 1000 < seconds
+    except ValueError:
+        return False
+
+
+# ETag と、キャッシュ済みの結果 (JSON のバイト列, status, headers) を返す
+def lookup(scope: str, query: bytes) -> tuple:
+    digest = hashlib.sha1(query).hexdigest()[:16]
+    etag = f"{scope}:{version(scope)}:{digest}"
+    cached = backend.get(f"resp:{etag}")
+    if cached is None:
+        return etag, None
+    # 1 行目が status と headers、2 行目以降が本文(JSON のまま。読み込み直さない)
+    meta, _, body = cached.partition("\n")
+    entry = json.loads(meta)
+    return etag, (body.encode(), entry["status"], entry["headers"])
+
+
+# 成功した一覧の結果 (JSON のバイト列, status[, headers]) をキャッシュする
+def store(etag: str, result: tuple) -> None:
+    body, status, *rest = result
+    if status != 200:
+        return
+    meta = json.dumps({"status": status, "headers": rest[0] if rest else {}})
+    backend.set(f"resp:{etag}", f"{meta}\n{body.decode()}", Config.CACHE_TTL)
+
+
+# 更新した範囲をセッションに記録する(コミット後にバージョンを変える)
+def touch(session: Session, *scopes: str) -> None:
+    session.info.setdefault(_TOUCHED, set()).update(scopes)
+
+
+def touch_categories(session: Session, user_id: int) -> None:
+    touch(
+        session,
+        categories_scope(user_id),
+        board_scope(user_id),
+        counts_scope(user_id),
+    )
+
+
+def touch_tasks(session: Session, user_id: int, *category_ids: int) -> None:
+    touch(session, board_scope(user_id), counts_scope(user_id))
+    touch(session, *(tasks_scope(user_id, cid) for cid in category_ids))
+
+
+# 記録した範囲を取り出す(非同期スタックはコミット後に bump_all をスレッドで呼ぶ)
+def take_touched(session: Session) -> set:
+    return session.info.pop(_TOUCHED, set())
+
+
+def bump_all(scopes) -> None:
+    for scope in scopes:
+        bump(scope)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    bump_all(take_touched(session))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_TOUCHED, None)
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Optional
+import metrics
+from config import Config
+from services.utils import parse_reorder, stale_reorder
+
+# 連続する並び替え(PATCH /tasks/reorder, /categories/reorder)のまとめ書き。
+#
+# ドラッグ & ドロップのたびに送られる並び替えは、リスト全体の UPDATE が同じ行を
+# 取り合う。seq(と client)付きの要求は、同じキー(ユーザー・リスト・クライアント)に
+# ついて最初の要求から REORDER_COALESCE_MS の間に届いたものをまとめ、最後の
+# (seq が最大の)並びだけを 1 回書き込む。まとめられた要求はその書き込みの結果を返す。
+# 古い seq はここ(プロセス内)と DB(services.utils.claim_reorder_seq。
+# プロセスをまたぐ場合)で捨てる。まとめるのはプロセス内だけ。
+
+APPLIED = "applied"  # 自分の並びを書き込んだ
+COALESCED = "coalesced"  # 後の要求にまとめられた(書き込みなし)
+STALE = "stale"  # より新しい seq が受け付け済み
+
+
+class _Slot:
+    __slots__ = ("seq", "fn", "done", "result", "error")
+
+    def __init__(self, seq: int, fn: Callable, done):
+        self.seq = seq
+        self.fn = fn
+        self.done = done
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+# キーごとに最初の要求(リーダー)が window 秒待ち、その間に届いた要求のうち
+# seq が最大のものの fn だけを実行する。同期(スレッド)版と非同期版がある
+class Coalescer:
+    def __init__(self, window: float):
+        self.window = window
+        self._slots: dict = {}
+        self._lock = threading.Lock()
+
+    # 待っている要求に加わる。(slot, リーダーか)。古い seq なら slot は None
+    def _join(self, key, seq: int, fn: Callable, make_done) -> tuple:
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _Slot(seq, fn, make_done())
+                return slot, True
+            if seq <= slot.seq:
+                return None, False
+            slot.seq, slot.fn = seq, fn
+            return slot, False
+
+    # 受け付けを締め切る(以降の要求は次の書き込みになる)
+    def _close(self, key, slot: _Slot) -> None:
+        with self._lock:
+            if self._slots.get(key) is slot:
+                del self._slots[key]
+
+    @staticmethod
+    def _outcome(slot: _Slot, seq: int) -> tuple:
+        if slot.error is not None:
+            raise slot.error
+        return (APPLIED if slot.seq == seq else COALESCED), slot.seq, slot.result
+
+    # (結果の種類, 書き込んだ seq, fn の結果) を返す。古い seq なら (STALE, None, None)
+    def submit(self, key, seq: int, fn: Callable) -> tuple:
+        slot, leader = self._join(key, seq, fn, threading.Event)
+        if slot is None:
+            return STALE, None, None
+        if leader:
+            time.sleep(self.window)
+            self._close(key, slot)
+            try:
+                slot.result = slot.fn()
+            except Exception as e:
+                slot.error = e
+            finally:
+                slot.done.set()
+        else:
+            slot.done.wait()
+        return self._outcome(slot, seq)
+
+    # submit の非同期版(fn はコルーチン関数)
+    async def submit_async(self, key, seq: int, fn: Callable) -> tuple:
+        slot, leader = self._join(key, seq, fn, asyncio.Event)
+        if slot is None:
+            return STALE, None, None
+        if leader:
+            await asyncio.sleep(self.window)
+            self._close(key, slot)
+            try:
+                slot.result = await slot.fn()
+            except Exception as e:
+                slot.error = e
+            finally:
+                slot.done.set()
+        else:
+            await slot.done.wait()
+        return self._outcome(slot, seq)
+
+
+# 並び替え用(プロセスごと)
+reorders = Coalescer(Config.REORDER_COALESCE_MS / 1000)
+
+
+# まとめて実行する対象か(seq が整数の要求だけ。不正な値はサービス関数が 400 にする)
+def eligible(params: dict) -> bool:
+    seq = params.get("seq")
+    return isinstance(seq, int) and not isinstance(seq, bool) and seq >= 0
+
+
+# まとめる前の入力の検証(fields は key と同じ)。不正な要求は他の要求に加わらず、
+# 後から届いても先の要求に代わらない。エラーの結果(正しければ None)を返す
+def rejected(params: dict, *fields: str) -> Optional[tuple]:
+    return parse_reorder(params, *fields)[0]
+
+
+# 結果 (body, status[, headers]) に書き込んだ seq(X-Reorder-Seq)を付け、件数を数える。
+# リーダーの書き込みが DB で古いと分かった場合も stale とする
+def finish(name: str, outcome: str, seq: Optional[int], result) -> tuple:
+    if outcome == STALE:
+        result = stale_reorder()
+    else:
+        body, status, *rest = result
+        if outcome == APPLIED and status == 409 and body.get("stale"):
+            outcome = STALE
+        headers = dict(rest[0]) if rest else {}
+        headers["X-Reorder-Seq"] = str(seq)
+        result = (body, status, headers)
+    metrics.observe_coalesced(name, outcome)
+    return result
+
+
+# まとめるキー(同じユーザー・リスト・クライアントの要求だけをまとめる)
+def key(name: str, params: dict, *fields: str) -> tuple:
+    return (
+        name,
+        str(params.get("user_id")),
+        *(str(params.get(f)) for f in fields),
+        str(params.get("client") or ""),
+    )
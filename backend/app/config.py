@@ -8,3 +8,122 @@ class Config:
     DATABASE_URL = os.getenv(
         "DATABASE_URL", "postgresql://postgres:postgres@db:5432/todo_db"
     )
+
+    # 読み取り専用のレプリカ(カンマ区切りの URL)。GET のリクエストはレプリカで実行する
+    DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")
+    # ユーザーが更新してからこの秒数は、そのユーザーの読み取りもプライマリで行う
+    # (レプリカの遅延より長くする)
+    REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+    # シャードマップ(JSON)のパス。指定すると user_id のハッシュでユーザーをシャードに分ける
+    SHARD_MAP = os.getenv("SHARD_MAP", "")
+    # シャードマップのファイルの更新を確認する間隔(秒)
+    SHARD_MAP_RELOAD_SECONDS = float(os.getenv("SHARD_MAP_RELOAD_SECONDS", "2"))
+
+    # DB コネクションプール(ワーカープロセスごと)
+    SQL_ECHO = os.getenv("SQL_ECHO", "False") == "True"
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True") == "True"
+    # 接続のタイムアウト(秒)。/readyz が DB の停止時にすぐ 503 を返せるように短くする
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    # python app/migrate.py などが DB の起動を待つ最大時間(秒)
+    DB_WAIT_SECONDS = float(os.getenv("DB_WAIT_SECONDS", "60"))
+    # 0 の場合は PostgreSQL の既定値(タイムアウトなし)
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+    # 一覧レスポンスのキャッシュ(redis / lru / none)。既定は CACHE_URL があれば redis、
+    # なければ none。lru はプロセス内のため、他のプロセスの更新では無効にならない。
+    # 1 プロセスで動かす場合(開発サーバーなど)だけ使う
+    CACHE_URL = os.getenv("CACHE_URL", "")
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if CACHE_URL else "none")
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+
+    # 一覧レスポンスの JSON エンコーダー(auto: orjson があれば使う / orjson / json)
+    JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+    # 一覧レスポンスを圧縮する最小サイズ(バイト)と圧縮レベル
+    COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "3"))
+
+    # seq 付きの並び替えをまとめる時間(ミリ秒)。同じリストへの要求はこの間の
+    # 最後の並びだけを書き込む(プロセスごと)
+    REORDER_COALESCE_MS = int(os.getenv("REORDER_COALESCE_MS", "50"))
+
+    # 本番サーバー(gunicorn)
+    WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:5000")
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", str((os.cpu_count() or 1) * 2 + 1)))
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+    WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "30"))
+
+    # パスワードハッシュ(方式を変えるとログイン時に再ハッシュされる)
+    HASH_METHOD = os.getenv("HASH_METHOD", "scrypt:32768:8:1")
+    # ハッシュ用のプロセス数(ワーカープロセスごと)。既定は CPU 数を WEB_WORKERS で
+    # 分けた数(最低 1)。gunicorn の全ワーカーで CPU 数程度になるようにする
+    HASH_WORKERS = int(
+        os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+    )
+    HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "64"))
+    # ログイン試行の上限(メールアドレス・IP ごと、ウィンドウ秒あたり)
+    LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "10"))
+    LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", "60"))
+
+    # アクセストークン
+    TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", str(60 * 60 * 24)))
+    # これより多いカテゴリーはトークンに載せない(所有確認は DB で行う)
+    TOKEN_MAX_CATEGORIES = int(os.getenv("TOKEN_MAX_CATEGORIES", "200"))
+    # True にするとトークンなし(user_id のみ)のリクエストを 401 にする
+    AUTH_REQUIRE_TOKEN = os.getenv("AUTH_REQUIRE_TOKEN", "False") == "True"
+
+    # リクエスト本文の上限(バイト)。インポート(NDJSON)の上限にもなる
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(256 * 1024 * 1024)))
+
+    # 変更通知(GET /api/events)
+    EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "board_events")
+    # Last-Event-ID で再送できる直近の件数(プロセスごと)
+    EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", "10000"))
+    # 1 コミットでこれを超える差分があるユーザーには reload を送る
+    EVENTS_MAX_PER_COMMIT = int(os.getenv("EVENTS_MAX_PER_COMMIT", "100"))
+    EVENTS_KEEPALIVE_SECONDS = int(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+    # 同期スタックで同時に配信する購読の上限(プロセスごと)。購読 1 つがスレッドを
+    # 1 つ占有するため、既定では他の API 用に 1 スレッドを残す。超えた接続は 503
+    EVENTS_SYNC_MAX_STREAMS = int(
+        os.getenv("EVENTS_SYNC_MAX_STREAMS", str(max(WEB_THREADS - 1, 0)))
+    )
+
+    # アーカイブ済みタスク(archived_tasks)の保存期間(日)。0 で削除しない
+    ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "365"))
+    # purge(ジョブ archive.purge)の 1 トランザクションの削除件数と実行間隔(秒)
+    ARCHIVE_PURGE_BATCH = int(os.getenv("ARCHIVE_PURGE_BATCH", "1000"))
+    ARCHIVE_PURGE_INTERVAL_SECONDS = int(
+        os.getenv("ARCHIVE_PURGE_INTERVAL_SECONDS", "3600")
+    )
+
+    # 論理削除した行の削除(ジョブ deletion.purge)の 1 トランザクションの
+    # 削除件数と、削除待ちを確認する間隔(秒。カテゴリーの削除時はすぐ実行する)
+    DELETION_BATCH = int(os.getenv("DELETION_BATCH", "1000"))
+    DELETION_POLL_SECONDS = int(os.getenv("DELETION_POLL_SECONDS", "5"))
+
+    # バックグラウンドジョブ(python app/worker.py)
+    # 1 プロセスで同時に実行するジョブ数と、待機中のジョブを確認する間隔(秒)
+    JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+    # 失敗時の再試行(回数と、指数的に延ばす待ち時間の初期値・上限(秒))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_BACKOFF_SECONDS = int(os.getenv("JOB_BACKOFF_SECONDS", "10"))
+    JOB_BACKOFF_MAX_SECONDS = int(os.getenv("JOB_BACKOFF_MAX_SECONDS", "3600"))
+    # これより長く running のままのジョブは、ワーカーが止まったとみなして戻す
+    JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "900"))
+    # 定期ジョブの登録・止まったジョブの回収を行う間隔(秒)
+    JOB_SCHEDULE_SECONDS = int(os.getenv("JOB_SCHEDULE_SECONDS", "30"))
+    # 終了したジョブの保存期間(日)
+    JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+    # ワーカーの /metrics のポート。0 で無効
+    JOB_METRICS_PORT = int(os.getenv("JOB_METRICS_PORT", "9100"))
+
+    # 計測(/metrics)。0 でスロークエリーログを無効化
+    SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "200"))
+    # 1 リクエストの SQL がこの件数を超えたら N+1 の疑いとして警告
+    QUERY_COUNT_WARN = int(os.getenv("QUERY_COUNT_WARN", "20"))
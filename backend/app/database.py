@@ -1,22 +1,79 @@
-import os
+import threading
+import time
 from contextlib import contextmanager
-from typing import Generator
-from sqlalchemy import create_engine
+from typing import Generator, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, Session
+from config import Config
 from models import Base
-import time
-from sqlalchemy.exc import OperationalError
+import routing
+
+
+# DB接続設定(プールサイズ等は Config から)
+def build_engine(url: str = Config.DATABASE_URL) -> Engine:
+    options = {"echo": Config.SQL_ECHO}
+    connect_args = {}
+    if url.startswith("postgresql"):
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_recycle=Config.DB_POOL_RECYCLE,
+            pool_pre_ping=Config.DB_POOL_PRE_PING,
+        )
+        connect_args["connect_timeout"] = Config.DB_CONNECT_TIMEOUT
+        if Config.DB_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["options"] = (
+                f"-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}"
+            )
+    return create_engine(url, connect_args=connect_args, **options)
+
+
+_engines: dict = {}
+_engine_lock = threading.Lock()
+SessionLocal = sessionmaker()
+
+
+# URL ごとのエンジン(最初に使うときに作成する。import しただけでは作らない)
+def engine_for(url: str) -> Engine:
+    engine = _engines.get(url)
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(url)
+            if engine is None:
+                engine = _engines[url] = build_engine(url)
+    return engine
 
-# DB接続設定
-DB_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/todo_db")
-engine = create_engine(DB_URL, echo=True)
-SessionLocal = sessionmaker(bind=engine)
 
+# プライマリ(DATABASE_URL)のエンジン
+def get_engine() -> Engine:
+    return engine_for(Config.DATABASE_URL)
 
+
+# database.engine / from database import engine は get_engine() と同じ
+def __getattr__(name: str):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# fork 後の子プロセスで呼ぶ。親から引き継いだ接続は閉じずに破棄し、
+# 子プロセスは自分のプールで新しく接続する
+def reset_engine_after_fork() -> None:
+    for engine in list(_engines.values()):
+        engine.dispose(close=False)
+
+
+# セッションを開き、正常に抜けたらコミットする。接続先は routing.target で選ぶ
+# (user_id のシャード、読み取り専用ならレプリカ)
 @contextmanager
-def session_scope() -> Generator[Session, None, None]:
+def session_scope(
+    user_id: Optional[int] = None, readonly: bool = False
+) -> Generator[Session, None, None]:
 
-    session = SessionLocal()
+    session = SessionLocal(bind=engine_for(routing.target(user_id, readonly)))
     try:
         yield session
         session.commit()
@@ -25,19 +82,40 @@ def session_scope() -> Generator[Session, None, None]:
         raise
     finally:
         session.close()
+    if user_id is not None and not readonly:
+        routing.mark_written(user_id)
 
 
-# テーブル作成（作成済みならスキップ）
-def create_tables(retries=10, delay=3):
-    for i in range(retries):
+# DB に接続できるか確認する(SELECT 1)。できなければ例外
+def ping(url: str = Config.DATABASE_URL) -> None:
+    with engine_for(url).connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+# DB に接続できるまで待つ。待ち時間は 0.1 秒から倍々にして最大 5 秒、
+# 合計 timeout 秒を過ぎたら最後の例外を送出する
+def wait_for_db(
+    timeout: float = Config.DB_WAIT_SECONDS, url: str = Config.DATABASE_URL
+) -> None:
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
         try:
-            Base.metadata.create_all(engine)
-            print("[database.py] Tables checked/created.")
+            ping(url)
             return
         except OperationalError as e:
-            print(f"[database.py] Table creation failed: {e}")
-            time.sleep(delay)
-    print("[database.py] Table creation failed after retries.")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            print(f"[database.py] waiting for database: {str(e.orig).strip()}")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 5)
+
+
+# テーブル作成（作成済みならスキップ）。起動時には呼ばず、python app/migrate.py で実行する
+def create_tables(engine: Optional[Engine] = None) -> None:
+    Base.metadata.create_all(engine or get_engine())
+    print("[database.py] Tables checked/created.")
 
 
 if __name__ == "__main__":
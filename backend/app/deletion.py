@@ -0,0 +1,195 @@
+from typing import Optional
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+import cache
+import events
+import jobs
+import stats
+from config import Config
+from models import ArchivedTask, Category, CategoryStats, ReorderSequence, Task
+from ordering import needs_rebalance, rebalance
+
+# 論理削除したカテゴリー・タスクの実際の削除。
+#
+# API は deleted_at を設定する UPDATE 1 文で返り、読み取りは削除待ちの行を除く。
+# ジョブ deletion.purge(カテゴリーの削除時に登録し、削除待ちの行があれば
+# worker.py が DELETION_POLL_SECONDS ごとにも登録)が削除待ちの行を DELETION_BATCH 件ずつ
+# (1 バッチ 1 トランザクション)削除し、行が減ったリストの並び順に隙間が
+# なくなっていれば詰め直す。進み具合はすべて行そのもの(deleted_at と残りの行)に
+# あるため、途中で止まっても再実行すれば続きから進む。PostgreSQL では
+# FOR UPDATE SKIP LOCKED で、複数のワーカーが同じ行を取り合わない。
+
+
+# 並び順の隙間がなくなったリストを詰め直す(変更通知は reload)
+def _compact(session: Session, user_id: int, id_column, sort_column, *criteria) -> bool:
+    if not needs_rebalance(session, id_column, sort_column, *criteria):
+        return False
+    rebalance(session, id_column, sort_column, *criteria)
+    events.record_reload(session, user_id)
+    return True
+
+
+def compact_categories(session: Session, user_id: int) -> bool:
+    compacted = _compact(
+        session,
+        user_id,
+        Category.category_id,
+        Category.sort_order,
+        Category.user_id == user_id,
+        Category.deleted_at.is_(None),
+    )
+    if compacted:
+        cache.touch_categories(session, user_id)
+    return compacted
+
+
+def compact_tasks(session: Session, user_id: int, category_id: int) -> bool:
+    compacted = _compact(
+        session,
+        user_id,
+        Task.task_id,
+        Task.sort_order,
+        Task.user_id == user_id,
+        Task.category_id == category_id,
+        Task.deleted_at.is_(None),
+    )
+    if compacted:
+        stats.sync_next(session, category_id, archived=False)
+        cache.touch_tasks(session, user_id, category_id)
+    return compacted
+
+
+# 削除待ちのカテゴリーを 1 つ選び、タスクを最大 limit 件削除する。
+# タスクが残っていなければカテゴリーも削除する。対象がなければ None
+def purge_deleted_category(session: Session, limit: int) -> Optional[dict]:
+    picked = session.execute(
+        select(Category.category_id, Category.user_id)
+        .where(Category.deleted_at.is_not(None))
+        .order_by(Category.deleted_at.asc())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if picked is None:
+        return None
+    category_id, user_id = picked
+    tasks = select(Task.task_id).where(Task.category_id == category_id).limit(limit)
+    deleted_tasks = session.execute(
+        delete(Task)
+        .where(Task.task_id.in_(tasks))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    deleted_archived = 0
+    if deleted_tasks < limit:
+        archived = (
+            select(ArchivedTask.user_id, ArchivedTask.task_id)
+            .where(
+                ArchivedTask.user_id == user_id,
+                ArchivedTask.category_id == category_id,
+            )
+            .limit(limit - deleted_tasks)
+        )
+        deleted_archived = session.execute(
+            delete(ArchivedTask)
+            .where(
+                ArchivedTask.user_id == user_id,
+                tuple_(ArchivedTask.user_id, ArchivedTask.task_id).in_(archived),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    done = deleted_tasks + deleted_archived < limit
+    if done:
+        session.execute(
+            delete(CategoryStats)
+            .where(CategoryStats.category_id == category_id)
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(
+            delete(ReorderSequence)
+            .where(
+                ReorderSequence.user_id == user_id,
+                ReorderSequence.category_id == category_id,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(
+            delete(Category)
+            .where(Category.category_id == category_id)
+            .execution_options(synchronize_session=False)
+        )
+        compact_categories(session, user_id)
+    return {
+        "category_id": category_id,
+        "user_id": user_id,
+        "tasks": deleted_tasks,
+        "archived_tasks": deleted_archived,
+        "done": done,
+    }
+
+
+# 削除待ちのタスクを古い順に最大 limit 件削除し、件数を返す
+def purge_deleted_tasks(session: Session, limit: int) -> int:
+    rows = session.execute(
+        select(Task.task_id, Task.user_id, Task.category_id)
+        .where(Task.deleted_at.is_not(None))
+        .order_by(Task.deleted_at.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        return 0
+    session.execute(
+        delete(Task)
+        .where(Task.task_id.in_([row.task_id for row in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    for user_id, category_id in {(row.user_id, row.category_id) for row in rows}:
+        compact_tasks(session, user_id, category_id)
+    return len(rows)
+
+
+# 削除待ちがなくなるまで(または他のワーカーが処理中の行だけになるまで)削除する
+def purge(batch: int = Config.DELETION_BATCH) -> dict:
+    # サービス層(非同期スタックからも読み込まれる)では同期エンジンを作らない
+    from database import session_scope
+
+    totals = {"categories": 0, "tasks": 0}
+    while True:
+        with session_scope() as session:
+            progress = purge_deleted_category(session, batch)
+        if progress is None:
+            break
+        print(
+            f"[deletion.py] category {progress['category_id']}: "
+            f"deleted {progress['tasks']} task(s), "
+            f"{progress['archived_tasks']} archived task(s)"
+            + (", done" if progress["done"] else "")
+        )
+        totals["categories"] += progress["done"]
+        totals["tasks"] += progress["tasks"] + progress["archived_tasks"]
+    while True:
+        with session_scope() as session:
+            purged = purge_deleted_tasks(session, batch)
+        totals["tasks"] += purged
+        if purged < batch:
+            return totals
+
+
+# 削除待ちの行があるか(定期実行を登録する前に確認する。部分インデックスだけを読む)
+def has_pending(session: Session) -> bool:
+    for model in (Category, Task):
+        found = session.scalar(
+            select(model.user_id).where(model.deleted_at.is_not(None)).limit(1)
+        )
+        if found is not None:
+            return True
+    return False
+
+
+# ジョブ deletion.purge(カテゴリーの削除ごとに登録し、待機中のものは 1 件にまとめる)
+@jobs.handler("deletion.purge")
+def purge_job(payload: dict) -> dict:
+    return purge(payload.get("batch", Config.DELETION_BATCH))
+
+
+def enqueue_purge(session: Session) -> int:
+    return jobs.enqueue(session, "deletion.purge", key="deletion.purge")
@@ -0,0 +1,111 @@
+import dataclasses
+import gzip
+import json
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional
+from config import Config
+
+try:  # JSON_ENCODER=auto / orjson で使う(なければ標準の json)
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:  # br で圧縮する場合のみ必要(なければ gzip だけ)
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# 一覧レスポンス(GET /categories, /tasks, /tasks/search, /board)の JSON 化と圧縮。
+#
+# サービス関数は一覧の行を辞書ではなく rows() の行オブジェクト(__slots__ の
+# dataclass)で返す。orjson は行オブジェクトを辞書を経由せずに JSON にする。
+# 本文は JSON のバイト列のままキャッシュし(cache.store)、返すときに
+# Accept-Encoding に応じて br / gzip で圧縮する(COMPRESS_MIN_BYTES 未満は圧縮しない)。
+
+
+# フィールド名の組ごとの行オブジェクトの型
+@lru_cache(maxsize=256)
+def row_type(fields: tuple) -> type:
+    return dataclasses.make_dataclass("Row", fields, slots=True)
+
+
+# SQL の結果行(先頭から fields の順に並んだ列)を行オブジェクトのリストにする。
+# fields より後ろの列(カーソル用など)は含めない
+def rows(fields, result: list) -> list:
+    fields = tuple(fields)
+    make = row_type(fields)
+    n = len(fields)
+    if result and len(result[0]) > n:
+        return [make(*row[:n]) for row in result]
+    return [make(*row) for row in result]
+
+
+# 標準の json で行オブジェクト・日時を変換する
+def _default(obj):
+    if dataclasses.is_dataclass(obj):
+        return {name: getattr(obj, name) for name in obj.__slots__}
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps_json(obj) -> bytes:
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def _dumps_orjson(obj) -> bytes:
+    return orjson.dumps(obj, default=_default)
+
+
+# 使えるエンコーダー(scripts/bench/serialize.py で比較する)
+ENCODERS = {"json": _dumps_json}
+if orjson is not None:
+    ENCODERS["orjson"] = _dumps_orjson
+
+
+# Config.JSON_ENCODER からエンコーダーを選ぶ
+def build_encoder():
+    if Config.JSON_ENCODER == "orjson":
+        if orjson is None:
+            raise RuntimeError("JSON_ENCODER=orjson には orjson パッケージが必要です")
+        return _dumps_orjson
+    if Config.JSON_ENCODER == "json":
+        return _dumps_json
+    return ENCODERS.get("orjson", _dumps_json)
+
+
+dumps = build_encoder()
+
+
+# サービス関数の結果 (body, status[, headers]) の body を JSON のバイト列にする
+def encode(result: tuple) -> tuple:
+    body, *rest = result
+    return (dumps(body), *rest)
+
+
+# 使える圧縮方式(同じ q 値なら先の方を選ぶ)
+CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(data, quality=Config.COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=Config.COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+# Accept-Encoding(werkzeug の accept_encodings)から圧縮方式を選ぶ。圧縮しなければ None
+def negotiate(accept_encodings, size: int) -> Optional[str]:
+    if size < Config.COMPRESS_MIN_BYTES:
+        return None
+    return accept_encodings.best_match(CODINGS)
+
+
+# 返す本文とヘッダー(Content-Encoding)。Vary: Accept-Encoding は呼び出し側で付ける
+def content(data: bytes, accept_encodings) -> tuple:
+    coding = negotiate(accept_encodings, len(data))
+    if coding is None:
+        return data, {}
+    return compress(data, coding), {"Content-Encoding": coding}
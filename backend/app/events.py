@@ -0,0 +1,302 @@
+import asyncio
+import json
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from config import Config
+from ordering import REBALANCED
+
+# ボードの変更通知(GET /api/events の Server-Sent Events)。
+#
+# 更新系のサービス関数は record() で差分(エンティティ・ID・変更した項目)を
+# セッションに記録する。PostgreSQL ではコミット直前に pg_notify を発行し、
+# 通知はコミットされたときだけ届く(ロールバックなら破棄)。各プロセスは
+# LISTEN 用の接続を 1 本持ち、受け取った差分をそのユーザーの購読者へ配る。
+# PostgreSQL 以外(SQLite の開発環境など)はコミット後にプロセス内だけで配る。
+#
+# 受け取った差分は全プロセスで同じ順(コミット順)に並ぶため、直近 EVENTS_BUFFER
+# 件を保持し、Last-Event-ID 以降を再送できる。範囲外なら reload を送って再取得させる。
+
+_RECORDED = "events_recorded"
+
+# pg_notify のペイロード上限(8000 バイト)に対する余裕
+_PAYLOAD_MAX = 7000
+
+
+# 変更差分をセッションに記録する(コミット時に通知)
+def record(session: Session, user_id, entity: str, op: str, id_, **fields) -> None:
+    delta = {"user_id": int(user_id), "entity": entity, "op": op, "id": int(id_)}
+    if fields:
+        delta["fields"] = fields
+    session.info.setdefault(_RECORDED, []).append(delta)
+
+
+# 差分を送らず、ユーザーにボードの再取得を求める(インポートなど件数が多い場合)
+def record_reload(session: Session, user_id) -> None:
+    session.info.setdefault(_RECORDED, []).append(_reload(int(user_id)))
+
+
+def _reload(user_id: int) -> dict:
+    return {"user_id": user_id, "entity": "board", "op": "reload"}
+
+
+# 記録された差分を通知する形にまとめる(ID を振り、多すぎるユーザーは reload に)
+def _collect(session: Session) -> list:
+    deltas = session.info.pop(_RECORDED, [])
+    rebalanced = session.info.pop(REBALANCED, False)
+    by_user: dict = {}
+    for delta in deltas:
+        by_user.setdefault(delta["user_id"], []).append(delta)
+    collected = []
+    for user_id, items in by_user.items():
+        too_many = len(items) > Config.EVENTS_MAX_PER_COMMIT
+        if rebalanced or too_many or any(d["op"] == "reload" for d in items):
+            # 並び順の振り直しは全行が変わるため、差分ではなく再取得させる
+            items = [_reload(user_id)]
+        for delta in items:
+            delta = {"event_id": uuid.uuid4().hex[:16], **delta}
+            payload = json.dumps(delta, ensure_ascii=False, default=str)
+            if len(payload.encode()) > _PAYLOAD_MAX:
+                delta = {"event_id": delta["event_id"], **_reload(user_id)}
+                payload = json.dumps(delta)
+            collected.append(payload)
+    return collected
+
+
+def _is_postgresql(session: Session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session: Session) -> None:
+    if _RECORDED not in session.info or not _is_postgresql(session):
+        return
+    payloads = _collect(session)
+    if payloads:
+        session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            [{"channel": Config.EVENTS_CHANNEL, "payload": p} for p in payloads],
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    # PostgreSQL 以外: LISTEN がないのでプロセス内で配る
+    if _RECORDED in session.info:
+        for payload in _collect(session):
+            hub.publish(json.loads(payload))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_RECORDED, None)
+    session.info.pop(REBALANCED, None)
+
+
+# 購読者への配信と、再送用の直近の差分の保持
+class Hub:
+    def __init__(self, size: int):
+        self._events: deque = deque(maxlen=size)
+        self._subscribers: dict = {}
+        self._lock = threading.Lock()
+
+    def publish(self, delta: dict) -> None:
+        with self._lock:
+            self._events.append(delta)
+            callbacks = list(self._subscribers.get(delta["user_id"], ()))
+        for callback in callbacks:
+            callback(delta)
+
+    # 購読を開始し、last_event_id より後の差分を返す(見つからなければ None)
+    def subscribe(self, user_id: int, callback: Callable, last_event_id=None):
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(callback)
+            if not last_event_id:
+                return []
+            ids = [e["event_id"] for e in self._events]
+            if last_event_id not in ids:
+                return None
+            after = list(self._events)[ids.index(last_event_id) + 1 :]
+            return [e for e in after if e["user_id"] == user_id]
+
+    def unsubscribe(self, user_id: int, callback: Callable) -> None:
+        with self._lock:
+            callbacks = self._subscribers.get(user_id, set())
+            callbacks.discard(callback)
+            if not callbacks:
+                self._subscribers.pop(user_id, None)
+
+    # LISTEN が切れた間の差分は失われるため、再送用の履歴を捨てる
+    def reset(self) -> None:
+        with self._lock:
+            self._events.clear()
+
+    # LISTEN をつなぎ直した後、切れていた間の差分の代わりに購読者全員へ reload を送る
+    def reload_all(self) -> None:
+        with self._lock:
+            subscribers = [(u, list(c)) for u, c in self._subscribers.items()]
+        for user_id, callbacks in subscribers:
+            delta = {"event_id": "", **_reload(user_id)}
+            for callback in callbacks:
+                callback(delta)
+
+
+hub = Hub(Config.EVENTS_BUFFER)
+
+
+# SSE の 1 件分
+def format_event(delta: dict) -> str:
+    data = {k: v for k, v in delta.items() if k not in ("event_id", "user_id")}
+    return (
+        f"id: {delta['event_id']}\n"
+        f"event: {delta['entity']}\n"
+        f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    )
+
+
+KEEPALIVE = ": keepalive\n\n"
+
+
+# ----- LISTEN(プロセス・DB ごとに 1 本。fork 後に最初の購読で開始) -----
+_listeners: set = set()  # (pid, DB の URL)
+_listener_lock = threading.Lock()
+
+
+# LISTEN が切れたら再送用の履歴を捨て、つなぎ直した後に購読者へ reload を送る
+def _listen_forever(engine) -> None:
+    lost = False
+    while True:
+        try:
+            raw = engine.raw_connection()
+            raw.detach()  # プールに返さず、この接続を LISTEN 専用にする
+            connection = raw.dbapi_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {Config.EVENTS_CHANNEL}")
+            if lost:
+                hub.reload_all()
+                lost = False
+            while True:
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    hub.publish(json.loads(connection.notifies.pop(0).payload))
+        except Exception as e:
+            print(f"[events.py] LISTEN failed: {e}")
+            hub.reset()
+            lost = True
+            time.sleep(3)
+
+
+# 同期スタック(psycopg2)の LISTEN をバックグラウンドスレッドで開始
+def ensure_listener(engine) -> None:
+    if engine.dialect.name != "postgresql":
+        return
+    key = (os.getpid(), str(engine.url))
+    with _listener_lock:
+        if key in _listeners:
+            return
+        _listeners.add(key)
+    threading.Thread(target=_listen_forever, args=(engine,), daemon=True).start()
+
+
+async def _listen_forever_async(engine) -> None:
+    import asyncpg
+
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def on_notify(connection, pid, channel, payload) -> None:
+        hub.publish(json.loads(payload))
+
+    lost = False
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda c: closed.set())
+            await connection.add_listener(Config.EVENTS_CHANNEL, on_notify)
+            if lost:
+                hub.reload_all()
+                lost = False
+            await closed.wait()
+        except Exception as e:
+            print(f"[events.py] LISTEN failed: {e}")
+        hub.reset()
+        lost = True
+        await asyncio.sleep(3)
+
+
+# 非同期スタック(asyncpg)の LISTEN をイベントループのタスクとして開始
+def ensure_async_listener(engine) -> None:
+    if engine.dialect.name != "postgresql":
+        return
+    key = (os.getpid(), str(engine.url))
+    with _listener_lock:
+        if key in _listeners:
+            return
+        _listeners.add(key)
+    asyncio.get_running_loop().create_task(_listen_forever_async(engine))
+
+
+# ----- 購読 -----
+
+
+# 同期スタックで配信中の購読(EVENTS_SYNC_MAX_STREAMS まで。api.events で数える)
+sync_streams = threading.BoundedSemaphore(Config.EVENTS_SYNC_MAX_STREAMS)
+
+
+# 同期スタック用: SSE の文字列を返すジェネレーター(購読者ごとにスレッドを 1 つ使う)
+def stream(user_id: int, last_event_id: Optional[str]):
+    inbox: queue.Queue = queue.Queue()
+    backlog = hub.subscribe(user_id, inbox.put, last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        if backlog is None:
+            yield format_event({"event_id": "", **_reload(user_id)})
+            backlog = []
+        for delta in backlog:
+            yield format_event(delta)
+        while True:
+            try:
+                yield format_event(inbox.get(timeout=Config.EVENTS_KEEPALIVE_SECONDS))
+            except queue.Empty:
+                yield KEEPALIVE
+    finally:
+        hub.unsubscribe(user_id, inbox.put)
+
+
+# 非同期スタック用
+async def stream_async(user_id: int, last_event_id: Optional[str]):
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def deliver(delta: dict) -> None:
+        loop.call_soon_threadsafe(inbox.put_nowait, delta)
+
+    backlog = hub.subscribe(user_id, deliver, last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        if backlog is None:
+            yield format_event({"event_id": "", **_reload(user_id)})
+            backlog = []
+        for delta in backlog:
+            yield format_event(delta)
+        while True:
+            try:
+                delta = await asyncio.wait_for(
+                    inbox.get(), Config.EVENTS_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield KEEPALIVE
+                continue
+            yield format_event(delta)
+    finally:
+        hub.unsubscribe(user_id, deliver)
@@ -0,0 +1,28 @@
+# gunicorn 設定(値は Config から。環境変数で上書きする)
+from config import Config
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+worker_class = "gthread" if Config.WEB_THREADS > 1 else "sync"
+timeout = Config.WEB_TIMEOUT
+
+# LRU のキャッシュはワーカーごとのため、他のワーカーの更新後も古い一覧・ETag を返し、
+# トークンのカテゴリー一覧(cv)も古いまま通してしまう
+if Config.CACHE_BACKEND == "lru" and workers > 1:
+    raise RuntimeError(
+        "CACHE_BACKEND=lru は WEB_WORKERS=1 の場合だけ使えます"
+        "(複数ワーカーでは redis にするか none にしてください)"
+    )
+# アプリはマスターで読み込み、fork 後に各ワーカーが自分の接続プールを持つ。
+# スキーマは python app/migrate.py で事前に作成し、起動時には DB を待たない
+# (DB が使えるまでは /readyz が 503 を返す)
+preload_app = True
+accesslog = "-"
+
+
+# fork 直後: 親プロセスの接続を共有しないようエンジンを初期化し直す
+def post_fork(server, worker):
+    from database import reset_engine_after_fork
+
+    reset_engine_after_fork()
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+from config import Config
+
+# パスワードのハッシュ化・照合(scrypt 等で数十〜数百 ms の CPU を使う)を
+# プロセスプールで実行し、リクエストを処理するワーカーを止めないようにする。
+# 待ち件数が HASH_QUEUE_MAX を超えたら Busy を送出して受け付けない。
+
+
+class Busy(Exception):
+    """ハッシュ計算の待ち行列が上限に達した"""
+
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_stats = {"submitted": 0, "rejected": 0, "completed": 0, "busy_seconds": 0.0}
+_pending = 0
+
+
+# プールはプロセスごとに遅延作成する(gunicorn の fork 前に作らない)
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=Config.HASH_WORKERS)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    return fn(*args), time.perf_counter() - start
+
+
+def _submit(fn, *args) -> Future:
+    global _pending
+    with _lock:
+        if _pending >= Config.HASH_QUEUE_MAX:
+            _stats["rejected"] += 1
+            raise Busy()
+        _pending += 1
+        _stats["submitted"] += 1
+        pool = _get_pool()
+    inner = pool.submit(_timed, fn, *args)
+    outer: Future = Future()
+
+    def done(f: Future) -> None:
+        global _pending
+        with _lock:
+            _pending -= 1
+        if f.exception() is not None:
+            outer.set_exception(f.exception())
+            return
+        value, elapsed = f.result()
+        with _lock:
+            _stats["completed"] += 1
+            _stats["busy_seconds"] += elapsed
+        outer.set_result(value)
+
+    inner.add_done_callback(done)
+    return outer
+
+
+# 現在の設定(HASH_METHOD)でハッシュ化
+def hash_password(password: str) -> str:
+    return _submit(generate_password_hash, password, Config.HASH_METHOD).result()
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return _submit(check_password_hash, password_hash, password).result()
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(
+        _submit(generate_password_hash, password, Config.HASH_METHOD)
+    )
+
+
+async def verify_password_async(password_hash: str, password: str) -> bool:
+    return await asyncio.wrap_future(
+        _submit(check_password_hash, password_hash, password)
+    )
+
+
+# 方式の省略されたパラメータを werkzeug と同じ既定値で補う
+# (scrypt → scrypt:32768:8:1、pbkdf2:sha256 → pbkdf2:sha256:<回数>)。
+# ハッシュの先頭には補った後の方式が保存される
+def expand_method(method: str) -> str:
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return f"scrypt:{2 ** 15}:8:1"
+    if name == "pbkdf2" and len(args) < 2:
+        hash_name = args[0] if args else "sha256"
+        return f"pbkdf2:{hash_name}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+# 保存済みハッシュの方式・パラメータが現在の設定と違えば True(ログイン時に再ハッシュ)
+def needs_rehash(password_hash: str) -> bool:
+    stored = password_hash.split("$", 1)[0]
+    return expand_method(stored) != expand_method(Config.HASH_METHOD)
+
+
+# 待ち件数などの統計
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "pending": _pending, "queue_max": Config.HASH_QUEUE_MAX}
@@ -0,0 +1,70 @@
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from migrate import schema_is_current
+import routing
+
+# 死活確認(/healthz)と受け付け可否(/readyz)。
+#
+# /healthz は DB に触れず、プロセスが応答するかだけを返す(再起動の判定用)。
+# /readyz は接続するすべての DB(レプリカ・シャードを含む)に接続でき、
+# 最新のマイグレーションが適用済みの場合だけ 200、それ以外は 503 を返す
+# (ロードバランサーへの追加の判定用)。スキーマの確認は DB ごとに一度通れば、
+# 以降は SELECT 1 だけにする(レプリカはプライマリの複製のため確認しない)。
+
+_schema_ready: set = set()
+
+
+def _check(conn, url: str) -> Optional[str]:
+    conn.execute(text("SELECT 1"))
+    if url not in _schema_ready and url in routing.write_urls():
+        if not schema_is_current(conn):
+            return "未適用のマイグレーションがあります"
+        _schema_ready.add(url)
+    return None
+
+
+def _respond(error: Optional[str]) -> tuple:
+    if error is None:
+        return {"status": "ready"}, 200
+    return {"status": "unavailable", "error": error}, 503
+
+
+# Flask アプリに /healthz と /readyz を登録する
+def init_app(app) -> None:
+    from database import engine_for
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}, 200
+
+    @app.get("/readyz")
+    def readyz():
+        error = None
+        try:
+            for url in routing.all_urls():
+                with engine_for(url).connect() as conn:
+                    error = error or _check(conn, url)
+        except (SQLAlchemyError, OSError) as e:
+            error = f"DB に接続できません: {type(e).__name__}"
+        return _respond(error)
+
+
+# Quart アプリ(非同期スタック)用
+def init_async_app(app) -> None:
+    from aio.database import async_engine_for
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}, 200
+
+    @app.get("/readyz")
+    async def readyz():
+        error = None
+        try:
+            for url in routing.all_urls():
+                async with async_engine_for(url).connect() as conn:
+                    error = error or await conn.run_sync(_check, url)
+        except (SQLAlchemyError, OSError) as e:
+            error = f"DB に接続できません: {type(e).__name__}"
+        return _respond(error)
@@ -0,0 +1,256 @@
+import random
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config import Config
+from models import Job
+
+# バックグラウンドジョブ(jobs テーブル)。
+#
+# API は enqueue() でリクエストと同じトランザクションにジョブを登録して返り
+# (ロールバックならジョブも残らない)、ワーカー(worker.py)が取り出して実行する。
+# 取り出しは SELECT ... FOR UPDATE SKIP LOCKED で 1 件ずつ running にしてコミット
+# するため、複数のワーカー・スレッドが同じジョブを取り合わない。失敗したジョブは
+# 待ち時間を指数的に延ばして再試行し、max_attempts 回で failed にする。
+# ジョブの処理(handler で登録)は自分でトランザクションを張り、再実行しても
+# 続きから進むように書く(ワーカーが止まると JOB_TIMEOUT_SECONDS 後に再実行される)。
+
+# kind -> 処理(payload を受け取り、結果を dict で返す)
+handlers: dict = {}
+
+
+# ジョブの処理を登録するデコレーター
+def handler(kind: str) -> Callable:
+    def register(fn: Callable) -> Callable:
+        handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ジョブを登録し、job_id を返す。key を指定した場合、同じ key の待機中ジョブが
+# あれば新しく登録せず、実行予定を早めてそのジョブを使う
+def enqueue(
+    session: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    key: Optional[str] = None,
+    delay: float = 0,
+    max_attempts: int = Config.JOB_MAX_ATTEMPTS,
+) -> int:
+    run_at = _now() + timedelta(seconds=delay)
+    if key is not None:
+        job_id = _pull_forward(session, key, run_at)
+        if job_id is not None:
+            return job_id
+    job = Job(
+        kind=kind,
+        key=key,
+        payload=payload,
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=run_at,
+    )
+    if key is None:
+        session.add(job)
+        session.flush()
+        return job.job_id
+    # 同時に登録された場合は uq_jobs_key_queued で片方が失敗する
+    try:
+        with session.begin_nested():
+            session.add(job)
+        return job.job_id
+    except IntegrityError:
+        return _pull_forward(session, key, run_at)
+
+
+def _pull_forward(session: Session, key: str, run_at: datetime) -> Optional[int]:
+    row = session.execute(
+        select(Job.job_id, Job.run_at).where(Job.key == key, Job.status == "queued")
+    ).first()
+    if row is None:
+        return None
+    session.execute(
+        update(Job)
+        .where(Job.job_id == row.job_id, Job.run_at > run_at)
+        .values(run_at=run_at)
+        .execution_options(synchronize_session=False)
+    )
+    return row.job_id
+
+
+# 実行予定を過ぎた待機中のジョブを 1 件 running にして返す(なければ None)。
+# 呼び出し側はすぐにコミットしてロックを手放す
+def claim(session: Session, worker: str) -> Optional[dict]:
+    now = _now()
+    row = session.execute(
+        select(Job.job_id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        .where(Job.status == "queued", Job.run_at <= now)
+        .order_by(Job.run_at.asc(), Job.job_id.asc())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if row is None:
+        return None
+    session.execute(
+        update(Job)
+        .where(Job.job_id == row.job_id)
+        .values(
+            status="running",
+            attempts=Job.attempts + 1,
+            locked_at=now,
+            locked_by=worker,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return {
+        "job_id": row.job_id,
+        "kind": row.kind,
+        "payload": row.payload or {},
+        "attempts": row.attempts + 1,
+        "max_attempts": row.max_attempts,
+    }
+
+
+# attempts 回目の失敗後の待ち時間(秒)。初期値から倍々にし、上限で止める(揺らぎあり)
+def backoff_seconds(attempts: int) -> float:
+    delay = min(
+        Config.JOB_BACKOFF_MAX_SECONDS,
+        Config.JOB_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0),
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _running(job_id: int, worker: str) -> list:
+    return [Job.job_id == job_id, Job.status == "running", Job.locked_by == worker]
+
+
+# 成功したジョブを done にする
+def complete(
+    session: Session, job_id: int, worker: str, result: Optional[dict] = None
+) -> None:
+    session.execute(
+        update(Job)
+        .where(*_running(job_id, worker))
+        .values(status="done", finished_at=_now(), result=result, last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# 失敗したジョブを再試行待ちに戻し(回数を使い切ったら failed)、新しい状態を返す
+def fail(session: Session, job: dict, worker: str, error: BaseException) -> str:
+    message = "".join(traceback.format_exception_only(type(error), error)).strip()
+    if job["attempts"] >= job["max_attempts"]:
+        values = {"status": "failed", "finished_at": _now()}
+    else:
+        delay = backoff_seconds(job["attempts"])
+        values = {"status": "queued", "run_at": _now() + timedelta(seconds=delay)}
+    try:
+        # 同じ key のジョブが既に待機中なら、再試行はそちらに任せて failed にする
+        with session.begin_nested():
+            session.execute(
+                update(Job)
+                .where(*_running(job["job_id"], worker))
+                .values(last_error=message[:2000], **values)
+                .execution_options(synchronize_session=False)
+            )
+    except IntegrityError:
+        values = {"status": "failed", "finished_at": _now()}
+        session.execute(
+            update(Job)
+            .where(*_running(job["job_id"], worker))
+            .values(last_error=message[:2000], **values)
+            .execution_options(synchronize_session=False)
+        )
+    return values["status"]
+
+
+# JOB_TIMEOUT_SECONDS を過ぎても running のジョブ(ワーカーが止まったもの)を
+# 待機中に戻し、戻した件数を返す。回数を使い切ったものは failed にする
+def requeue_stale(session: Session) -> int:
+    now = _now()
+    stale = [
+        Job.status == "running",
+        Job.locked_at < now - timedelta(seconds=Config.JOB_TIMEOUT_SECONDS),
+    ]
+    session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= Job.max_attempts)
+        .values(status="failed", finished_at=now, last_error="timed out")
+        .execution_options(synchronize_session=False)
+    )
+    # 同じ key の待機中ジョブがあるものは戻さずに終わらせる
+    queued_keys = select(Job.key).where(Job.status == "queued", Job.key.is_not(None))
+    session.execute(
+        update(Job)
+        .where(*stale, Job.key.in_(queued_keys))
+        .values(status="failed", finished_at=now, last_error="timed out")
+        .execution_options(synchronize_session=False)
+    )
+    return session.execute(
+        update(Job)
+        .where(*stale)
+        .values(status="queued", run_at=now, locked_by=None, last_error="timed out")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# key の待機中・実行中のジョブがなければ、delay 秒後に実行するジョブを登録する
+def ensure(session: Session, kind: str, key: str, delay: float) -> bool:
+    pending = session.scalar(
+        select(Job.job_id)
+        .where(Job.key == key, Job.status.in_(("queued", "running")))
+        .limit(1)
+    )
+    if pending is not None:
+        return False
+    enqueue(session, kind, key=key, delay=delay)
+    return True
+
+
+# 種類・状態ごとの待機中・実行中のジョブ数
+def queue_depth(session: Session) -> dict:
+    rows = session.execute(
+        select(Job.kind, Job.status, func.count())
+        .where(Job.status.in_(("queued", "running")))
+        .group_by(Job.kind, Job.status)
+    ).all()
+    return {(kind, status): n for kind, status, n in rows}
+
+
+# 保存期間を過ぎた終了済みのジョブを最大 limit 件削除し、件数を返す
+def delete_finished(session: Session, before: datetime, limit: int) -> int:
+    finished = (
+        select(Job.job_id)
+        .where(Job.status.in_(("done", "failed")), Job.finished_at < before)
+        .limit(limit)
+    )
+    return session.execute(
+        delete(Job)
+        .where(Job.job_id.in_(finished))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# ジョブ jobs.cleanup: 保存期間(JOB_RETENTION_DAYS)を過ぎた終了済みのジョブを削除する
+@handler("jobs.cleanup")
+def cleanup(payload: dict) -> dict:
+    # サービス層(非同期スタックからも読み込まれる)では同期エンジンを作らない
+    from database import session_scope
+
+    before = _now() - timedelta(days=payload.get("days", Config.JOB_RETENTION_DAYS))
+    total = 0
+    while True:
+        with session_scope() as session:
+            deleted = delete_finished(session, before, 1000)
+        total += deleted
+        if deleted < 1000:
+            return {"deleted": total}
@@ -1,10 +1,11 @@
 from flask import Flask
 from werkzeug.security import generate_password_hash, check_password_hash
-from database import SessionLocal, create_tables
+from database import session_scope
 from models import User
 from config import Config
 from api import api_bp
-import time
+import health
+import metrics
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -14,6 +15,10 @@ app.config.from_object(Config)
 # /api に設定されている場合:
 # /api/users や /api/auth/login などのエンドポイントが作成される。
 app.register_blueprint(api_bp, url_prefix="/api")
+# リクエストの計測と /metrics
+metrics.init_app(app)
+# 死活確認(/healthz)と受け付け可否(/readyz)
+health.init_app(app)
 
 """
 仮ユーザー情報（開発用）
@@ -28,35 +33,21 @@ EMAIL = "testuser@example.com"
 PASSWORD = "password123"
 
 
-# ユーザー取得・新規作成
-def get_or_create_user(retries=10, delay=3):
-    for i in range(retries):
-        session = SessionLocal()
-        try:
-            user = session.query(User).filter_by(name=USERNAME).first()
-            if user:
-                if check_password_hash(user.password_hash, PASSWORD):
-                    print("ログイン成功")
-                else:
-                    print("パスワードが違います")
-                return user
-            password_hash = generate_password_hash(PASSWORD)
-            user = User(name=USERNAME, email=EMAIL, password_hash=password_hash)
-            session.add(user)
-            session.commit()
-            print("新規登録しました")
+# ユーザー取得・新規作成(テーブルは python app/migrate.py で作成しておく)
+def get_or_create_user():
+    with session_scope() as session:
+        user = session.query(User).filter_by(name=USERNAME).first()
+        if user:
+            if check_password_hash(user.password_hash, PASSWORD):
+                print("ログイン成功")
+            else:
+                print("パスワードが違います")
             return user
-        except Exception as e:
-            print(f"[main.py] get_or_create_user failed: {e}")
-            if "UndefinedTable" in str(e) or 'relation "users" does not exist' in str(
-                e
-            ):
-                print("[main.py] テーブル未作成のため再度create_tables()を実行")
-                create_tables()
-            time.sleep(delay)
-        finally:
-            session.close()
-    print("[main.py] get_or_create_user failed after retries.")
+        password_hash = generate_password_hash(PASSWORD)
+        user = User(name=USERNAME, email=EMAIL, password_hash=password_hash)
+        session.add(user)
+        print("新規登録しました")
+        return user
 
 
 @app.route("/")
@@ -64,8 +55,8 @@ def main():
     return "Hello World"
 
 
+# スキーマの作成・変更は python app/migrate.py で行う(起動時には行わない)
 if __name__ == "__main__":
-    create_tables(retries=10, delay=3)
     # 本番運用では仮ユーザー作成をコメントアウト
     # get_or_create_user()
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import hashing
+from config import Config
+
+# リクエスト単位の計測。
+# - エンドポイントごとのレイテンシ、SQL 件数、取得/更新行数をヒストグラム・カウンタで集計
+# - SLOW_QUERY_MS を超えた SQL をログ出力(スロークエリーログ)
+# - 1 リクエストの SQL が QUERY_COUNT_WARN 件を超えたら N+1 の疑いとして警告
+# 集計はプロセス内のため、/metrics の値はワーカーごと。
+# バックグラウンドジョブ(worker.py)の所要時間・待機数と、まとめ書き(coalesce.py)の
+# 件数も同じ形式で集計する。
+#
+# Flask / Quart の両方から start_request / end_request を呼ぶ。リクエスト中の
+# 状態は ContextVar に置くため、スレッドでも run_sync 内の SQL でも同じ値を参照できる。
+
+logger = logging.getLogger("todo.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+_current: ContextVar[Optional[dict]] = ContextVar("request_metrics", default=None)
+_lock = threading.Lock()
+
+
+# 累積ヒストグラム(Prometheus の histogram 形式)
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+_latency: dict = {}
+_queries: dict = {}
+_counters = {"rows": {}, "n_plus_one": {}, "requests": {}, "slow_queries": 0}
+_jobs: dict = {}
+_job_queue: dict = {}
+_coalesced: dict = {}
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+# ----- リクエスト -----
+def start_request() -> None:
+    _current.set({"start": time.perf_counter(), "queries": 0, "rows": 0})
+
+
+# リクエストの計測を確定する。endpoint はルートのパターン(/api/task/<int:task_id> など)
+def end_request(method: str, endpoint: str, status: int) -> None:
+    state = _current.get()
+    if state is None:
+        return
+    _current.set(None)
+    elapsed = time.perf_counter() - state["start"]
+    key = (method, endpoint)
+    with _lock:
+        _latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+        _queries.setdefault(key, Histogram(QUERY_BUCKETS)).observe(state["queries"])
+        requests = _counters["requests"]
+        requests[key + (status,)] = requests.get(key + (status,), 0) + 1
+        rows = _counters["rows"]
+        rows[key] = rows.get(key, 0) + state["rows"]
+        if state["queries"] > Config.QUERY_COUNT_WARN:
+            n_plus_one = _counters["n_plus_one"]
+            n_plus_one[key] = n_plus_one.get(key, 0) + 1
+    if state["queries"] > Config.QUERY_COUNT_WARN:
+        logger.warning(
+            "N+1 の疑い: %s %s で SQL %d 件 (閾値 %d)",
+            method,
+            endpoint,
+            state["queries"],
+            Config.QUERY_COUNT_WARN,
+        )
+
+
+# ----- ジョブ -----
+# ジョブ 1 回分の所要時間。status は実行後の状態(done / queued(再試行) / failed)
+def observe_job(kind: str, status: str, seconds: float) -> None:
+    with _lock:
+        _jobs.setdefault((kind, status), Histogram(JOB_BUCKETS)).observe(seconds)
+
+
+# 種類・状態ごとの待機中・実行中のジョブ数(ワーカーが定期的に更新)
+def set_job_queue(depth: dict) -> None:
+    with _lock:
+        _job_queue.clear()
+        _job_queue.update(depth)
+
+
+# ----- まとめ書き -----
+# name(tasks.reorder など)の要求 1 件の結果(applied / coalesced / stale)
+def observe_coalesced(name: str, outcome: str) -> None:
+    with _lock:
+        _coalesced[(name, outcome)] = _coalesced.get((name, outcome), 0) + 1
+
+
+# ----- SQL(全エンジン共通。非同期スタックの AsyncEngine も内部の Engine で捕捉) -----
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    state = _current.get()
+    if state is not None:
+        state["queries"] += 1
+        # SELECT の rowcount はドライバーによって -1(未確定)になる
+        state["rows"] += max(cursor.rowcount, 0)
+    if Config.SLOW_QUERY_MS and elapsed * 1000 >= Config.SLOW_QUERY_MS:
+        with _lock:
+            _counters["slow_queries"] += 1
+        logger.warning("スロークエリー %.1f ms: %s", elapsed * 1000, statement)
+
+
+# ----- 出力 -----
+def _render_histogram(
+    lines: list,
+    name: str,
+    help_: str,
+    series: dict,
+    label_names: tuple = ("method", "endpoint"),
+) -> None:
+    lines.append(f"# HELP {name} {help_}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, hist in sorted(series.items()):
+        labels = _labels(**dict(zip(label_names, key)))
+        for bound, count in zip(hist.buckets, hist.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+        lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+        lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+
+# Prometheus のテキスト形式で出力する
+def render() -> str:
+    lines: list = []
+    with _lock:
+        _render_histogram(
+            lines,
+            "todo_request_duration_seconds",
+            "Request latency per endpoint.",
+            _latency,
+        )
+        _render_histogram(
+            lines,
+            "todo_request_queries",
+            "SQL statements executed per request.",
+            _queries,
+        )
+        lines.append("# HELP todo_requests_total Requests per endpoint and status.")
+        lines.append("# TYPE todo_requests_total counter")
+        for (method, endpoint, status), n in sorted(_counters["requests"].items()):
+            labels = _labels(method=method, endpoint=endpoint, status=status)
+            lines.append(f"todo_requests_total{{{labels}}} {n}")
+        lines.append("# HELP todo_request_rows_total Rows returned or affected by SQL.")
+        lines.append("# TYPE todo_request_rows_total counter")
+        for (method, endpoint), n in sorted(_counters["rows"].items()):
+            labels = _labels(method=method, endpoint=endpoint)
+            lines.append(f"todo_request_rows_total{{{labels}}} {n}")
+        lines.append(
+            "# HELP todo_n_plus_one_total Requests exceeding QUERY_COUNT_WARN queries."
+        )
+        lines.append("# TYPE todo_n_plus_one_total counter")
+        for (method, endpoint), n in sorted(_counters["n_plus_one"].items()):
+            labels = _labels(method=method, endpoint=endpoint)
+            lines.append(f"todo_n_plus_one_total{{{labels}}} {n}")
+        lines.append(
+            "# HELP todo_slow_queries_total Queries slower than SLOW_QUERY_MS."
+        )
+        lines.append("# TYPE todo_slow_queries_total counter")
+        lines.append(f"todo_slow_queries_total {_counters['slow_queries']}")
+        if _jobs:
+            _render_histogram(
+                lines,
+                "todo_job_duration_seconds",
+                "Background job run time per kind and resulting status.",
+                _jobs,
+                ("kind", "status"),
+            )
+        if _job_queue:
+            lines.append("# HELP todo_jobs Queued and running background jobs.")
+            lines.append("# TYPE todo_jobs gauge")
+            for (kind, status), n in sorted(_job_queue.items()):
+                lines.append(f"todo_jobs{{{_labels(kind=kind, status=status)}}} {n}")
+        if _coalesced:
+            lines.append(
+                "# HELP todo_coalesced_requests_total Coalesced write requests "
+                "(applied: written, coalesced: merged into a later one, stale: rejected)."
+            )
+            lines.append("# TYPE todo_coalesced_requests_total counter")
+            for (name, outcome), n in sorted(_coalesced.items()):
+                labels = _labels(name=name, outcome=outcome)
+                lines.append(f"todo_coalesced_requests_total{{{labels}}} {n}")
+    lines.append("# HELP todo_password_hash Password hashing pool statistics.")
+    lines.append("# TYPE todo_password_hash gauge")
+    for key, value in sorted(hashing.stats().items()):
+        lines.append(f'todo_password_hash{{stat="{key}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Flask アプリにフックと /metrics を登録する
+def init_app(app) -> None:
+    from flask import request
+
+    @app.before_request
+    def _start():
+        start_request()
+
+    @app.after_request
+    def _end(response):
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        end_request(request.method, rule, response.status_code)
+        return response
+
+    @app.get("/metrics")
+    def metrics():
+        return render(), 200, {"Content-Type": CONTENT_TYPE}
+
+
+# Quart アプリ用(フックを async にして ContextVar をリクエストのタスク内で扱う)
+def init_async_app(app) -> None:
+    from quart import request
+
+    @app.before_request
+    async def _start():
+        start_request()
+
+    @app.after_request
+    async def _end(response):
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        end_request(request.method, rule, response.status_code)
+        return response
+
+    @app.get("/metrics")
+    async def metrics():
+        return render(), 200, {"Content-Type": CONTENT_TYPE}
@@ -0,0 +1,136 @@
+import argparse
+import os
+import sys
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from database import create_tables, engine_for, get_engine, wait_for_db
+import routing
+
+# スキーマの作成とマイグレーション(python app/migrate.py)。
+# API・ワーカーの起動時にはスキーマを変更しないため、デプロイごとに 1 回これを実行する。
+# テーブルがなければモデルから作成し(create_all)、続けてマイグレーション
+# (app/migrations/NNNN_*.sql)を番号順に 1 回だけ適用する。
+# 先頭行が NO_TRANSACTION のファイルは CREATE INDEX CONCURRENTLY などのため
+# 1 文ずつ autocommit で実行する(各文は IF NOT EXISTS などで再実行可能にしておく)。
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+
+# 適用対象のマイグレーションファイル(バージョン, パス)を番号順に返す
+def migration_files() -> list:
+    return [
+        (name.split("_", 1)[0], os.path.join(MIGRATIONS_DIR, name))
+        for name in sorted(os.listdir(MIGRATIONS_DIR))
+        if name.endswith(".sql")
+    ]
+
+
+# 最新のマイグレーションのバージョン
+def latest_version() -> Optional[str]:
+    files = migration_files()
+    return files[-1][0] if files else None
+
+
+# 最新のマイグレーションまで適用済みか(schema_migrations がなければ False)。
+# 読み取りだけで、/readyz からも呼ぶ
+def schema_is_current(conn: Connection) -> bool:
+    version = latest_version()
+    if version is None:
+        return True
+    try:
+        return (
+            conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :v"),
+                {"v": version},
+            ).first()
+            is not None
+        )
+    except DBAPIError:
+        return False
+
+
+# コメント行を除いて ; 区切りの文に分割
+def _statements(sql: str) -> list:
+    body = "\n".join(
+        line for line in sql.splitlines() if not line.strip().startswith("--")
+    )
+    return [stmt.strip() for stmt in body.split(";") if stmt.strip()]
+
+
+# 適用済みバージョンの一覧
+def applied_versions(engine: Optional[Engine] = None) -> set:
+    with (engine or get_engine()).begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                " version VARCHAR(32) PRIMARY KEY,"
+                " applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+            )
+        )
+        return set(conn.scalars(text("SELECT version FROM schema_migrations")))
+
+
+# 未適用のマイグレーションを適用し、適用したバージョンを返す
+def migrate(engine: Optional[Engine] = None) -> list:
+    engine = engine or get_engine()
+    done = applied_versions(engine)
+    applied = []
+    for version, path in migration_files():
+        if version in done:
+            continue
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        if sql.startswith(NO_TRANSACTION):
+            with engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as conn:
+                for stmt in _statements(sql):
+                    conn.exec_driver_sql(stmt)
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version) VALUES (:v)"),
+                    {"v": version},
+                )
+        else:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version) VALUES (:v)"),
+                    {"v": version},
+                )
+        print(f"[migrate.py] applied {os.path.basename(path)}")
+        applied.append(version)
+    return applied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="スキーマの作成とマイグレーション")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="変更せず、未適用のマイグレーションがあれば終了コード 1",
+    )
+    args = parser.parse_args()
+    # シャーディング中はディレクトリとすべてのシャードが対象
+    outdated = 0
+    for url in routing.write_urls():
+        engine = engine_for(url)
+        wait_for_db(url=url)
+        if args.check:
+            with engine.connect() as conn:
+                current = schema_is_current(conn)
+            outdated += not current
+            state = "up to date" if current else "outdated"
+            print(f"[migrate.py] {engine.url}: schema is {state}")
+            continue
+        create_tables(engine)
+        applied = migrate(engine)
+        print(f"[migrate.py] {engine.url}: {len(applied)} migration(s) applied")
+    if args.check:
+        sys.exit(1 if outdated else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+-- migrate: no-transaction
+-- タスク一覧・並び順取得用の複合/部分インデックス(CONCURRENTLY のためトランザクション外で実行)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_active_list
+    ON tasks (user_id, category_id, sort_order, task_id)
+    WHERE status <> 'archived';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_archived_list
+    ON tasks (user_id, category_id, sort_order, task_id)
+    WHERE status = 'archived';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_category
+    ON tasks (category_id);
+
+-- 単独の sort_order インデックスはどのクエリにも使われないため削除
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_sort_order;
+DROP INDEX CONCURRENTLY IF EXISTS idx_categories_sort_order;
@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- タスク検索(GET /api/tasks/search)用。タイトル + 内容の部分一致(ILIKE '%語%')を
+-- トライグラムの GIN インデックスで引く。btree_gin で user_id も同じインデックスに含め、
+-- 他のユーザーのタスクを読まずに済むようにする
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_search
+    ON tasks USING gin (user_id, (title || ' ' || coalesce(content, '')) gin_trgm_ops);
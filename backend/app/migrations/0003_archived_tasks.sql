@@ -0,0 +1,57 @@
+-- アーカイブ済みタスクを tasks から archived_tasks(user_id のハッシュで 16 分割)へ移す。
+-- パーティション数は models.ARCHIVE_PARTITIONS と合わせる
+CREATE TABLE IF NOT EXISTS archived_tasks (
+    task_id BIGINT NOT NULL,
+    title VARCHAR(32) NOT NULL,
+    content TEXT,
+    status VARCHAR(32),
+    sort_order INTEGER,
+    user_id BIGINT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    category_id BIGINT REFERENCES categories (category_id) ON DELETE CASCADE,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (task_id, user_id)
+) PARTITION BY HASH (user_id);
+
+CREATE TABLE IF NOT EXISTS archived_tasks_p0 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 0);
+CREATE TABLE IF NOT EXISTS archived_tasks_p1 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 1);
+CREATE TABLE IF NOT EXISTS archived_tasks_p2 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 2);
+CREATE TABLE IF NOT EXISTS archived_tasks_p3 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 3);
+CREATE TABLE IF NOT EXISTS archived_tasks_p4 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 4);
+CREATE TABLE IF NOT EXISTS archived_tasks_p5 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 5);
+CREATE TABLE IF NOT EXISTS archived_tasks_p6 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 6);
+CREATE TABLE IF NOT EXISTS archived_tasks_p7 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 7);
+CREATE TABLE IF NOT EXISTS archived_tasks_p8 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 8);
+CREATE TABLE IF NOT EXISTS archived_tasks_p9 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 9);
+CREATE TABLE IF NOT EXISTS archived_tasks_p10 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 10);
+CREATE TABLE IF NOT EXISTS archived_tasks_p11 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 11);
+CREATE TABLE IF NOT EXISTS archived_tasks_p12 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 12);
+CREATE TABLE IF NOT EXISTS archived_tasks_p13 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 13);
+CREATE TABLE IF NOT EXISTS archived_tasks_p14 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 14);
+CREATE TABLE IF NOT EXISTS archived_tasks_p15 PARTITION OF archived_tasks
+    FOR VALUES WITH (MODULUS 16, REMAINDER 15);
+
+CREATE INDEX IF NOT EXISTS idx_archived_tasks_list
+    ON archived_tasks (user_id, category_id, sort_order, task_id);
+CREATE INDEX IF NOT EXISTS idx_archived_tasks_archived_at
+    ON archived_tasks (archived_at);
+
+INSERT INTO archived_tasks (task_id, title, content, status, sort_order, user_id, category_id)
+    SELECT task_id, title, content, status, sort_order, user_id, category_id
+    FROM tasks
+    WHERE status = 'archived';
+DELETE FROM tasks WHERE status = 'archived';
@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- アーカイブ済みが tasks から無くなったため、部分インデックス 2 つを 1 つにまとめる
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_list
+    ON tasks (user_id, category_id, sort_order, task_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_active_list;
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_archived_list;
@@ -0,0 +1,18 @@
+-- migrate: no-transaction
+-- カテゴリー・タスクの論理削除(deleted_at)。実際の削除は deletion.py のワーカーが行う
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+
+-- タイトルの一意制約を削除済みを除く部分ユニークインデックスに置き換える
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_categories_user_title
+    ON categories (user_id, title)
+    WHERE deleted_at IS NULL;
+ALTER TABLE categories DROP CONSTRAINT IF EXISTS categories_user_id_title_key;
+
+-- 削除待ちの行だけを含む部分インデックス(ワーカーが拾う)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_categories_deleted
+    ON categories (deleted_at)
+    WHERE deleted_at IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_deleted
+    ON tasks (deleted_at)
+    WHERE deleted_at IS NOT NULL;
@@ -0,0 +1,30 @@
+-- バックグラウンドジョブ(jobs.py、実行は worker.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(64) NOT NULL,
+    key VARCHAR(128),
+    payload JSONB,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    locked_at TIMESTAMP WITH TIME ZONE,
+    locked_by VARCHAR(128),
+    finished_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    result JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_ready
+    ON jobs (run_at)
+    WHERE status = 'queued';
+CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_key_queued
+    ON jobs (key)
+    WHERE status = 'queued' AND key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_jobs_running
+    ON jobs (locked_at)
+    WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_finished
+    ON jobs (finished_at)
+    WHERE status IN ('done', 'failed');
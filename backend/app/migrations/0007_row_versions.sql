@@ -0,0 +1,5 @@
+-- 楽観的排他制御の version 列(更新ごとに +1。If-Match と比較する)。
+-- 定数の既定値付きの ADD COLUMN は PostgreSQL 11 以降、テーブルを書き換えない
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE archived_tasks ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
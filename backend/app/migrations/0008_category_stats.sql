@@ -0,0 +1,48 @@
+-- カテゴリーごとのタスク数と末尾の並び順(models.CategoryStats、stats.py)。
+-- 既存のカテゴリーは現在のタスクから数えて作る。適用から新しいアプリへの
+-- 切り替えまでの間の変更はずれるため、切り替え後に python app/stats.py で数え直す
+CREATE TABLE IF NOT EXISTS category_stats (
+    category_id BIGINT PRIMARY KEY REFERENCES categories (category_id) ON DELETE CASCADE,
+    user_id BIGINT REFERENCES users (user_id) ON DELETE CASCADE,
+    todo INTEGER NOT NULL DEFAULT 0,
+    doing INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    other INTEGER NOT NULL DEFAULT 0,
+    archived INTEGER NOT NULL DEFAULT 0,
+    next_sort INTEGER NOT NULL DEFAULT 0,
+    next_archived_sort INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_category_stats_user ON category_stats (user_id);
+
+INSERT INTO category_stats
+    (category_id, user_id, todo, doing, done, other, archived, next_sort, next_archived_sort)
+SELECT
+    c.category_id,
+    c.user_id,
+    COALESCE(t.todo, 0),
+    COALESCE(t.doing, 0),
+    COALESCE(t.done, 0),
+    COALESCE(t.other, 0),
+    COALESCE(a.n, 0),
+    COALESCE(t.max_sort + 1024, 0),
+    COALESCE(a.max_sort + 1024, 0)
+FROM categories c
+LEFT JOIN (
+    SELECT
+        category_id,
+        count(*) FILTER (WHERE status = 'todo') AS todo,
+        count(*) FILTER (WHERE status = 'doing') AS doing,
+        count(*) FILTER (WHERE status = 'done') AS done,
+        count(*) FILTER (WHERE status IS NULL OR status NOT IN ('todo', 'doing', 'done')) AS other,
+        max(sort_order) AS max_sort
+    FROM tasks
+    WHERE deleted_at IS NULL
+    GROUP BY category_id
+) t ON t.category_id = c.category_id
+LEFT JOIN (
+    SELECT category_id, count(*) AS n, max(sort_order) AS max_sort
+    FROM archived_tasks
+    GROUP BY category_id
+) a ON a.category_id = c.category_id
+ON CONFLICT (category_id) DO NOTHING;
@@ -0,0 +1,9 @@
+-- リストごとの最後に受け付けた並び替えの連番(models.ReorderSequence)。
+-- category_id はタスクのリストならカテゴリー ID、カテゴリーのリストなら 0
+CREATE TABLE IF NOT EXISTS reorder_sequences (
+    user_id BIGINT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    category_id BIGINT NOT NULL,
+    client VARCHAR(64) NOT NULL DEFAULT '',
+    seq BIGINT NOT NULL,
+    PRIMARY KEY (user_id, category_id)
+);
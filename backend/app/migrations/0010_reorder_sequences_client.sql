@@ -0,0 +1,4 @@
+-- reorder_sequences をクライアントごとの行にする(主キーに client を含める)。
+-- 他のクライアントの seq と比べず、クライアントごとに古い seq を捨てる
+ALTER TABLE reorder_sequences DROP CONSTRAINT IF EXISTS reorder_sequences_pkey;
+ALTER TABLE reorder_sequences ADD PRIMARY KEY (user_id, category_id, client);
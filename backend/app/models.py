@@ -4,12 +4,16 @@ from sqlalchemy import (
     BigInteger,
     String,
     Text,
+    JSON,
     TIMESTAMP,
+    DDL,
     ForeignKey,
-    UniqueConstraint,
     Index,
+    event,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -39,16 +43,33 @@ class Category(Base):
     title = Column(String(100), nullable=False)
     sort_order = Column(Integer, default=0)
     user_id = Column(BigInteger, ForeignKey("users.user_id", ondelete="CASCADE"))
+    # 論理削除(実際の削除は deletion.py のワーカー)
+    deleted_at = Column(TIMESTAMP(timezone=True))
+    # 楽観的排他制御(更新ごとに +1。If-Match と比較する)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     user = relationship("User", back_populates="categories")
     tasks = relationship(
         "Task", back_populates="category", cascade="all, delete-orphan"
     )
     __table_args__ = (
-        UniqueConstraint("user_id", "title"),
-        Index("idx_categories_sort_order", "sort_order"),
+        # タイトルの重複は削除済みを除いてチェック
+        Index(
+            "uq_categories_user_title",
+            "user_id",
+            "title",
+            unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
         Index(
             "idx_categories_user_sort", "user_id", "sort_order"
         ),  # 追加: ユーザー内ソート高速化
+        # 削除待ちの検索用(削除済みの行だけを含む)
+        Index(
+            "idx_categories_deleted",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
     )
 
 
@@ -64,6 +85,168 @@ class Task(Base):
     category_id = Column(
         BigInteger, ForeignKey("categories.category_id", ondelete="CASCADE")
     )
+    # 論理削除(実際の削除は deletion.py のワーカー)
+    deleted_at = Column(TIMESTAMP(timezone=True))
+    # 楽観的排他制御(更新ごとに +1。If-Match と比較する)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     user = relationship("User", back_populates="tasks")
     category = relationship("Category", back_populates="tasks")
-    __table_args__ = (Index("idx_tasks_sort_order", "sort_order"),)
+    __table_args__ = (
+        # 一覧・末尾の並び順取得用(アーカイブ済みは archived_tasks に移す)
+        Index("idx_tasks_list", "user_id", "category_id", "sort_order", "task_id"),
+        # カテゴリー削除時のカスケード用
+        Index("idx_tasks_category", "category_id"),
+        Index(
+            "idx_tasks_deleted",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+        # 検索用の idx_tasks_search は拡張(pg_trgm, btree_gin)が必要なため
+        # migrations/0002_task_search.sql でだけ作成する
+    )
+
+
+# カテゴリーごとのタスク数(ステータス別)と末尾に追加するタスクの並び順。
+# タスクを変更するトランザクションの中で更新する(stats.py)
+class CategoryStats(Base):
+    __tablename__ = "category_stats"
+    category_id = Column(
+        BigInteger,
+        ForeignKey("categories.category_id", ondelete="CASCADE"),
+        primary_key=True,
+        autoincrement=False,
+    )
+    user_id = Column(BigInteger, ForeignKey("users.user_id", ondelete="CASCADE"))
+    # 削除待ちのタスクは数えない。other は todo / doing / done 以外のステータス
+    todo = Column(Integer, nullable=False, default=0, server_default="0")
+    doing = Column(Integer, nullable=False, default=0, server_default="0")
+    done = Column(Integer, nullable=False, default=0, server_default="0")
+    other = Column(Integer, nullable=False, default=0, server_default="0")
+    archived = Column(Integer, nullable=False, default=0, server_default="0")
+    # 次に末尾へ追加するタスクの並び順(未アーカイブ / アーカイブ済みのリスト)
+    next_sort = Column(Integer, nullable=False, default=0, server_default="0")
+    next_archived_sort = Column(Integer, nullable=False, default=0, server_default="0")
+    __table_args__ = (
+        # ユーザー単位の削除・シャード間の移動用
+        Index("idx_category_stats_user", "user_id"),
+    )
+
+
+# リスト・クライアントごとの最後に受け付けた並び替えの連番(PATCH /tasks/reorder などの seq)。
+# 同じクライアントの古い seq の並び替えを捨てるために使う
+class ReorderSequence(Base):
+    __tablename__ = "reorder_sequences"
+    user_id = Column(
+        BigInteger,
+        ForeignKey("users.user_id", ondelete="CASCADE"),
+        primary_key=True,
+        autoincrement=False,
+    )
+    # タスクのリストはカテゴリー ID、カテゴリーのリストは 0
+    category_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    # 並び替えを送ったクライアント(seq はクライアントごと)
+    client = Column(String(64), primary_key=True, default="", server_default="")
+    seq = Column(BigInteger, nullable=False)
+
+
+# archived_tasks のハッシュパーティション数(変える場合は作り直しが必要)
+ARCHIVE_PARTITIONS = 16
+
+
+# アーカイブ済みタスク(tasks から task_id ごと移す。archive.py)
+# PostgreSQL では user_id のハッシュでパーティション分割する
+class ArchivedTask(Base):
+    __tablename__ = "archived_tasks"
+    task_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    title = Column(String(32), nullable=False)
+    content = Column(Text)
+    status = Column(String(32), default="archived")
+    sort_order = Column(Integer, default=0)
+    user_id = Column(
+        BigInteger,
+        ForeignKey("users.user_id", ondelete="CASCADE"),
+        primary_key=True,
+        autoincrement=False,
+    )
+    category_id = Column(
+        BigInteger, ForeignKey("categories.category_id", ondelete="CASCADE")
+    )
+    archived_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=func.current_timestamp(),
+    )
+    # tasks から移すときにそのまま引き継ぐ
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __table_args__ = (
+        # アーカイブ済み一覧・末尾の並び順取得用
+        Index(
+            "idx_archived_tasks_list", "user_id", "category_id", "sort_order", "task_id"
+        ),
+        # 保存期間を過ぎた行の削除用
+        Index("idx_archived_tasks_archived_at", "archived_at"),
+        {"postgresql_partition_by": "HASH (user_id)"},
+    )
+
+
+# パーティション本体(create_all で親テーブルを作った直後に作成)
+for _remainder in range(ARCHIVE_PARTITIONS):
+    event.listen(
+        ArchivedTask.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE archived_tasks_p{_remainder} PARTITION OF archived_tasks "
+            f"FOR VALUES WITH (MODULUS {ARCHIVE_PARTITIONS}, REMAINDER {_remainder})"
+        ).execute_if(dialect="postgresql"),
+    )
+
+
+# バックグラウンドジョブ(jobs.py。実行は worker.py)
+class Job(Base):
+    __tablename__ = "jobs"
+    job_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind = Column(String(64), nullable=False)
+    # 同じ key の待機中ジョブは 1 件だけ(定期実行や重複登録の抑止)
+    key = Column(String(128))
+    payload = Column(JSON().with_variant(JSONB(), "postgresql"))
+    # queued / running / done / failed
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    locked_at = Column(TIMESTAMP(timezone=True))
+    locked_by = Column(String(128))
+    finished_at = Column(TIMESTAMP(timezone=True))
+    last_error = Column(Text)
+    result = Column(JSON().with_variant(JSONB(), "postgresql"))
+    created_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.current_timestamp()
+    )
+    __table_args__ = (
+        # 取り出し用(待機中だけを含む)
+        Index(
+            "idx_jobs_ready",
+            "run_at",
+            postgresql_where=text("status = 'queued'"),
+            sqlite_where=text("status = 'queued'"),
+        ),
+        Index(
+            "uq_jobs_key_queued",
+            "key",
+            unique=True,
+            postgresql_where=text("status = 'queued' AND key IS NOT NULL"),
+            sqlite_where=text("status = 'queued' AND key IS NOT NULL"),
+        ),
+        # 止まったワーカーのジョブの回収用
+        Index(
+            "idx_jobs_running",
+            "locked_at",
+            postgresql_where=text("status = 'running'"),
+        ),
+        # 完了済みの削除用
+        Index(
+            "idx_jobs_finished",
+            "finished_at",
+            postgresql_where=text("status IN ('done', 'failed')"),
+        ),
+    )
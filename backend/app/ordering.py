@@ -0,0 +1,115 @@
+from typing import Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+# 並び順(sort_order)は間隔(SORT_GAP)を空けた整数で管理する。
+# 移動・追加・削除は基本的に 1 行の更新で済み、
+# 隙間がなくなった場合のみリスト全体を振り直す(リバランス)。
+SORT_GAP = 1024
+
+# リバランスしたトランザクションの印(session.info のキー。変更通知で使う)
+REBALANCED = "ordering_rebalanced"
+
+
+# 末尾に追加するときの並び順
+def next_sort_order(max_sort: Optional[int]) -> int:
+    return 0 if max_sort is None else int(max_sort) + SORT_GAP
+
+
+# next_sort_order の SQL 版(UPDATE の中で末尾の並び順を求める)。max_sort はスカラーサブクエリ
+def next_sort_order_expr(max_sort):
+    return func.coalesce(max_sort + SORT_GAP, 0)
+
+
+# 並び替え(全件指定)時の並び順
+def sort_order_at(index: int) -> int:
+    return index * SORT_GAP
+
+
+# prev と next の間に入る並び順を返す。隙間がなければ None
+def sort_order_between(prev: Optional[int], next_: Optional[int]) -> Optional[int]:
+    if prev is None and next_ is None:
+        return 0
+    if prev is None:
+        return int(next_) - SORT_GAP
+    if next_ is None:
+        return int(prev) + SORT_GAP
+    if int(next_) - int(prev) < 2:
+        return None
+    return (int(prev) + int(next_)) // 2
+
+
+# 条件に一致する行の並び順を SORT_GAP 間隔で振り直す(1 文の UPDATE)
+def rebalance(session: Session, id_column, sort_column, *criteria) -> int:
+    ranked = (
+        select(
+            id_column.label("row_id"),
+            (func.row_number().over(order_by=(sort_column, id_column)) - 1).label(
+                "position"
+            ),
+        )
+        .where(*criteria)
+        .subquery()
+    )
+    stmt = (
+        update(id_column.class_)
+        .where(id_column == ranked.c.row_id)
+        .values({sort_column.key: ranked.c.position * SORT_GAP})
+        .execution_options(synchronize_session=False)
+    )
+    session.info[REBALANCED] = True
+    return session.execute(stmt).rowcount
+
+
+# 条件に一致する行に、間へ挿入できない(隙間が 2 未満の)隣り合う行があるか
+def needs_rebalance(session: Session, id_column, sort_column, *criteria) -> bool:
+    gaps = (
+        select(
+            (
+                sort_column
+                - func.lag(sort_column).over(order_by=(sort_column, id_column))
+            ).label("gap")
+        )
+        .where(*criteria)
+        .subquery()
+    )
+    return (
+        session.execute(select(gaps.c.gap).where(gaps.c.gap < 2).limit(1)).first()
+        is not None
+    )
+
+
+# row_id の行を prev_id と next_id の間へ移動するときの並び順を求める。
+# 隙間がなければ対象リストをリバランスしてから再計算する。
+# 指定された行が見つからない・前後関係が不正な場合は None
+def sort_order_for_move(
+    session: Session,
+    id_column,
+    sort_column,
+    row_id: int,
+    prev_id: Optional[int],
+    next_id: Optional[int],
+    *criteria,
+) -> Optional[int]:
+    ids = [i for i in (prev_id, next_id) if i is not None]
+
+    def neighbours() -> dict:
+        if not ids:
+            return {}
+        rows = session.execute(
+            select(id_column, sort_column).where(id_column.in_(ids), *criteria)
+        ).all()
+        return {row[0]: row[1] for row in rows}
+
+    orders = neighbours()
+    if row_id in ids or len(orders) != len(set(ids)) or prev_id == next_id:
+        return None
+    prev, next_ = orders.get(prev_id), orders.get(next_id)
+    if prev is not None and next_ is not None and prev > next_:
+        return None
+    new_sort = sort_order_between(prev, next_)
+    if new_sort is None:
+        rebalance(session, id_column, sort_column, *criteria)
+        orders = neighbours()
+        new_sort = sort_order_between(orders.get(prev_id), orders.get(next_id))
+    return new_sort
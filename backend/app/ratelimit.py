@@ -0,0 +1,53 @@
+import threading
+import time
+from config import Config
+
+# ログイン試行回数の簡易リミッター(プロセス内の固定ウィンドウ)。
+# IP ごとの試行と、メールアドレスごとの失敗を LOGIN_WINDOW_SECONDS 秒あたりで数え、
+# 上限を超えた分はハッシュ照合の前に拒否する(メールアドレスは失敗だけを数えるため、
+# 他人が成功するログインを繰り返してもロックされない)。
+
+
+class AttemptLimiter:
+    def __init__(self, max_attempts: int, window_seconds: int):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self._counts: dict = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    # 試行を 1 回数え、許可されれば 0、拒否なら再試行までの秒数を返す
+    def hit(self, *keys: str) -> int:
+        now = time.monotonic()
+        retry_after = 0
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            for key in keys:
+                window_end, count = self._counts.get(key, (0.0, 0))
+                if now >= window_end:
+                    window_end, count = now + self.window_seconds, 0
+                count += 1
+                self._counts[key] = (window_end, count)
+                if count > self.max_attempts:
+                    retry_after = max(retry_after, int(window_end - now) + 1)
+        return retry_after
+
+    # 数えずに確認する。上限まで数えられていれば再試行までの秒数、なければ 0
+    def blocked(self, *keys: str) -> int:
+        now = time.monotonic()
+        retry_after = 0
+        with self._lock:
+            for key in keys:
+                window_end, count = self._counts.get(key, (0.0, 0))
+                if now < window_end and count >= self.max_attempts:
+                    retry_after = max(retry_after, int(window_end - now) + 1)
+        return retry_after
+
+    # 期限切れのウィンドウを削除
+    def _sweep(self, now: float) -> None:
+        self._counts = {k: v for k, v in self._counts.items() if v[0] > now}
+        self._next_sweep = now + self.window_seconds
+
+
+login_limiter = AttemptLimiter(Config.LOGIN_MAX_ATTEMPTS, Config.LOGIN_WINDOW_SECONDS)
@@ -0,0 +1,126 @@
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import cache
+import sharding
+from config import Config
+
+# セッションの接続先の選択(database.session_scope / aio.database.async_session_scope)。
+#
+# - 通常: 更新はプライマリ(DATABASE_URL)、読み取り専用(GET)はレプリカ
+#   (DATABASE_REPLICA_URLS)のどれかで行う。ユーザーが更新してから
+#   REPLICA_STICKY_SECONDS の間は、そのユーザーの読み取りもプライマリで行う
+#   (自分の更新がすぐ見えるように)。記録はキャッシュのバックエンドに置く
+#   (lru・none ではプロセス内のみ。複数ワーカーでは redis にする)。
+# - シャーディング(SHARD_MAP。sharding.py): user_id があればそのユーザーのシャード、
+#   なければディレクトリ(DATABASE_URL)。ワーカーは use_shard() でシャードを選ぶ。
+#   シャーディング中はレプリカを使わない。
+
+REPLICA_URLS = [
+    url.strip() for url in Config.DATABASE_REPLICA_URLS.split(",") if url.strip()
+]
+
+_shard: ContextVar[Optional[str]] = ContextVar("shard", default=None)
+
+
+# user_id のないセッションの接続先をシャード name にする(ワーカーのジョブ用)
+@contextmanager
+def use_shard(name: Optional[str]):
+    token = _shard.set(name)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def _sticky_key(user_id) -> str:
+    return f"primary:{int(user_id)}"
+
+
+# 更新の記録はキャッシュのバックエンドに置く。キャッシュなし(none)の場合は
+# プロセス内に置く(複数プロセスでは redis にする)
+_local_marks = cache.LRUBackend(Config.CACHE_MAX_ENTRIES)
+
+
+def _marks():
+    if not cache.enabled():
+        return _local_marks
+    return cache.backend
+
+
+# ユーザーの更新をコミットした(しばらく読み取りもプライマリで行う)
+def mark_written(user_id) -> None:
+    if not REPLICA_URLS or sharding.enabled():
+        return
+    until = time.time() + Config.REPLICA_STICKY_SECONDS
+    _marks().set(
+        _sticky_key(user_id), str(until), math.ceil(Config.REPLICA_STICKY_SECONDS)
+    )
+
+
+def _sticky(user_id) -> bool:
+    until = _marks().get(_sticky_key(user_id))
+    return until is not None and float(until) > time.time()
+
+
+# 接続先の URL。シャードのバケットが移動中なら更新は sharding.Moving
+def target(user_id=None, readonly: bool = False) -> str:
+    shard_map = sharding.current()
+    if shard_map is not None:
+        if user_id is None:
+            name = _shard.get()
+            return Config.DATABASE_URL if name is None else shard_map.url(name)
+        if not readonly:
+            shard_map.check_writable(user_id)
+        return shard_map.url(shard_map.shard_for(user_id))
+    if readonly and REPLICA_URLS and (user_id is None or not _sticky(user_id)):
+        return random.choice(REPLICA_URLS)
+    return Config.DATABASE_URL
+
+
+# 変更通知(pg_notify)を LISTEN する DB の URL。通知は更新した DB から届くため
+# レプリカは使わない。読み取りと同じく、シャードのバケットが移動中でも Moving にしない
+def listen_target(user_id) -> str:
+    shard_map = sharding.current()
+    if shard_map is not None:
+        return shard_map.url(shard_map.shard_for(user_id))
+    return Config.DATABASE_URL
+
+
+# 読み取った一覧をキャッシュしてよいか(ETag を付けてよいか)。範囲が
+# REPLICA_STICKY_SECONDS 以内に更新されていれば、レプリカにまだ届いていない古い
+# 結果かもしれないため、現在のバージョンでは保存しない
+def cacheable(scope: str) -> bool:
+    if not REPLICA_URLS or sharding.enabled():
+        return True
+    return not cache.bumped_within(scope, Config.REPLICA_STICKY_SECONDS)
+
+
+# ユーザーのシャードがディレクトリと別の DB か(users の写しが必要か)
+def is_remote(user_id) -> bool:
+    return target(user_id) != Config.DATABASE_URL
+
+
+# ワーカーが巡回するシャード名(シャーディングしていなければ [None])
+def shard_names() -> list:
+    shard_map = sharding.current()
+    return [None] if shard_map is None else list(shard_map.shards)
+
+
+# スキーマを持つ(マイグレーション・ジョブの対象の)DB の URL
+def write_urls() -> list:
+    shard_map = sharding.current()
+    urls = [Config.DATABASE_URL]
+    if shard_map is not None:
+        urls += [shard_map.url(name) for name in shard_map.shards]
+    return list(dict.fromkeys(urls))
+
+
+# 接続するすべての DB の URL(/readyz で確認する)
+def all_urls() -> list:
+    if sharding.enabled():
+        return write_urls()
+    return list(dict.fromkeys([Config.DATABASE_URL] + REPLICA_URLS))
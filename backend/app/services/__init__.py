@@ -0,0 +1,3 @@
+# エンドポイントの処理本体。HTTP フレームワークに依存せず、
+# 同期(Flask + psycopg2)と非同期(Quart + asyncpg)の両方から同じ関数を呼ぶ。
+# 各関数は Session を受け取り (body, status[, headers]) を返す。
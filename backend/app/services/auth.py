@@ -0,0 +1,116 @@
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import sharding
+import tokens
+from models import Category, User
+from .utils import fail
+
+# パスワードのハッシュ化・照合は CPU を使うため、呼び出し側(Flask / Quart)で行う。
+# ここでは入力チェックと DB 操作のみを扱う。
+
+
+# ユーザー情報を辞書に変換
+def _user_to_dict(user: User) -> dict:
+    return {"user_id": user.user_id, "name": user.name, "email": user.email}
+
+
+# ディレクトリに登録したユーザーの写しをユーザーのシャードに作る(シャーディング時)。
+# パスワードはディレクトリでのみ照合するため、写しには持たせない
+def copy_user(session: Session, user: dict) -> None:
+    session.add(
+        User(
+            user_id=user["user_id"],
+            name=user["name"],
+            email=user["email"],
+            password_hash=sharding.NO_PASSWORD,
+        )
+    )
+
+
+# 登録内容のチェック。(name, email, password) または エラー結果を返す
+def parse_registration(data: dict) -> tuple:
+    name = (data.get("name") or "").strip()
+    email = (data.get("email") or "").strip().lower()
+    password = data.get("password") or ""
+    if not name or not email or not password:
+        return None, fail("name, email, password が必要です", 400)
+    if len(password) < 6:
+        return None, fail("password は6文字以上にしてください", 400)
+    return (name, email, password), None
+
+
+# ユーザー登録(ハッシュ化済みのパスワードを受け取る)
+def create_user(session: Session, name: str, email: str, password_hash: str) -> tuple:
+    try:
+        user = User(name=name, email=email, password_hash=password_hash)
+        session.add(user)
+        session.flush()  # to get user_id
+        return _user_to_dict(user), 201
+    except IntegrityError:
+        # email unique violation
+        session.rollback()
+        return fail("このメールアドレスは既に登録されています", 409)
+
+
+# ログイン内容のチェック。(email, password) または エラー結果を返す
+def parse_login(data: dict) -> tuple:
+    email = (data.get("email") or "").strip().lower()
+    password = data.get("password") or ""
+    if not email or not password:
+        return None, fail("email と password が必要です", 400)
+    return (email, password), None
+
+
+# メールアドレスでユーザーを検索し (ユーザー情報, パスワードハッシュ) を返す
+def find_login_user(session: Session, email: str) -> Optional[tuple]:
+    user = session.query(User).filter_by(email=email).first()
+    if not user:
+        return None
+    return _user_to_dict(user), user.password_hash
+
+
+# ログイン時の再ハッシュ結果を保存
+def update_password_hash(session: Session, user_id: int, password_hash: str) -> None:
+    session.query(User).filter_by(user_id=user_id).update(
+        {"password_hash": password_hash}
+    )
+
+
+# アクセストークンを発行(所有カテゴリー ID とその時点のバージョンを載せる)
+def issue_token(session: Session, user: dict) -> str:
+    # バージョンを先に読む(一覧取得との間に変更があればトークン側が古い扱いになる)
+    version = tokens.categories_version(session, user["user_id"])
+    category_ids = list(
+        session.scalars(
+            select(Category.category_id).where(
+                Category.user_id == user["user_id"], Category.deleted_at.is_(None)
+            )
+        )
+    )
+    return tokens.issue(user, category_ids, version)
+
+
+# トークンの再発行(カテゴリーを追加・削除した後などに呼ぶ)
+def refresh_token(session: Session, args) -> tuple:
+    claims = tokens.principal(session)
+    if claims is None:
+        return fail("認証が必要です", 401)
+    user = {"user_id": claims["uid"], "name": claims["name"], "email": claims["email"]}
+    return {**user, "token": issue_token(session, user)}, 200
+
+
+# ユーザー情報取得(トークンがあれば DB を読まない)
+def me(session: Session, args) -> tuple:
+    claims = tokens.principal(session)
+    if claims is not None:
+        user = {"user_id": claims["uid"], "name": claims["name"]}
+        return {**user, "email": claims["email"]}, 200
+    user_id = args.get("user_id", type=int)
+    if not user_id:
+        return fail("user_id が必要です", 400)
+    user = session.query(User).filter_by(user_id=user_id).first()
+    if not user:
+        return fail("ユーザーが見つかりません", 404)
+    return _user_to_dict(user), 200
@@ -0,0 +1,60 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import encoding
+import stats
+from models import Category, CategoryStats, Task
+from .tasks import TASK_FIELDS, _task_columns
+from .utils import fail
+
+
+# ボード全体(カテゴリー、未アーカイブのタスク、ステータス別件数)を取得。
+# カテゴリー + 件数で 1 回、タスクで 1 回の計 2 クエリ。ORM オブジェクトは作らない
+def get_board(session: Session, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    # アーカイブ済みは件数だけ(category_stats の値。archived_tasks は読まない)
+    category_rows = session.execute(
+        select(
+            Category.category_id,
+            Category.title,
+            Category.sort_order,
+            Category.version,
+            CategoryStats.archived,
+        )
+        .outerjoin(CategoryStats, CategoryStats.category_id == Category.category_id)
+        .where(Category.user_id == user_id, Category.deleted_at.is_(None))
+        .order_by(Category.sort_order.asc())
+    ).all()
+    categories = {
+        row.category_id: {
+            "category_id": row.category_id,
+            "category_title": row.title,
+            "sort_order": row.sort_order,
+            "user_id": user_id,
+            "version": row.version,
+            "counts": {"archived": row.archived},
+            "tasks": [],
+        }
+        for row in category_rows
+    }
+    # 未アーカイブのタスクは idx_tasks_list の順(カテゴリー → 並び順)で読み、
+    # ステータス別件数もここで数える(削除待ちのカテゴリーのタスクは下で読み飛ばす)。
+    # 件数は with_counts=1 と同じ列(stats.COUNT_COLUMNS)に分ける
+    task_rows = session.execute(
+        select(*_task_columns(TASK_FIELDS))
+        .where(Task.user_id == user_id, Task.deleted_at.is_(None))
+        .order_by(Task.category_id.asc(), Task.sort_order.asc(), Task.task_id.asc())
+    ).all()
+    task_row = encoding.row_type(tuple(TASK_FIELDS))
+    for row in task_rows:
+        category = categories.get(row.category_id)
+        if category is None:
+            continue
+        category["tasks"].append(task_row(*row))
+        counts = category["counts"]
+        column = stats.column_for(row.status)
+        counts[column] = counts.get(column, 0) + 1
+    for category in categories.values():
+        category["counts"] = stats.counts_of(category["counts"])
+    return {"categories": list(categories.values())}, 200
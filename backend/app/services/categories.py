@@ -0,0 +1,361 @@
+from typing import Optional
+from sqlalchemy import func, case, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import cache
+import deletion
+import encoding
+import events
+import stats
+from models import ArchivedTask, Category, CategoryStats, Task
+from ordering import next_sort_order, sort_order_for_move
+from .utils import (
+    check_ints,
+    claim_reorder_seq,
+    conflict,
+    fail,
+    parse_reorder,
+    version_etag,
+)
+
+
+# カテゴリーを辞書形式に変換
+def _category_to_dict(category: Category) -> dict:
+    return {
+        "category_id": category.category_id,
+        "category_title": category.title,
+        "sort_order": category.sort_order,
+        "user_id": category.user_id,
+        "version": category.version,
+    }
+
+
+# レスポンスと同じ形の列(UPDATE ... RETURNING 用)
+CATEGORY_COLUMNS = (
+    Category.category_id,
+    Category.title.label("category_title"),
+    Category.sort_order,
+    Category.user_id,
+    Category.version,
+)
+CATEGORY_FIELDS = tuple(column.key for column in CATEGORY_COLUMNS)
+
+
+# バージョンの比較条件(version が None なら比較しない)
+def _version_criteria(version) -> tuple:
+    return () if version is None else (Category.version == int(version),)
+
+
+# ユーザーの削除されていないカテゴリーの現在の状態(競合時のレスポンス用)
+def _current_category(session: Session, category_id: int, user_id) -> Optional[dict]:
+    row = session.execute(
+        select(*CATEGORY_COLUMNS).where(
+            Category.category_id == category_id,
+            Category.user_id == user_id,
+            Category.deleted_at.is_(None),
+        )
+    ).first()
+    return None if row is None else dict(row._mapping)
+
+
+# 更新の対象がなかった場合の結果(バージョン不一致なら 409 と現在の状態)
+def _not_updated(session: Session, category_id: int, user_id, version) -> tuple:
+    current = None
+    if version is not None:
+        current = _current_category(session, category_id, user_id)
+    if current is None:
+        return fail("指定されたカテゴリーが見つかりません", 404)
+    return conflict("カテゴリーは他で更新されています", current)
+
+
+# すべてのカテゴリーを取得(with_counts=1 ならステータス別のタスク数も)
+def list_categories(session: Session, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    stmt = (
+        select(*CATEGORY_COLUMNS)
+        .where(Category.user_id == user_id, Category.deleted_at.is_(None))
+        .order_by(Category.sort_order.asc())
+    )
+    if not with_counts(args):
+        return encoding.rows(CATEGORY_FIELDS, session.execute(stmt).all()), 200
+    # 件数は category_stats の 1 行を読むだけ(タスクは数えない)
+    counts = [getattr(CategoryStats, name) for name in stats.COUNT_COLUMNS]
+    rows = session.execute(
+        stmt.add_columns(*counts).outerjoin(
+            CategoryStats, CategoryStats.category_id == Category.category_id
+        )
+    ).all()
+    make = encoding.row_type((*CATEGORY_FIELDS, "counts"))
+    n = len(CATEGORY_FIELDS)
+    body = [
+        make(
+            *row[:n],
+            stats.counts_of(dict(zip(stats.COUNT_COLUMNS, row[n:]))),
+        )
+        for row in rows
+    ]
+    return body, 200
+
+
+# with_counts=1 / true が指定されたか(キャッシュの範囲も変わる)
+def with_counts(args) -> bool:
+    return (args.get("with_counts") or "").lower() in ("1", "true")
+
+
+# カテゴリーの追加
+def add_category(session: Session, data: dict) -> tuple:
+    title = data.get("title")
+    user_id = data.get("user_id")
+    if title is None or user_id is None:
+        return fail("title と user_id が必要です", 400)
+    if (
+        session.query(Category)
+        .filter_by(user_id=user_id, title=title, deleted_at=None)
+        .first()
+    ):
+        return fail("同じタイトルのカテゴリーが既に存在します", 409)
+    max_sort = (
+        session.query(func.max(Category.sort_order)).filter_by(user_id=user_id).scalar()
+    )
+    new_sort = next_sort_order(max_sort)
+    category = Category(title=title, user_id=user_id, sort_order=new_sort)
+    session.add(category)
+    session.flush()  # to get category_id
+    stats.create(session, category.category_id, user_id)
+    cache.touch_categories(session, user_id)
+    events.record(
+        session,
+        user_id,
+        "category",
+        "create",
+        category.category_id,
+        title=title,
+        sort_order=new_sort,
+    )
+    return _category_to_dict(category), 201
+
+
+# カテゴリーの名前変更(UPDATE ... RETURNING の 1 文。version があれば一致する場合だけ更新)
+def rename_category(session: Session, category_id: int, data: dict) -> tuple:
+    new_title = data.get("title")
+    user_id = data.get("user_id")
+    version = data.get("version")
+    if not new_title or user_id is None:
+        return fail("title と user_id が必要です", 400)
+    invalid = check_ints(data, "version")
+    if invalid is not None:
+        return invalid
+    try:
+        # タイトルの重複は uq_categories_user_title で検出する
+        with session.begin_nested():
+            row = session.execute(
+                update(Category)
+                .where(
+                    Category.category_id == category_id,
+                    Category.user_id == user_id,
+                    Category.deleted_at.is_(None),
+                    *_version_criteria(version),
+                )
+                .values(title=new_title, version=Category.version + 1)
+                .returning(*CATEGORY_COLUMNS)
+                .execution_options(synchronize_session=False)
+            ).first()
+    except IntegrityError:
+        return fail("同じタイトルのカテゴリーが既に存在します", 409)
+    if row is None:
+        return _not_updated(session, category_id, user_id, version)
+    category = dict(row._mapping)
+    cache.touch_categories(session, user_id)
+    events.record(
+        session,
+        user_id,
+        "category",
+        "update",
+        category_id,
+        title=new_title,
+        version=category["version"],
+    )
+    return category, 200, {"ETag": version_etag(category["version"])}
+
+
+# カテゴリーの並び替え(seq は reorder_tasks と同じ)
+def reorder_categories(session: Session, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    error, mapping, versions = parse_reorder(data)
+    if error is not None:
+        return error
+    rejected = claim_reorder_seq(session, user_id, 0, data)
+    if rejected is not None:
+        return rejected
+    when_pairs = [
+        (Category.category_id == cid, order) for cid, order in mapping.items()
+    ]
+    stmt = (
+        update(Category)
+        .where(Category.user_id == user_id, Category.deleted_at.is_(None))
+        .values(
+            sort_order=case(*when_pairs, else_=Category.sort_order),
+            version=Category.version + 1,
+        )
+        .returning(Category.category_id, Category.sort_order, Category.version)
+    )
+    if versions is None:
+        stmt = stmt.where(Category.category_id.in_(list(mapping.keys())))
+    else:
+        stmt = stmt.where(
+            tuple_(Category.category_id, Category.version).in_(
+                [(cid, versions[cid]) for cid in mapping]
+            )
+        )
+    rows = session.execute(stmt).all()
+    # versions を指定した場合は 1 件でも違えば何も変えない
+    if versions is not None and len(rows) < len(mapping):
+        session.rollback()
+        current = session.execute(
+            select(Category.category_id, Category.sort_order, Category.version)
+            .where(Category.user_id == user_id, Category.deleted_at.is_(None))
+            .order_by(Category.sort_order.asc(), Category.category_id.asc())
+        ).all()
+        return {
+            "error": "カテゴリーは他で更新されています",
+            "current": [dict(row._mapping) for row in current],
+        }, 409
+    cache.touch_categories(session, user_id)
+    for row in rows:
+        events.record(
+            session,
+            user_id,
+            "category",
+            "update",
+            row.category_id,
+            sort_order=row.sort_order,
+            version=row.version,
+        )
+    return {
+        "updated": len(rows),
+        "versions": {row.category_id: row.version for row in rows},
+    }, 200
+
+
+# カテゴリーの削除(論理削除の UPDATE 1 文。タスクの削除と並び順の詰め直しは
+# deletion.py のワーカーが後で行う)
+def delete_category(session: Session, category_id: int, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    version = args.get("version", type=int)
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    deleted = session.execute(
+        update(Category)
+        .where(
+            Category.category_id == category_id,
+            Category.user_id == user_id,
+            Category.deleted_at.is_(None),
+            *_version_criteria(version),
+        )
+        .values(deleted_at=func.now(), version=Category.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
+        return _not_updated(session, category_id, user_id, version)
+    cache.touch_categories(session, user_id)
+    cache.touch_tasks(session, user_id, category_id)
+    events.record(session, user_id, "category", "delete", category_id)
+    # タスクの削除はワーカーのジョブで行う(コミットされたときだけ実行される)
+    deletion.enqueue_purge(session)
+    return {"deleted": True}, 200
+
+
+# カテゴリー削除の進み具合(ワーカーが消し終えるまでの残りタスク数)。
+# 消し終えたカテゴリーは行が残らないため、見つからなければ完了とみなす
+def deletion_status(session: Session, category_id: int, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    category = (
+        session.query(Category.deleted_at)
+        .filter_by(category_id=category_id, user_id=user_id)
+        .first()
+    )
+    if category is None:
+        return {"category_id": category_id, "done": True, "remaining_tasks": 0}, 200
+    if category.deleted_at is None:
+        return fail("指定されたカテゴリーは削除されていません", 409)
+    remaining = (
+        session.query(func.count(Task.task_id))
+        .filter(Task.category_id == category_id)
+        .scalar()
+        + session.query(func.count(ArchivedTask.task_id))
+        .filter(
+            ArchivedTask.user_id == user_id, ArchivedTask.category_id == category_id
+        )
+        .scalar()
+    )
+    return {
+        "category_id": category_id,
+        "deleted_at": category.deleted_at.isoformat(),
+        "done": False,
+        "remaining_tasks": remaining,
+    }, 200
+
+
+# カテゴリーの移動(prev_id と next_id の間へ。端へ移動する場合は片方を省略)
+def move_category(session: Session, category_id: int, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    prev_id = data.get("prev_id")
+    next_id = data.get("next_id")
+    version = data.get("version")
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    if prev_id is None and next_id is None:
+        return fail("prev_id または next_id が必要です", 400)
+    invalid = check_ints(data, "prev_id", "next_id", "version")
+    if invalid is not None:
+        return invalid
+    category = (
+        session.query(Category)
+        .filter_by(category_id=category_id, user_id=user_id, deleted_at=None)
+        .first()
+    )
+    if not category:
+        return fail("指定されたカテゴリーが見つかりません", 404)
+    if version is not None and category.version != int(version):
+        return conflict("カテゴリーは他で更新されています", _category_to_dict(category))
+    new_sort = sort_order_for_move(
+        session,
+        Category.category_id,
+        Category.sort_order,
+        category_id,
+        None if prev_id is None else int(prev_id),
+        None if next_id is None else int(next_id),
+        Category.user_id == user_id,
+        Category.deleted_at.is_(None),
+    )
+    if new_sort is None:
+        return fail("prev_id または next_id が不正です", 400)
+    row = session.execute(
+        update(Category)
+        .where(
+            Category.category_id == category_id,
+            Category.user_id == user_id,
+            *_version_criteria(version),
+        )
+        .values(sort_order=new_sort, version=Category.version + 1)
+        .returning(*CATEGORY_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return _not_updated(session, category_id, user_id, version)
+    moved = dict(row._mapping)
+    cache.touch_categories(session, user_id)
+    events.record(
+        session,
+        user_id,
+        "category",
+        "update",
+        category_id,
+        sort_order=new_sort,
+        version=moved["version"],
+    )
+    return moved, 200, {"ETag": version_etag(moved["version"])}
@@ -0,0 +1,910 @@
+import re
+from collections import Counter
+from typing import Optional
+from sqlalchemy import (
+    Integer,
+    case,
+    cast,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    literal_column,
+    select,
+    true,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.orm import Session
+import archive
+import cache
+import encoding
+import events
+import stats
+from models import ArchivedTask, Category, Task
+from ordering import REBALANCED, SORT_GAP, sort_order_for_move
+from .utils import (
+    check_ints,
+    claim_reorder_seq,
+    conflict,
+    decode_cursor,
+    encode_cursor,
+    fail,
+    is_int,
+    owned_category_ids,
+    owns_category,
+    parse_reorder,
+    version_etag,
+)
+
+# 一括操作で受け付ける最大件数
+BATCH_LIMIT = 1000
+
+# タイトル・ステータスの最大文字数(tasks.title / tasks.status の VARCHAR(32))
+TASK_TITLE_MAX = 32
+TASK_STATUS_MAX = 32
+
+# 一覧取得で limit に指定できる最大件数
+LIST_LIMIT_MAX = 500
+
+# 検索で limit を省略したときの件数と最大件数
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 100
+
+# 検索語の最大文字数
+SEARCH_QUERY_MAX = 100
+
+# レスポンスのフィールド名と列の対応(fields= で指定できる名前)
+TASK_FIELDS = {
+    "task_id": Task.task_id,
+    "task_title": Task.title,
+    "content": Task.content,
+    "status": Task.status,
+    "sort_order": Task.sort_order,
+    "user_id": Task.user_id,
+    "category_id": Task.category_id,
+    "version": Task.version,
+}
+
+
+# 検索結果のフィールド(タスクのフィールドとスコア)
+SEARCH_FIELDS = (*TASK_FIELDS, "rank")
+
+
+# 列名とレスポンスのフィールド名の対応
+TASK_NAMES = {column.key: name for name, column in TASK_FIELDS.items()}
+
+
+# タスクを辞書形式に変換
+def _task_to_dict(task: Task) -> dict:
+    return {
+        "task_id": task.task_id,
+        "task_title": task.title,
+        "content": task.content,
+        "status": task.status,
+        "sort_order": task.sort_order,
+        "user_id": task.user_id,
+        "category_id": task.category_id,
+        "version": task.version,
+    }
+
+
+# 指定したフィールドをレスポンスのフィールド名でラベル付けした列
+def _task_columns(fields, model=Task) -> list:
+    return [getattr(model, TASK_FIELDS[name].key).label(name) for name in fields]
+
+
+# アーカイブ済みは archived_tasks、それ以外は tasks(archive.py)
+def _list_model(archived: bool):
+    return ArchivedTask if archived else Task
+
+
+# 同じ並び順リストに属するタスクの条件(アーカイブ済みと未アーカイブは別リスト)
+def _list_criteria(user_id: int, category_id: int, archived: bool) -> tuple:
+    model = _list_model(archived)
+    criteria = (model.user_id == user_id, model.category_id == category_id)
+    if not archived:
+        criteria += (Task.deleted_at.is_(None),)
+    return criteria
+
+
+# 論理削除されていない(タスク・カテゴリーとも削除待ちでない)行の条件
+def _visible(model) -> tuple:
+    live_category = exists().where(
+        Category.category_id == model.category_id, Category.deleted_at.is_(None)
+    )
+    if model is Task:
+        return (Task.deleted_at.is_(None), live_category)
+    return (live_category,)
+
+
+# ユーザーのタスクを tasks → archived_tasks の順で探す
+def _find_task(session: Session, task_id: int, user_id):
+    for model in (Task, ArchivedTask):
+        task = (
+            session.query(model)
+            .filter(model.task_id == task_id, model.user_id == user_id)
+            .filter(*_visible(model))
+            .first()
+        )
+        if task:
+            return task
+    return None
+
+
+# ユーザーのタスクの現在の状態(tasks → archived_tasks の順。競合時のレスポンス用)
+def _current_task(session: Session, task_id: int, user_id) -> Optional[dict]:
+    for model in (Task, ArchivedTask):
+        row = session.execute(
+            select(*_task_columns(TASK_FIELDS, model)).where(
+                model.task_id == task_id, model.user_id == user_id, *_visible(model)
+            )
+        ).first()
+        if row is not None:
+            return dict(row._mapping)
+    return None
+
+
+# バージョンの比較条件(version が None なら比較しない)
+def _version_criteria(model, version) -> tuple:
+    return () if version is None else (model.version == int(version),)
+
+
+# 更新・削除の対象がなかった場合の結果(バージョン不一致なら 409 と現在の状態)
+def _not_updated(session: Session, task_id: int, user_id, version) -> tuple:
+    current = None if version is None else _current_task(session, task_id, user_id)
+    if current is None:
+        return fail("指定されたタスクが見つかりません", 404)
+    return conflict("タスクは他で更新されています", current)
+
+
+# すべてのタスクを取得
+def list_tasks(session: Session, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    category_id = args.get("category_id", type=int)
+    status = args.get("status")  # e.g. "archived"
+    limit = args.get("limit", type=int)
+    cursor = args.get("cursor")
+    fields_param = args.get("fields")
+    if user_id is None or category_id is None:
+        return fail("user_id と category_id が必要です", 400)
+    if limit is not None and not 1 <= limit <= LIST_LIMIT_MAX:
+        return fail(f"limit は 1〜{LIST_LIMIT_MAX} で指定してください", 400)
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return fail("cursor が不正です", 400)
+    fields = list(TASK_FIELDS)
+    if fields_param:
+        fields = [f.strip() for f in fields_param.split(",") if f.strip()]
+        unknown = [f for f in fields if f not in TASK_FIELDS]
+        if unknown or not fields:
+            return fail(f"fields が不正です: {', '.join(unknown)}", 400)
+    if not owns_category(session, user_id, category_id):
+        return fail("指定されたカテゴリーが見つかりません", 404)
+    # 必要な列だけを取得(カーソル用に task_id と sort_order は常に取得)
+    archived = status == "archived"
+    model = _list_model(archived)
+    columns = _task_columns(
+        fields + [name for name in ("task_id", "sort_order") if name not in fields],
+        model,
+    )
+    q = select(*columns).where(*_list_criteria(user_id, category_id, archived))
+    if status is not None and not archived:
+        q = q.where(model.status == status)
+    if after is not None:
+        q = q.where(tuple_(model.sort_order, model.task_id) > after)
+    q = q.order_by(model.sort_order.asc(), model.task_id.asc())
+    if limit is not None:
+        q = q.limit(limit + 1)
+    rows = session.execute(q).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_order, rows[-1].task_id)
+    body = encoding.rows(fields, rows)
+    if next_cursor is not None:
+        return body, 200, {"X-Next-Cursor": next_cursor}
+    return body, 200
+
+
+# 検索対象の文字列。idx_tasks_search(migrations/0002)の式と同じにする
+def _search_document(model):
+    table = model.__tablename__
+    return literal_column(f"({table}.title || ' ' || coalesce({table}.content, ''))")
+
+
+# 検索のスコア(整数)。タイトルに含まれれば 1000、PostgreSQL では一致度を加える
+def _search_rank(session: Session, model, q: str, pattern: str):
+    rank = case((model.title.ilike(pattern, escape="\\"), 1000), else_=0)
+    if session.get_bind().dialect.name == "postgresql":
+        similarity = func.word_similarity(q, _search_document(model))
+        rank = rank + cast(similarity * 1000, Integer)
+    return rank
+
+
+# タスクの検索(タイトル・内容の部分一致。スコアの高い順)
+def search_tasks(session: Session, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    q = (args.get("q") or "").strip()
+    category_id = args.get("category_id", type=int)
+    status = args.get("status")
+    limit = args.get("limit", SEARCH_LIMIT_DEFAULT, type=int)
+    cursor = args.get("cursor")
+    if user_id is None or not q:
+        return fail("user_id と q が必要です", 400)
+    if len(q) > SEARCH_QUERY_MAX:
+        return fail(f"q は {SEARCH_QUERY_MAX} 文字以内にしてください", 400)
+    if not 1 <= limit <= SEARCH_LIMIT_MAX:
+        return fail(f"limit は 1〜{SEARCH_LIMIT_MAX} で指定してください", 400)
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return fail("cursor が不正です", 400)
+    if category_id is not None and not owns_category(session, user_id, category_id):
+        return fail("指定されたカテゴリーが見つかりません", 404)
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", q) + "%"
+    # アーカイブ済みの検索は archived_tasks(トライグラムのインデックスなし)を読む
+    archived = status == "archived"
+    model = _list_model(archived)
+    rank = _search_rank(session, model, q, pattern)
+    stmt = select(*_task_columns(TASK_FIELDS, model), rank.label("rank")).where(
+        model.user_id == user_id,
+        _search_document(model).ilike(pattern, escape="\\"),
+        *_visible(model),
+    )
+    if category_id is not None:
+        stmt = stmt.where(model.category_id == category_id)
+    if status is not None and not archived:
+        stmt = stmt.where(model.status == status)
+    if after is not None:
+        stmt = stmt.where(tuple_(rank, model.task_id) < after)
+    stmt = stmt.order_by(rank.desc(), model.task_id.desc()).limit(limit + 1)
+    rows = session.execute(stmt).all()
+    body = encoding.rows(SEARCH_FIELDS, rows[:limit])
+    if len(rows) > limit:
+        next_cursor = encode_cursor(rows[limit - 1].rank, rows[limit - 1].task_id)
+        return body, 200, {"X-Next-Cursor": next_cursor}
+    return body, 200
+
+
+# タスクの追加
+def add_task(session: Session, data: dict) -> tuple:
+    title = data.get("title")
+    content = data.get("content", "")
+    user_id = data.get("user_id")
+    category_id = data.get("category_id")
+    if not title or user_id is None or category_id is None:
+        return fail("title, user_id, category_id が必要です", 400)
+    if not owns_category(session, user_id, category_id):
+        return fail("指定されたカテゴリーが見つかりません", 404)
+    new_sort = stats.take_sort(session, category_id)
+    task = Task(
+        title=title,
+        content=content,
+        user_id=user_id,
+        category_id=category_id,
+        sort_order=new_sort,
+    )
+    session.add(task)
+    session.flush()  # to get task_id
+    cache.touch_tasks(session, user_id, category_id)
+    created = _task_to_dict(task)
+    stats.count(session, category_id, created["status"])
+    events.record(
+        session,
+        user_id,
+        "task",
+        "create",
+        task.task_id,
+        **{k: v for k, v in created.items() if k not in ("task_id", "user_id")},
+    )
+    return created, 201
+
+
+# タスクの編集(UPDATE ... RETURNING の 1 文。version があれば一致する場合だけ更新)
+def edit_task(session: Session, task_id: int, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    title = data.get("title")
+    content = data.get("content")
+    status = data.get("status")
+    version = data.get("version")
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    if title is None and content is None and status is None:
+        return fail("更新項目がありません", 400)
+    invalid = check_ints(data, "version")
+    if invalid is not None:
+        return invalid
+    values = {"title": title, "content": content, "status": status}
+    values = {k: v for k, v in values.items() if v is not None}
+    row = current = None
+    for model in (Task, ArchivedTask):
+        row_values = dict(values, version=model.version + 1)
+        if status is not None:
+            # ステータスを変えたタスクは移動先のリストの末尾へ。件数の増減のため
+            # 変更前のステータスをロックして読む
+            current = session.execute(
+                select(model.category_id, model.status)
+                .where(
+                    model.task_id == task_id,
+                    model.user_id == user_id,
+                    *_visible(model),
+                )
+                .with_for_update()
+            ).first()
+            if current is None:
+                continue
+            row_values["sort_order"] = stats.take_sort(
+                session, current.category_id, status == "archived"
+            )
+        row = session.execute(
+            update(model)
+            .where(
+                model.task_id == task_id,
+                model.user_id == user_id,
+                *_visible(model),
+                *_version_criteria(model, version),
+            )
+            .values(row_values)
+            .returning(*_task_columns(TASK_FIELDS, model))
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is not None:
+            break
+    if row is None:
+        return _not_updated(session, task_id, user_id, version)
+    task = dict(row._mapping)
+    # ステータスの変更でアーカイブ済み / 未アーカイブが入れ替わった行を移す
+    if model is Task and task["status"] == "archived":
+        archive.archive_rows(session, user_id, [task_id])
+    elif model is ArchivedTask and task["status"] != "archived":
+        archive.restore_rows(session, user_id, [task_id])
+    cache.touch_tasks(session, user_id, task["category_id"])
+    if current is not None:
+        stats.moved(session, task["category_id"], current.status, task["status"])
+    changed = {"task_title": title, "content": content, "status": status}
+    changed = {k: v for k, v in changed.items() if v is not None}
+    if status is not None:
+        changed["sort_order"] = task["sort_order"]
+    events.record(
+        session,
+        user_id,
+        "task",
+        "update",
+        task_id,
+        category_id=task["category_id"],
+        version=task["version"],
+        **changed,
+    )
+    return task, 200, {"ETag": version_etag(task["version"])}
+
+
+# アーカイブ済みタスクを未アーカイブ(既定は todo)に戻す
+def restore_task(session: Session, task_id: int, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    status = data.get("status") or "todo"
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    if status == "archived":
+        return fail("status に archived は指定できません", 400)
+    archived = (
+        session.query(ArchivedTask.task_id)
+        .filter_by(task_id=task_id, user_id=user_id)
+        .first()
+    )
+    if not archived:
+        return fail("指定されたアーカイブ済みタスクが見つかりません", 404)
+    return edit_task(
+        session,
+        task_id,
+        {"user_id": user_id, "status": status, "version": data.get("version")},
+    )
+
+
+# タスクの削除(version があれば一致する場合だけ削除)
+def delete_task(session: Session, task_id: int, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    version = args.get("version", type=int)
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    task = _find_task(session, task_id, user_id)
+    if not task:
+        return fail("指定されたタスクが見つかりません", 404)
+    model = type(task)
+    # 未アーカイブは論理削除(実際の削除は deletion.py のワーカー)
+    stmt = delete(model)
+    if model is Task:
+        stmt = update(Task).values(deleted_at=func.now(), version=Task.version + 1)
+    deleted = session.execute(
+        stmt.where(
+            model.task_id == task_id,
+            model.user_id == user_id,
+            *_version_criteria(model, version),
+        )
+        .returning(model.status)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if deleted is None:
+        return _not_updated(session, task_id, user_id, version)
+    stats.count(session, task.category_id, deleted.status, -1)
+    cache.touch_tasks(session, user_id, task.category_id)
+    events.record(
+        session, user_id, "task", "delete", task_id, category_id=task.category_id
+    )
+    return {"deleted": True}, 200
+
+
+# ordered_ids がどちらのリストのタスクか(アーカイブ済みなら True)。
+# ユーザーのカテゴリーのリストにないタスクや、両方のリストのタスクが混ざって
+# いる場合は None
+def _reorder_list(session: Session, user_id, category_id, task_ids) -> Optional[bool]:
+    found = session.execute(
+        union_all(
+            *(
+                select(_list_model(archived).task_id, literal(archived)).where(
+                    _list_model(archived).task_id.in_(task_ids),
+                    *_list_criteria(user_id, category_id, archived),
+                )
+                for archived in (False, True)
+            )
+        )
+    ).all()
+    lists = {archived for _, archived in found}
+    if len(found) != len(task_ids) or len(lists) != 1:
+        return None
+    return lists.pop()
+
+
+# タスクの並び替え(未アーカイブのリストとアーカイブ済みのリストのどちらか)。
+# versions を指定した場合はすべての行のバージョンが一致するときだけ並び替え、
+# 1 件でも違えば何も変えずに 409 とリストの現在の状態を返す。
+# seq を指定した場合は、同じ client のより新しい seq を受け付け済みなら 409(stale)
+def reorder_tasks(session: Session, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    category_id = data.get("category_id")
+    error, mapping, versions = parse_reorder(data, "category_id")
+    if error is not None:
+        return error
+    if not owns_category(session, user_id, category_id):
+        return fail("指定されたカテゴリーが見つかりません", 404)
+    archived = _reorder_list(session, user_id, category_id, list(mapping))
+    if archived is None:
+        return fail(
+            "ordered_ids にはカテゴリーの同じリスト"
+            "(未アーカイブまたはアーカイブ済み)のタスクを指定してください",
+            400,
+        )
+    rejected = claim_reorder_seq(session, user_id, category_id, data)
+    if rejected is not None:
+        return rejected
+    model = _list_model(archived)
+    when_pairs = [(model.task_id == tid, order) for tid, order in mapping.items()]
+    stmt = (
+        update(model)
+        .where(*_list_criteria(user_id, category_id, archived))
+        .values(
+            sort_order=case(*when_pairs, else_=model.sort_order),
+            version=model.version + 1,
+        )
+        .returning(model.task_id, model.sort_order, model.version)
+        .execution_options(synchronize_session=False)
+    )
+    if versions is None:
+        stmt = stmt.where(model.task_id.in_(list(mapping.keys())))
+    else:
+        stmt = stmt.where(
+            tuple_(model.task_id, model.version).in_(
+                [(tid, versions[tid]) for tid in mapping]
+            )
+        )
+    rows = session.execute(stmt).all()
+    if versions is not None and len(rows) < len(mapping):
+        session.rollback()
+        current = session.execute(
+            select(model.task_id, model.sort_order, model.version)
+            .where(*_list_criteria(user_id, category_id, archived))
+            .order_by(model.sort_order.asc(), model.task_id.asc())
+        ).all()
+        return {
+            "error": "タスクは他で更新されています",
+            "current": [dict(row._mapping) for row in current],
+        }, 409
+    if rows:
+        stats.raise_next(
+            session, category_id, archived, max(row.sort_order for row in rows)
+        )
+    cache.touch_tasks(session, user_id, category_id)
+    for row in rows:
+        events.record(
+            session,
+            user_id,
+            "task",
+            "update",
+            row.task_id,
+            category_id=category_id,
+            sort_order=row.sort_order,
+            version=row.version,
+        )
+    return {
+        "updated": len(rows),
+        "versions": {row.task_id: row.version for row in rows},
+    }, 200
+
+
+# タスクの移動(prev_id と next_id の間へ。端へ移動する場合は片方を省略)
+def move_task(session: Session, task_id: int, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    prev_id = data.get("prev_id")
+    next_id = data.get("next_id")
+    version = data.get("version")
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    if prev_id is None and next_id is None:
+        return fail("prev_id または next_id が必要です", 400)
+    invalid = check_ints(data, "prev_id", "next_id", "version")
+    if invalid is not None:
+        return invalid
+    task = _find_task(session, task_id, user_id)
+    if not task:
+        return fail("指定されたタスクが見つかりません", 404)
+    if version is not None and task.version != int(version):
+        return conflict("タスクは他で更新されています", _task_to_dict(task))
+    model = type(task)
+    new_sort = sort_order_for_move(
+        session,
+        model.task_id,
+        model.sort_order,
+        task_id,
+        None if prev_id is None else int(prev_id),
+        None if next_id is None else int(next_id),
+        *_list_criteria(user_id, task.category_id, model is ArchivedTask),
+    )
+    if new_sort is None:
+        return fail("prev_id または next_id が不正です", 400)
+    row = session.execute(
+        update(model)
+        .where(
+            model.task_id == task_id,
+            model.user_id == user_id,
+            *_version_criteria(model, version),
+        )
+        .values(sort_order=new_sort, version=model.version + 1)
+        .returning(*_task_columns(TASK_FIELDS, model))
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return _not_updated(session, task_id, user_id, version)
+    moved = dict(row._mapping)
+    # リバランスした場合はリスト全体の並び順が変わる
+    if session.info.get(REBALANCED):
+        stats.sync_next(session, moved["category_id"], model is ArchivedTask)
+    else:
+        stats.raise_next(session, moved["category_id"], model is ArchivedTask, new_sort)
+    cache.touch_tasks(session, user_id, moved["category_id"])
+    events.record(
+        session,
+        user_id,
+        "task",
+        "update",
+        task_id,
+        category_id=moved["category_id"],
+        sort_order=new_sort,
+        version=moved["version"],
+    )
+    return moved, 200, {"ETag": version_etag(moved["version"])}
+
+
+# 一括操作の 1 件分のエラー結果
+def _batch_error(message: str, status: int) -> dict:
+    return {"ok": False, "status": status, "error": message}
+
+
+# 一括操作の title / content / status の誤り(なければ None)。列の長さを超える値は
+# PostgreSQL ではトランザクション全体のエラーになるため、ここで 1 件分の 400 にする
+def _batch_values_error(op: dict) -> Optional[str]:
+    title = op.get("title")
+    if "title" in op and (not isinstance(title, str) or not title):
+        return "title は空でない文字列で指定してください"
+    if isinstance(title, str) and len(title) > TASK_TITLE_MAX:
+        return f"title は {TASK_TITLE_MAX} 文字以内にしてください"
+    if op.get("content") is not None and not isinstance(op["content"], str):
+        return "content は文字列で指定してください"
+    status = op.get("status")
+    if "status" in op and (not isinstance(status, str) or not status):
+        return "status は空でない文字列で指定してください"
+    if isinstance(status, str) and len(status) > TASK_STATUS_MAX:
+        return f"status は {TASK_STATUS_MAX} 文字以内にしてください"
+    return None
+
+
+# タスクの一括作成・更新・削除(1 トランザクション、操作種別ごとに 1 文)
+def batch_tasks(session: Session, data: dict) -> tuple:
+    user_id = data.get("user_id")
+    operations = data.get("operations")
+    if user_id is None or not isinstance(operations, list):
+        return fail("user_id と operations が必要です", 400)
+    if len(operations) == 0:
+        return fail("operations が空です", 400)
+    if len(operations) > BATCH_LIMIT:
+        return fail(f"operations は {BATCH_LIMIT} 件以下にしてください", 400)
+
+    results: list = [None] * len(operations)
+    creates, patches, deletes = [], {}, {}
+    # 更新・削除で version を指定したタスクの期待するバージョン
+    expected = {}
+    for idx, op in enumerate(operations):
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind == "create":
+            if not op.get("title") or op.get("category_id") is None:
+                results[idx] = _batch_error("title, category_id が必要です", 400)
+                continue
+            message = _batch_values_error(op)
+            if not is_int(op["category_id"]):
+                message = "category_id は整数で指定してください"
+            if message is not None:
+                results[idx] = _batch_error(message, 400)
+                continue
+            creates.append((idx, op))
+        elif kind in ("update", "delete"):
+            task_id = op.get("task_id")
+            if task_id is None:
+                results[idx] = _batch_error("task_id が必要です", 400)
+                continue
+            if not is_int(task_id):
+                results[idx] = _batch_error("task_id は整数で指定してください", 400)
+                continue
+            if task_id in patches or task_id in deletes:
+                results[idx] = _batch_error("同じタスクへの操作が重複しています", 400)
+                continue
+            if op.get("version") is not None:
+                if not is_int(op["version"]):
+                    results[idx] = _batch_error("version は整数で指定してください", 400)
+                    continue
+                expected[task_id] = op["version"]
+            if kind == "delete":
+                deletes[task_id] = idx
+                continue
+            values = {k: op[k] for k in ("title", "content", "status") if k in op}
+            if not values:
+                results[idx] = _batch_error("更新項目がありません", 400)
+                continue
+            message = _batch_values_error(op)
+            if message is not None:
+                results[idx] = _batch_error(message, 400)
+                continue
+            patches[task_id] = (idx, values)
+        else:
+            results[idx] = _batch_error(
+                "op は create, update, delete のいずれかです", 400
+            )
+
+    # 所有確認: カテゴリーは重複を除いて 1 回、既存タスクも 1 回で取得
+    owned = owned_category_ids(
+        session, user_id, (op["category_id"] for _, op in creates)
+    )
+    existing, archived_ids, current_versions, statuses = {}, set(), {}, {}
+    if patches or deletes:
+        ids = list(patches) + list(deletes)
+        rows = session.execute(
+            union_all(
+                *(
+                    select(
+                        model.task_id,
+                        model.category_id,
+                        model.version,
+                        model.status,
+                        literal(model is ArchivedTask).label("archived"),
+                    ).where(
+                        model.user_id == user_id,
+                        model.task_id.in_(ids),
+                        *_visible(model),
+                    )
+                    for model in (Task, ArchivedTask)
+                )
+            )
+        ).all()
+        existing = {row.task_id: row.category_id for row in rows}
+        archived_ids = {row.task_id for row in rows if row.archived}
+        current_versions = {row.task_id: row.version for row in rows}
+        statuses = {row.task_id: row.status for row in rows}
+
+    for idx, op in creates:
+        if int(op["category_id"]) not in owned:
+            results[idx] = _batch_error("指定されたカテゴリーが見つかりません", 404)
+    creates = [(idx, op) for idx, op in creates if results[idx] is None]
+    for task_id in [t for t in patches if t not in existing]:
+        results[patches.pop(task_id)[0]] = _batch_error(
+            "指定されたタスクが見つかりません", 404
+        )
+    for task_id in [t for t in deletes if t not in existing]:
+        results[deletes.pop(task_id)] = _batch_error(
+            "指定されたタスクが見つかりません", 404
+        )
+
+    # バージョンが一致しなかった(読み取り後に他で更新された場合を含む)操作を 409 にする
+    def conflicted(task_id, version=None) -> None:
+        idx = patches.pop(task_id)[0] if task_id in patches else deletes.pop(task_id)
+        results[idx] = _batch_error("タスクは他で更新されています", 409)
+        if version is not None:
+            results[idx]["version"] = version
+
+    # version を指定した行(とステータスを変える行)だけバージョンを比較する条件
+    def version_matches(model, ids):
+        pairs = [(model.task_id == t, guarded[t]) for t in ids if t in guarded]
+        if not pairs:
+            return true()
+        return model.version == case(*pairs, else_=model.version)
+
+    for task_id, version in expected.items():
+        if task_id in existing and current_versions[task_id] != version:
+            conflicted(task_id, current_versions[task_id])
+    # ステータスを変える行は、読んだステータスのままの場合だけ更新する(件数の増減用)
+    guarded = {
+        t: current_versions[t]
+        for t, (_, values) in patches.items()
+        if "status" in values
+    }
+    guarded.update(expected)
+
+    # 並び順: 末尾に追加するリスト(カテゴリー × アーカイブ有無)ごとに
+    # 必要な件数をまとめて払い出す
+    buckets = Counter((int(op["category_id"]), False) for _, op in creates)
+    buckets.update(
+        (existing[t], values["status"] == "archived")
+        for t, (_, values) in patches.items()
+        if "status" in values
+    )
+    next_sort = {
+        (cid, arch): stats.take_sort(session, cid, arch, buckets[(cid, arch)])
+        for cid, arch in sorted(buckets)
+    }
+
+    def take_sort(bucket) -> int:
+        value = next_sort[bucket]
+        next_sort[bucket] = value + SORT_GAP
+        return value
+
+    # アーカイブ済みのタスクは archived_tasks 側で削除・更新する
+    def split(task_ids) -> list:
+        archived = [t for t in task_ids if t in archived_ids]
+        active = [t for t in task_ids if t not in archived_ids]
+        return [
+            (model, ids)
+            for model, ids in ((Task, active), (ArchivedTask, archived))
+            if ids
+        ]
+
+    if deletes:
+        deleted = {}
+        for model, ids in split(deletes):
+            # 未アーカイブは論理削除(実際の削除は deletion.py のワーカー)
+            stmt = delete(model)
+            if model is Task:
+                stmt = update(Task).values(
+                    deleted_at=func.now(), version=Task.version + 1
+                )
+            deleted.update(
+                session.execute(
+                    stmt.where(
+                        model.user_id == user_id,
+                        model.task_id.in_(ids),
+                        version_matches(model, ids),
+                    )
+                    .returning(model.task_id, model.status)
+                    .execution_options(synchronize_session=False)
+                ).all()
+            )
+        for task_id in [t for t in deletes if t not in deleted]:
+            conflicted(task_id)
+        for task_id, idx in deletes.items():
+            results[idx] = {"ok": True, "deleted": True, "task_id": task_id}
+            stats.count(session, existing[task_id], deleted[task_id], -1)
+            events.record(
+                session,
+                user_id,
+                "task",
+                "delete",
+                task_id,
+                category_id=existing[task_id],
+            )
+
+    if patches:
+        for task_id, (_, values) in patches.items():
+            if "status" in values:
+                bucket = (existing[task_id], values["status"] == "archived")
+                values["sort_order"] = take_sort(bucket)
+        rows = []
+        for model, ids in split(patches):
+            columns = {}
+            for name in ("title", "content", "status", "sort_order"):
+                pairs = [
+                    (model.task_id == task_id, patches[task_id][1][name])
+                    for task_id in ids
+                    if name in patches[task_id][1]
+                ]
+                if pairs:
+                    columns[name] = case(*pairs, else_=getattr(model, name))
+            columns["version"] = model.version + 1
+            rows += session.execute(
+                update(model)
+                .where(
+                    model.user_id == user_id,
+                    model.task_id.in_(ids),
+                    version_matches(model, ids),
+                )
+                .values(columns)
+                .returning(*_task_columns(TASK_FIELDS, model))
+                .execution_options(synchronize_session=False)
+            ).all()
+            # ステータスでアーカイブ済み / 未アーカイブが入れ替わった行を移す
+            if model is Task:
+                archive.archive_rows(session, user_id, ids)
+            else:
+                archive.restore_rows(session, user_id, ids)
+        updated = {row.task_id for row in rows}
+        for task_id in [t for t in patches if t not in updated]:
+            conflicted(task_id)
+        for row in rows:
+            results[patches[row.task_id][0]] = {
+                "ok": True,
+                "task": dict(row._mapping),
+            }
+            if "status" in patches[row.task_id][1]:
+                stats.moved(session, row.category_id, statuses[row.task_id], row.status)
+            changed = {
+                TASK_NAMES[name]: row._mapping[TASK_NAMES[name]]
+                for name in patches[row.task_id][1]
+            }
+            events.record(
+                session,
+                user_id,
+                "task",
+                "update",
+                row.task_id,
+                category_id=row.category_id,
+                version=row.version,
+                **changed,
+            )
+
+    if creates:
+        params = [
+            {
+                "title": op["title"],
+                "content": op.get("content", ""),
+                "status": "todo",
+                "user_id": user_id,
+                "category_id": int(op["category_id"]),
+                "sort_order": take_sort((int(op["category_id"]), False)),
+            }
+            for _, op in creates
+        ]
+        rows = session.execute(
+            insert(Task).returning(
+                *_task_columns(TASK_FIELDS), sort_by_parameter_order=True
+            ),
+            params,
+        ).all()
+        for (idx, _), row in zip(creates, rows):
+            results[idx] = {"ok": True, "task": dict(row._mapping)}
+            stats.count(session, row.category_id, row.status)
+            created = {
+                k: v for k, v in row._mapping.items() if k not in ("task_id", "user_id")
+            }
+            events.record(session, user_id, "task", "create", row.task_id, **created)
+
+    cache.touch_tasks(
+        session,
+        user_id,
+        *{int(op["category_id"]) for _, op in creates},
+        *(existing[t] for t in list(patches) + list(deletes)),
+    )
+    # エラーの結果には operations の位置を付ける
+    for idx, result in enumerate(results):
+        if not result["ok"]:
+            result["index"] = idx
+    return {"results": results}, 200
@@ -0,0 +1,440 @@
+import io
+import json
+from typing import Iterable, Iterator
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    MetaData,
+    String,
+    Table,
+    Text,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    union_all,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+import archive
+import cache
+import events
+import stats
+from models import ArchivedTask, Category, Task
+from ordering import SORT_GAP
+from .tasks import TASK_STATUS_MAX, TASK_TITLE_MAX, _visible
+from .utils import fail
+
+# ユーザーのカテゴリー・タスクのエクスポート / インポート(NDJSON、1 行 1 レコード)
+#
+#   {"type": "category", "category_id": 1, "title": "...", "sort_order": 0}
+#   {"type": "task", "task_id": 10, "category_id": 1, "title": "...",
+#    "content": "...", "status": "todo", "sort_order": 0}
+#
+# インポートでは category_id はファイル内の参照としてだけ使い、ID は振り直す。
+# 同じタイトルのカテゴリーが既にあればそこへ追加し、タスクは各リストの末尾に
+# ファイル内の並び順のまま追加する。
+
+# エクスポートで 1 回に取得する行数(サーバーサイドカーソル)
+EXPORT_BATCH = 1000
+
+# COPY を使わないドライバーでステージングに入れる単位
+IMPORT_CHUNK = 1000
+
+CATEGORY_TITLE_MAX = 100
+
+# ステージングの整数列(BIGINT)に入る範囲
+BIGINT_MIN, BIGINT_MAX = -(2**63), 2**63 - 1
+
+# インポート用の一時テーブル(create_all の対象外)
+_staging = Table(
+    "import_staging",
+    MetaData(),
+    Column("line_no", BigInteger, nullable=False),
+    Column("kind", String(16), nullable=False),
+    Column("ref_id", BigInteger),
+    Column("category_ref", BigInteger),
+    Column("title", String(CATEGORY_TITLE_MAX), nullable=False),
+    Column("content", Text),
+    Column("status", String(TASK_STATUS_MAX)),
+    Column("sort_order", BigInteger, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+_STAGING_COLUMNS = [c.name for c in _staging.columns]
+
+
+class InvalidLine(ValueError):
+    """インポートの行が不正"""
+
+    def __init__(self, line_no: int, message: str):
+        super().__init__(f"{line_no} 行目: {message}")
+
+
+# ----- エクスポート -----
+
+
+# エクスポート条件のチェック。user_id または エラー結果を返す
+def parse_export(args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    if user_id is None:
+        return None, fail("user_id が必要です", 400)
+    return user_id, None
+
+
+# 種別ごとのエクスポート用 SELECT(非同期スタックは session.stream で実行する)
+def export_statements(user_id: int) -> list:
+    categories = (
+        select(Category.category_id, Category.title, Category.sort_order)
+        .where(Category.user_id == user_id, Category.deleted_at.is_(None))
+        .order_by(Category.sort_order.asc())
+    )
+    statements = [("category", categories)]
+    # 未アーカイブ(tasks)→ アーカイブ済み(archived_tasks)の順
+    for model in (Task, ArchivedTask):
+        tasks = (
+            select(
+                model.task_id,
+                model.category_id,
+                model.title,
+                model.content,
+                model.status,
+                model.sort_order,
+            )
+            .where(model.user_id == user_id, *_visible(model))
+            .order_by(
+                model.category_id.asc(), model.sort_order.asc(), model.task_id.asc()
+            )
+        )
+        statements.append(("task", tasks))
+    options = {"yield_per": EXPORT_BATCH}
+    return [(kind, stmt.execution_options(**options)) for kind, stmt in statements]
+
+
+# 1 行分の NDJSON
+def to_line(kind: str, row) -> str:
+    return json.dumps({"type": kind, **row._mapping}, ensure_ascii=False) + "\n"
+
+
+# NDJSON を EXPORT_BATCH 行ずつ返す(メモリ使用量は件数に依存しない)
+def export_lines(session: Session, user_id: int) -> Iterator[str]:
+    for kind, stmt in export_statements(user_id):
+        for partition in session.execute(stmt).partitions():
+            yield "".join(to_line(kind, row) for row in partition)
+
+
+# ----- インポート -----
+
+
+def _int(value, line_no: int, name: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise InvalidLine(line_no, f"{name} は整数で指定してください")
+    if not BIGINT_MIN <= value <= BIGINT_MAX:
+        raise InvalidLine(line_no, f"{name} が整数の範囲を超えています")
+    return value
+
+
+def _title(value, line_no: int, limit: int) -> str:
+    if not isinstance(value, str) or not value:
+        raise InvalidLine(line_no, "title が必要です")
+    if len(value) > limit:
+        raise InvalidLine(line_no, f"title は {limit} 文字以内にしてください")
+    return value
+
+
+# NDJSON の行をステージングの行(タプル)に変換する
+def _parse_lines(lines: Iterable) -> Iterator[tuple]:
+    for line_no, raw in enumerate(lines, start=1):
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            raise InvalidLine(line_no, "JSON として読み取れません") from None
+        if not isinstance(record, dict):
+            raise InvalidLine(line_no, "オブジェクトではありません")
+        kind = record.get("type")
+        sort_order = _int(record.get("sort_order", 0), line_no, "sort_order")
+        ref = _int(record.get("category_id"), line_no, "category_id")
+        if kind == "category":
+            title = _title(record.get("title"), line_no, CATEGORY_TITLE_MAX)
+            yield (line_no, kind, ref, None, title, None, None, sort_order)
+        elif kind == "task":
+            title = _title(record.get("title"), line_no, TASK_TITLE_MAX)
+            content = record.get("content") or ""
+            status = record.get("status") or "todo"
+            if not isinstance(content, str) or not isinstance(status, str):
+                raise InvalidLine(line_no, "content と status は文字列です")
+            if len(status) > TASK_STATUS_MAX:
+                raise InvalidLine(
+                    line_no, f"status は {TASK_STATUS_MAX} 文字以内にしてください"
+                )
+            yield (line_no, kind, None, ref, title, content, status, sort_order)
+        else:
+            raise InvalidLine(line_no, "type は category か task です")
+
+
+# 行のイテレーター。不正な行(InvalidLine)を error に残す。COPY はファイル・
+# レコードの読み込み中の例外をドライバーの例外(psycopg2 では QueryCanceled)に
+# 置き換えるため、COPY の失敗後にこれを送出し直す
+class _Rows:
+    def __init__(self, rows: Iterator[tuple]):
+        self._rows = rows
+        self.error = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple:
+        try:
+            return next(self._rows)
+        except InvalidLine as e:
+            self.error = e
+            raise
+
+
+# COPY (FORMAT csv) の 1 行。None は引用符なしの空(NULL)、文字列は常に引用符付き
+def _csv_row(row: tuple) -> str:
+    fields = []
+    for value in row:
+        if value is None:
+            fields.append("")
+        elif isinstance(value, int):
+            fields.append(str(value))
+        else:
+            fields.append('"' + value.replace('"', '""') + '"')
+    return ",".join(fields) + "\n"
+
+
+# 行を CSV にして COPY に渡すファイル風オブジェクト(必要な分だけ読み進める)
+class _CsvReader(io.TextIOBase):
+    def __init__(self, rows: Iterator[tuple]):
+        self._rows = rows
+        self._pending = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._pending]
+        length = len(self._pending)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = _csv_row(row)
+            parts.append(line)
+            length += len(line)
+        data = "".join(parts)
+        if size < 0:
+            size = len(data)
+        self._pending = data[size:]
+        return data[:size]
+
+
+# ステージングへ投入。PostgreSQL では COPY、それ以外は executemany(IMPORT_CHUNK 件ずつ)
+def _load_staging(session: Session, rows: Iterator[tuple]) -> None:
+    connection = session.connection()
+    driver = connection.dialect.driver
+    dbapi_connection = connection.connection.dbapi_connection
+    if driver in ("psycopg2", "asyncpg"):
+        rows = _Rows(rows)
+        try:
+            _copy_staging(driver, dbapi_connection, rows)
+        except Exception:
+            if rows.error is not None:
+                raise rows.error from None
+            raise
+    else:
+        chunk: list = []
+        for row in rows:
+            chunk.append(dict(zip(_STAGING_COLUMNS, row)))
+            if len(chunk) >= IMPORT_CHUNK:
+                session.execute(insert(_staging), chunk)
+                chunk = []
+        if chunk:
+            session.execute(insert(_staging), chunk)
+        return
+    # 一時テーブルは自動で ANALYZE されないため、結合の計画用に統計を取る
+    session.execute(text("ANALYZE import_staging"))
+
+
+# COPY でステージングへ投入(行は読み進めながら送る)
+def _copy_staging(driver: str, dbapi_connection, rows: _Rows) -> None:
+    if driver == "psycopg2":
+        columns = ", ".join(_STAGING_COLUMNS)
+        with dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY import_staging ({columns}) FROM STDIN WITH (FORMAT csv)",
+                _CsvReader(rows),
+            )
+    else:
+        # run_sync の中なので await_only で asyncpg の COPY を待つ
+        await_only(
+            dbapi_connection.driver_connection.copy_records_to_table(
+                "import_staging", records=rows, columns=_STAGING_COLUMNS
+            )
+        )
+
+
+# ステージングの内容をチェックする。問題があればエラーメッセージ
+def _check_staging(session: Session):
+    staged = _staging.c
+    other = _staging.alias("other")
+    duplicate = session.execute(
+        select(staged.line_no)
+        .where(
+            staged.kind == "category",
+            exists().where(
+                other.c.kind == "category",
+                other.c.line_no < staged.line_no,
+                (other.c.ref_id == staged.ref_id) | (other.c.title == staged.title),
+            ),
+        )
+        .limit(1)
+    ).scalar()
+    if duplicate is not None:
+        return f"{duplicate} 行目: category_id または title が重複しています"
+    orphan = session.execute(
+        select(staged.line_no)
+        .where(
+            staged.kind == "task",
+            ~exists().where(
+                other.c.kind == "category", other.c.ref_id == staged.category_ref
+            ),
+        )
+        .limit(1)
+    ).scalar()
+    if orphan is not None:
+        return f"{orphan} 行目: category_id に対応するカテゴリーがありません"
+    return None
+
+
+# ステージングからカテゴリー・タスクを追加し、(カテゴリー数, タスク数, 対象カテゴリー ID) を返す
+def _merge_staging(session: Session, user_id: int) -> tuple:
+    staged = _staging.c
+    # 新しいカテゴリー: 既存の末尾に、ファイル内の並び順で追加
+    max_category = (
+        select(func.coalesce(func.max(Category.sort_order) + SORT_GAP, 0))
+        .where(Category.user_id == user_id)
+        .scalar_subquery()
+    )
+    position = func.row_number().over(order_by=(staged.sort_order, staged.line_no))
+    new_categories = select(
+        staged.title,
+        max_category + (position - 1) * SORT_GAP,
+        user_id,
+    ).where(
+        staged.kind == "category",
+        ~exists().where(
+            Category.user_id == user_id,
+            Category.title == staged.title,
+            Category.deleted_at.is_(None),
+        ),
+    )
+    added_categories = session.execute(
+        insert(Category).from_select(["title", "sort_order", "user_id"], new_categories)
+    ).rowcount
+
+    # タスク: (カテゴリー, アーカイブ有無) のリストごとに既存の末尾へ追加。
+    # いったんすべて tasks に入れ、アーカイブ済みは後で archived_tasks へ移す
+    category_line = _staging.alias("category_line")
+    archived = staged.status == "archived"
+    tails = union_all(
+        *(
+            select(
+                model.category_id,
+                literal(model is ArchivedTask).label("archived"),
+                func.max(model.sort_order).label("max_sort"),
+            )
+            .where(model.user_id == user_id)
+            .group_by(model.category_id)
+            for model in (Task, ArchivedTask)
+        )
+    ).subquery()
+    position = func.row_number().over(
+        partition_by=(Category.category_id, archived),
+        order_by=(staged.sort_order, staged.line_no),
+    )
+    new_tasks = (
+        select(
+            staged.title,
+            staged.content,
+            staged.status,
+            func.coalesce(tails.c.max_sort + SORT_GAP, 0) + (position - 1) * SORT_GAP,
+            user_id,
+            Category.category_id,
+        )
+        .select_from(_staging)
+        .join(
+            category_line,
+            and_(
+                category_line.c.kind == "category",
+                category_line.c.ref_id == staged.category_ref,
+            ),
+        )
+        .join(
+            Category,
+            and_(
+                Category.user_id == user_id,
+                Category.title == category_line.c.title,
+                Category.deleted_at.is_(None),
+            ),
+        )
+        .outerjoin(
+            tails,
+            and_(
+                tails.c.category_id == Category.category_id,
+                tails.c.archived == archived,
+            ),
+        )
+        .where(staged.kind == "task")
+    )
+    added_tasks = session.execute(
+        insert(Task).from_select(
+            ["title", "content", "status", "sort_order", "user_id", "category_id"],
+            new_tasks,
+        )
+    ).rowcount
+    archive.archive_rows(session, user_id)
+
+    category_ids = session.scalars(
+        select(Category.category_id)
+        .join(category_line, Category.title == category_line.c.title)
+        .where(
+            Category.user_id == user_id,
+            Category.deleted_at.is_(None),
+            category_line.c.kind == "category",
+        )
+    ).all()
+    return added_categories, added_tasks, category_ids
+
+
+# NDJSON の行を 1 トランザクションで取り込む(一時テーブル → まとめて INSERT ... SELECT)
+def import_lines(session: Session, lines: Iterable, args) -> tuple:
+    user_id = args.get("user_id", type=int)
+    if user_id is None:
+        return fail("user_id が必要です", 400)
+    connection = session.connection()
+    # DDL がトランザクションに含まれない DB(SQLite)では前回の失敗時の表が残り得る
+    _staging.create(connection, checkfirst=True)
+    session.execute(delete(_staging))
+    try:
+        _load_staging(session, _parse_lines(lines))
+    except InvalidLine as e:
+        session.rollback()
+        return fail(str(e), 400)
+    message = _check_staging(session)
+    if message is not None:
+        session.rollback()
+        return fail(message, 400)
+    added_categories, added_tasks, category_ids = _merge_staging(session, user_id)
+    stats.recompute(session, category_ids)
+    _staging.drop(connection)
+    if added_categories:
+        cache.touch_categories(session, user_id)
+    cache.touch_tasks(session, user_id, *category_ids)
+    events.record_reload(session, user_id)
+    return {"categories": added_categories, "tasks": added_tasks}, 200
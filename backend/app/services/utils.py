@@ -0,0 +1,188 @@
+import base64
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import tokens
+from models import Category, ReorderSequence
+from ordering import sort_order_at
+
+# 並び替えの client の最大文字数
+REORDER_CLIENT_MAX = 64
+
+
+# 共通のエラー結果(api.utils.error のサービス版)
+def fail(message: str, status: int) -> tuple:
+    return {"error": message}, status
+
+
+# JSON の整数か(true / false は除く)
+def is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# 省略できる整数のパラメータ(version, prev_id など)のうち整数でないものがあれば
+# 400 の結果を返す(なければ None)
+def check_ints(data: dict, *names: str) -> Optional[tuple]:
+    invalid = [name for name in names if data.get(name) is not None]
+    invalid = [name for name in invalid if not is_int(data[name])]
+    if invalid:
+        return fail(f"{', '.join(invalid)} は整数で指定してください", 400)
+    return None
+
+
+# 行のバージョンの ETag(単一のタスク・カテゴリーのレスポンスに付ける)
+def version_etag(version) -> str:
+    return f'"v{int(version)}"'
+
+
+# If-Match ヘッダーから比較するバージョンを取り出す。ヘッダーなし・* は None、
+# バージョンとして読めない値は 0(どの行とも一致しない)
+def parse_if_match(header: Optional[str]) -> Optional[int]:
+    if header is None or header.strip() in ("", "*"):
+        return None
+    tag = header.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    if tag.startswith("v") and tag[1:].isdigit():
+        return int(tag[1:])
+    return int(tag) if tag.isdigit() else 0
+
+
+# 更新の競合(バージョン不一致)。現在の状態と、その ETag を返す
+def conflict(message: str, current: dict) -> tuple:
+    return (
+        {"error": message, "current": current},
+        409,
+        {"ETag": version_etag(current["version"])},
+    )
+
+
+# 並び替えの versions({"ID": バージョン})を読む。ordered_ids のすべてが必要
+def parse_versions(versions, ids) -> Optional[dict]:
+    if not isinstance(versions, dict):
+        return None
+    try:
+        parsed = {int(k): int(v) for k, v in versions.items()}
+    except (TypeError, ValueError):
+        return None
+    if any(i not in parsed for i in ids):
+        return None
+    return parsed
+
+
+# より新しい並び替えを受け付け済みの場合の結果
+def stale_reorder() -> tuple:
+    return {"error": "より新しい並び替えを受け付け済みです", "stale": True}, 409
+
+
+# 並び替えの seq・client の値が不正ならエラーの結果(seq がなければ None)
+def _reorder_seq_error(data: dict) -> Optional[tuple]:
+    seq, client = data.get("seq"), data.get("client") or ""
+    if seq is None:
+        return None
+    if not is_int(seq) or seq < 0:
+        return fail("seq は 0 以上の整数で指定してください", 400)
+    if not isinstance(client, str) or len(client) > REORDER_CLIENT_MAX:
+        return fail(f"client は {REORDER_CLIENT_MAX} 文字以内の文字列です", 400)
+    return None
+
+
+# 並び替えの入力(user_id, names, ordered_ids, versions, seq, client)を検証する。
+# (エラーの結果, {ID: sort_order}, versions)を返し、正しければエラーは None。
+# まとめ書き(coalesce)では、不正な要求が他の要求に代わらないようまとめる前にも呼ぶ
+def parse_reorder(data: dict, *names: str) -> tuple:
+    required = ("user_id", *names, "ordered_ids")
+    ordered_ids = data.get("ordered_ids")
+    if any(data.get(n) is None for n in required) or not isinstance(ordered_ids, list):
+        return fail(f"{', '.join(required)} が必要です", 400), None, None
+    if len(ordered_ids) == 0:
+        return fail("ordered_ids が空です", 400), None, None
+    try:
+        mapping = {int(i): sort_order_at(idx) for idx, i in enumerate(ordered_ids)}
+    except (TypeError, ValueError):
+        return fail("ordered_ids は ID の配列で指定してください", 400), None, None
+    versions = data.get("versions")
+    if versions is not None:
+        versions = parse_versions(versions, mapping)
+        if versions is None:
+            error = fail(
+                "versions には ordered_ids のすべてのバージョンが必要です", 400
+            )
+            return error, None, None
+    return _reorder_seq_error(data), mapping, versions
+
+
+# 並び替えの seq(同じ client の中で増やす整数)を記録する。category_id は
+# カテゴリーの並び替えでは 0。seq がなければ何もせず None。不正な値や、同じ
+# client のそれ以上の seq を受け付け済みならエラーの結果を返す。
+# 行はクライアントごとで、他のクライアントの seq とは比べない。
+# 記録した行はコミットまでロックされ、同じクライアントの並び替えは順番になる
+def claim_reorder_seq(session: Session, user_id, category_id, data: dict):
+    seq, client = data.get("seq"), data.get("client") or ""
+    if seq is None:
+        return None
+    error = _reorder_seq_error(data)
+    if error is not None:
+        return error
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(ReorderSequence).values(
+        user_id=user_id, category_id=category_id, client=client, seq=seq
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            ReorderSequence.user_id,
+            ReorderSequence.category_id,
+            ReorderSequence.client,
+        ],
+        set_={"seq": stmt.excluded.seq},
+        where=ReorderSequence.seq < stmt.excluded.seq,
+    )
+    if session.execute(stmt.returning(ReorderSequence.seq)).first() is None:
+        return stale_reorder()
+    return None
+
+
+# キーセットページングのカーソル(最後の行のキー)を文字列に変換
+def encode_cursor(*values) -> str:
+    raw = ":".join(str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+# カーソル文字列をキーに戻す。不正な場合は None
+def decode_cursor(cursor: str, size: int = 2) -> Optional[tuple]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = tuple(
+            int(v) for v in base64.urlsafe_b64decode(padded).decode().split(":")
+        )
+    except ValueError:
+        return None
+    return values if len(values) == size else None
+
+
+# category_ids のうちユーザーの(削除待ちでない)カテゴリーの ID。
+# トークンのカテゴリー一覧にあるものは DB を読まない
+def owned_category_ids(session: Session, user_id, category_ids) -> set:
+    category_ids = {int(cid) for cid in category_ids}
+    owned = category_ids & (tokens.owned_categories(session, user_id) or set())
+    # トークンにないもの(発行後に作ったカテゴリーなど)だけ DB で確認する
+    rest = category_ids - owned
+    if not rest:
+        return owned
+    return owned | set(
+        session.scalars(
+            select(Category.category_id).where(
+                Category.user_id == user_id,
+                Category.category_id.in_(rest),
+                Category.deleted_at.is_(None),
+            )
+        )
+    )
+
+
+# カテゴリーの所有確認
+def owns_category(session: Session, user_id, category_id) -> bool:
+    return bool(owned_category_ids(session, user_id, [category_id]))
@@ -0,0 +1,389 @@
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Optional
+from config import Config
+
+# user_id のハッシュによるシャーディング(SHARD_MAP を指定した場合だけ有効)。
+#
+# シャードマップ(JSON)は user_id のハッシュで決まるバケット(既定 64 個)ごとに
+# 担当のシャードを持つ。ユーザーの行(categories・tasks・archived_tasks と users の
+# 写し)は担当のシャードにだけ置き、DATABASE_URL(ディレクトリ)は users
+# (ログインと user_id の採番)を受け持つ。ディレクトリ自身をシャードの 1 つにしてもよい。
+# 各プロセスはファイルの更新を SHARD_MAP_RELOAD_SECONDS ごとに確認して読み直す。
+# 移動中(moving)のバケットのユーザーは、読み取りは移動元で行い、更新は 503 にする。
+#
+#     python app/sharding.py init s0=postgresql://.../todo_s0 s1=postgresql://.../todo_s1
+#     python app/sharding.py add s2=postgresql://.../todo_s2
+#     python app/sharding.py rebalance [--drain s0]
+#     python app/sharding.py status
+
+# シャードごとの ID の範囲の幅。categories・tasks の連番をシャードごとにずらしておき、
+# ユーザーを別のシャードへ移しても ID が重ならないようにする(PostgreSQL のみ)
+ID_SPAN = 10**12
+
+# シャードの users に置く写しのパスワードハッシュ(ログインはディレクトリで行う)
+NO_PASSWORD = "!"
+
+
+MOVING_MESSAGE = "データを移動中です。しばらくしてから再度お試しください"
+MOVING_RETRY_AFTER = 5
+
+
+# 移動中のバケットのユーザーを更新しようとした(API は 503 + Retry-After)
+class Moving(Exception):
+    pass
+
+
+class ShardMap:
+    def __init__(self, data: dict):
+        self.buckets = data["buckets"]
+        # シャード名 -> {"url": ..., "id_base": ...}
+        self.shards = data["shards"]
+        # バケット -> シャード名
+        self.assignment = data["map"]
+        # 移動中のバケット -> 移動先のシャード名
+        self.moving = {int(b): name for b, name in data.get("moving", {}).items()}
+
+    def bucket(self, user_id) -> int:
+        return zlib.crc32(str(int(user_id)).encode()) % self.buckets
+
+    def shard_for(self, user_id) -> str:
+        return self.assignment[self.bucket(user_id)]
+
+    def url(self, name: str) -> str:
+        return self.shards[name]["url"]
+
+    def check_writable(self, user_id) -> None:
+        if self.bucket(user_id) in self.moving:
+            raise Moving(user_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": self.buckets,
+            "shards": self.shards,
+            "map": self.assignment,
+            "moving": {str(b): name for b, name in sorted(self.moving.items())},
+        }
+
+
+_lock = threading.Lock()
+_map: Optional[ShardMap] = None
+_mtime = None
+_checked_at = 0.0
+
+
+def enabled() -> bool:
+    return bool(Config.SHARD_MAP)
+
+
+def load(path: str) -> ShardMap:
+    with open(path, encoding="utf-8") as f:
+        return ShardMap(json.load(f))
+
+
+# 一時ファイルに書いてから置き換える(読み込み中のプロセスに途中の内容を見せない)
+def save(path: str, shard_map: ShardMap) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(shard_map.to_dict(), f, indent=2)
+    os.replace(tmp, path)
+
+
+# 現在のシャードマップ(無効なら None)。ファイルが更新されていれば読み直す
+def current() -> Optional[ShardMap]:
+    global _map, _mtime, _checked_at
+    if not Config.SHARD_MAP:
+        return None
+    now = time.monotonic()
+    with _lock:
+        if _map is None or now - _checked_at >= Config.SHARD_MAP_RELOAD_SECONDS:
+            _checked_at = now
+            mtime = os.stat(Config.SHARD_MAP).st_mtime_ns
+            if mtime != _mtime:
+                _map, _mtime = load(Config.SHARD_MAP), mtime
+        return _map
+
+
+# ----- 管理コマンド -----
+
+CHUNK = 1000
+
+
+def _chunks(values: list):
+    for i in range(0, len(values), CHUNK):
+        yield values[i : i + CHUNK]
+
+
+def _moved_models(url: str) -> list:
+    from models import (
+        ArchivedTask,
+        Category,
+        CategoryStats,
+        ReorderSequence,
+        Task,
+        User,
+    )
+
+    # ディレクトリの users は本体のため、コピー・削除の対象にしない
+    models = [Category, CategoryStats, Task, ArchivedTask, ReorderSequence]
+    if url == Config.DATABASE_URL:
+        return models
+    return [User, *models]
+
+
+# シャードのスキーマを作成し、categories・tasks の連番を id_base 以降にする
+def _prepare(url: str, id_base: int) -> None:
+    from sqlalchemy import text
+    from database import create_tables, engine_for, wait_for_db
+    from migrate import migrate
+
+    engine = engine_for(url)
+    wait_for_db(url=url)
+    create_tables(engine)
+    migrate(engine)
+    if id_base == 0:
+        return
+    if engine.dialect.name != "postgresql":
+        print(f"[sharding.py] {engine.url}: ID の範囲は PostgreSQL でのみ予約できます")
+        return
+    with engine.begin() as conn:
+        for table, column in (("categories", "category_id"), ("tasks", "task_id")):
+            seq = conn.scalar(
+                text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": table, "c": column}
+            )
+            conn.execute(
+                text(f"SELECT setval('{seq}', GREATEST(:base, last_value)) FROM {seq}"),
+                {"base": id_base},
+            )
+
+
+# シャードの users をバケットごとに分ける
+def _users_by_bucket(shard_map: ShardMap, url: str) -> dict:
+    from sqlalchemy import select
+    from database import engine_for
+    from models import User
+
+    users: dict = {}
+    with engine_for(url).connect() as conn:
+        for user_id in conn.scalars(select(User.user_id)):
+            users.setdefault(shard_map.bucket(user_id), []).append(user_id)
+    return users
+
+
+# 移動先に同じ ID の行があるか(移動するユーザーの行は先に消してある)
+def _taken(dst, columns: tuple, ids: list) -> bool:
+    from sqlalchemy import select
+
+    for chunk in _chunks(ids):
+        for column in columns:
+            if dst.scalar(select(column).where(column.in_(chunk)).limit(1)):
+                return True
+    return False
+
+
+# ユーザーの行を移動元から移動先へコピーする(移動先の同じユーザーの行は先に消す)
+def _copy(source_url: str, target_url: str, user_ids: list) -> int:
+    from sqlalchemy import delete, insert, select
+    from database import engine_for
+    from models import ArchivedTask, Category, Task, User
+
+    source, target = engine_for(source_url), engine_for(target_url)
+    models = _moved_models(target_url)
+    copied = 0
+    with source.connect() as src, target.begin() as dst:
+        for chunk in _chunks(user_ids):
+            for model in reversed(models):
+                dst.execute(delete(model).where(model.user_id.in_(chunk)))
+        for chunk in _chunks(user_ids):
+            category_ids = list(
+                src.scalars(
+                    select(Category.category_id).where(Category.user_id.in_(chunk))
+                )
+            )
+            task_ids = list(
+                src.scalars(select(Task.task_id).where(Task.user_id.in_(chunk)))
+            ) + list(
+                src.scalars(
+                    select(ArchivedTask.task_id).where(ArchivedTask.user_id.in_(chunk))
+                )
+            )
+            if _taken(dst, (Category.category_id,), category_ids) or _taken(
+                dst, (Task.task_id, ArchivedTask.task_id), task_ids
+            ):
+                raise RuntimeError(
+                    "移動先に同じ ID の行があります(ID の範囲が重なっています)"
+                )
+            for model in models:
+                result = src.execution_options(stream_results=True).execute(
+                    select(model.__table__).where(model.user_id.in_(chunk))
+                )
+                for rows in result.partitions(CHUNK):
+                    values = [dict(row._mapping) for row in rows]
+                    if model is User:
+                        for value in values:
+                            value["password_hash"] = NO_PASSWORD
+                    dst.execute(insert(model.__table__), values)
+                    copied += len(values)
+    return copied
+
+
+# 移動し終えたユーザーの行を移動元から削除する
+def _purge(source_url: str, user_ids: list) -> None:
+    from sqlalchemy import delete
+    from database import engine_for
+
+    with engine_for(source_url).begin() as conn:
+        for chunk in _chunks(user_ids):
+            for model in reversed(_moved_models(source_url)):
+                conn.execute(delete(model).where(model.user_id.in_(chunk)))
+
+
+# バケットの割り当てを均す移動計画(バケット -> 移動先)。drain のシャードは空にする
+def plan(shard_map: ShardMap, drain: tuple = ()) -> dict:
+    names = [name for name in shard_map.shards if name not in drain]
+    if not names:
+        raise ValueError("移動先のシャードがありません")
+    base, extra = divmod(shard_map.buckets, len(names))
+    quota = {name: base + (1 if i < extra else 0) for i, name in enumerate(names)}
+    counts = Counter(shard_map.assignment)
+    moves = {}
+    for bucket, name in enumerate(shard_map.assignment):
+        if counts[name] <= quota.get(name, 0):
+            continue
+        target = min(names, key=lambda n: counts[n] - quota[n])
+        if counts[target] >= quota[target]:
+            break
+        moves[bucket] = target
+        counts[name] -= 1
+        counts[target] += 1
+    return moves
+
+
+# バケットを 1 つ移す。更新を止めて(moving)から対象のユーザーを数えてコピーし、
+# 割り当てを切り替えてから消す。各段階の後に settle 秒待ち、全プロセスが
+# 新しいマップを読み込むのを待つ
+def move_bucket(path: str, bucket: int, target: str, settle: float) -> int:
+    shard_map = load(path)
+    source = shard_map.assignment[bucket]
+    source_url, target_url = shard_map.url(source), shard_map.url(target)
+    shard_map.moving[bucket] = target
+    save(path, shard_map)
+    time.sleep(settle)
+    try:
+        # 移動中の間はバケットのユーザーを登録できない(写しを作る更新が Moving になる)
+        # ため、全プロセスが移動中を読み込んだ後に数えれば、直前の登録も漏れない
+        user_ids = _users_by_bucket(shard_map, source_url).get(bucket, [])
+        copied = _copy(source_url, target_url, user_ids)
+    except Exception:
+        shard_map.moving.pop(bucket)
+        save(path, shard_map)
+        raise
+    shard_map.assignment[bucket] = target
+    shard_map.moving.pop(bucket)
+    save(path, shard_map)
+    time.sleep(settle)
+    _purge(source_url, user_ids)
+    print(
+        f"[sharding.py] bucket {bucket}: {source} -> {target}, "
+        f"{len(user_ids)} user(s), {copied} row(s)"
+    )
+    return len(user_ids)
+
+
+def _parse_shards(specs: list) -> list:
+    shards = []
+    for spec in specs:
+        name, sep, url = spec.partition("=")
+        if not sep or not name or not url:
+            raise SystemExit(f"NAME=URL の形式で指定してください: {spec}")
+        shards.append((name, url))
+    return shards
+
+
+def _status(path: str) -> None:
+    shard_map = load(path)
+    counts = Counter(shard_map.assignment)
+    for name in shard_map.shards:
+        users = _users_by_bucket(shard_map, shard_map.url(name))
+        homed = sum(
+            len(ids)
+            for bucket, ids in users.items()
+            if shard_map.assignment[bucket] == name
+        )
+        print(f"{name}: {counts[name]} bucket(s), {homed} user(s)")
+    for bucket, name in sorted(shard_map.moving.items()):
+        print(f"moving: bucket {bucket} -> {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="シャードマップの作成と再配置")
+    parser.add_argument("--map", default=Config.SHARD_MAP, help="シャードマップのパス")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init = sub.add_parser("init", help="シャードマップを作成する")
+    init.add_argument("shards", nargs="+", metavar="NAME=URL")
+    init.add_argument("--buckets", type=int, default=64)
+    add = sub.add_parser("add", help="シャードを追加する(バケットは rebalance で移す)")
+    add.add_argument("shards", nargs="+", metavar="NAME=URL")
+    rebalance = sub.add_parser("rebalance", help="バケットをシャード間で均等にする")
+    rebalance.add_argument("--drain", action="append", default=[], metavar="NAME")
+    rebalance.add_argument(
+        "--settle",
+        type=float,
+        default=Config.SHARD_MAP_RELOAD_SECONDS + Config.WEB_TIMEOUT,
+        help="マップの更新後に待つ秒数",
+    )
+    rebalance.add_argument("--dry-run", action="store_true")
+    sub.add_parser("status", help="シャードごとのバケット数・ユーザー数")
+    args = parser.parse_args()
+    if not args.map:
+        parser.error("SHARD_MAP または --map でシャードマップのパスを指定してください")
+
+    if args.command == "init":
+        if os.path.exists(args.map):
+            parser.error(f"{args.map} は既にあります(追加は add)")
+        shards = _parse_shards(args.shards)
+        names = [name for name, _ in shards]
+        shard_map = ShardMap(
+            {
+                "buckets": args.buckets,
+                "shards": {
+                    name: {"url": url, "id_base": i * ID_SPAN}
+                    for i, (name, url) in enumerate(shards)
+                },
+                "map": [names[b % len(names)] for b in range(args.buckets)],
+            }
+        )
+        for name in names:
+            _prepare(shard_map.url(name), shard_map.shards[name]["id_base"])
+        save(args.map, shard_map)
+        print(f"[sharding.py] wrote {args.map} ({len(names)} shard(s))")
+    elif args.command == "add":
+        shard_map = load(args.map)
+        for name, url in _parse_shards(args.shards):
+            if name in shard_map.shards:
+                parser.error(f"シャード {name} は既にあります")
+            id_base = max(s["id_base"] for s in shard_map.shards.values()) + ID_SPAN
+            _prepare(url, id_base)
+            shard_map.shards[name] = {"url": url, "id_base": id_base}
+        save(args.map, shard_map)
+        print(f"[sharding.py] added {len(args.shards)} shard(s)")
+    elif args.command == "rebalance":
+        moves = plan(load(args.map), tuple(args.drain))
+        print(f"[sharding.py] {len(moves)} bucket(s) to move")
+        if args.dry_run:
+            for bucket, target in sorted(moves.items()):
+                print(f"bucket {bucket} -> {target}")
+            return
+        for bucket, target in sorted(moves.items()):
+            move_bucket(args.map, bucket, target, args.settle)
+    else:
+        _status(args.map)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import argparse
+from typing import Iterable, Optional
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+from models import ArchivedTask, Category, CategoryStats, Task
+from ordering import SORT_GAP, next_sort_order
+
+# カテゴリーごとのタスク数(ステータス別)と末尾の並び順(category_stats)。
+#
+# タスクを追加・変更・削除するサービス関数は count() で件数の増減をセッションに
+# 記録し、コミットの直前にカテゴリーごとに 1 文の UPDATE でまとめて反映する
+# (ロールバックしたら捨てる)。末尾に追加するタスクの並び順は take_sort() の
+# UPDATE ... RETURNING 1 文で払い出し、MAX(sort_order) は読まない
+# (同じカテゴリーへの同時の追加はこの行のロックで順番になる)。
+# 件数がずれた場合(マイグレーション直後など)は python app/stats.py で数え直す。
+
+# ステータスと件数の列の対応(それ以外のステータスは other)
+STATUS_COLUMNS = {
+    "todo": "todo",
+    "doing": "doing",
+    "done": "done",
+    "archived": "archived",
+}
+COUNT_COLUMNS = ("todo", "doing", "done", "other", "archived")
+SORT_COLUMNS = ("next_sort", "next_archived_sort")
+
+# 数え直すカテゴリーの 1 トランザクションあたりの件数
+REPAIR_BATCH = 500
+
+_COUNTED = "stats_counted"
+
+
+def column_for(status: Optional[str]) -> str:
+    return STATUS_COLUMNS.get(status, "other")
+
+
+# API の counts(GET /categories?with_counts=1・GET /board で同じ形)。
+# COUNT_COLUMNS を 0 も含めて返す(other は 0 以外のときだけ)
+def counts_of(values: dict) -> dict:
+    return {
+        name: values.get(name) or 0
+        for name in COUNT_COLUMNS
+        if name != "other" or values.get(name)
+    }
+
+
+def _sort_column(archived: bool):
+    return CategoryStats.next_archived_sort if archived else CategoryStats.next_sort
+
+
+# カテゴリーの status のタスク数の増減をセッションに記録する(コミット直前に反映)
+def count(session: Session, category_id, status: Optional[str], delta: int = 1) -> None:
+    counted = session.info.setdefault(_COUNTED, {})
+    key = (int(category_id), column_for(status))
+    counted[key] = counted.get(key, 0) + delta
+
+
+# ステータスを old から new に変えたタスクの件数の増減
+def moved(session: Session, category_id, old: Optional[str], new: Optional[str]):
+    if column_for(old) != column_for(new):
+        count(session, category_id, old, -1)
+        count(session, category_id, new)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_before_commit(session: Session) -> None:
+    counted = session.info.pop(_COUNTED, None)
+    if not counted:
+        return
+    deltas: dict = {}
+    for (category_id, column), delta in counted.items():
+        if delta:
+            deltas.setdefault(category_id, {})[column] = delta
+    # 行ロックの順序をそろえるため category_id の順に更新する
+    for category_id in sorted(deltas):
+        session.execute(
+            update(CategoryStats)
+            .where(CategoryStats.category_id == category_id)
+            .values(
+                {
+                    column: getattr(CategoryStats, column) + delta
+                    for column, delta in deltas[category_id].items()
+                }
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_COUNTED, None)
+
+
+# 追加したカテゴリーの行(タスクなし)を作る
+def create(session: Session, category_id: int, user_id) -> None:
+    session.execute(
+        insert(CategoryStats).values(category_id=category_id, user_id=user_id)
+    )
+
+
+# カテゴリーのリスト(archived で選ぶ)の末尾に n 件分の並び順を払い出し、
+# 先頭の並び順を返す(n 件目は先頭 + (n - 1) * SORT_GAP)
+def take_sort(session: Session, category_id, archived: bool = False, n: int = 1) -> int:
+    column = _sort_column(archived)
+    stmt = (
+        update(CategoryStats)
+        .where(CategoryStats.category_id == category_id)
+        .values({column.key: column + n * SORT_GAP})
+        .returning(column - n * SORT_GAP)
+        .execution_options(synchronize_session=False)
+    )
+    first = session.execute(stmt).scalar()
+    if first is None:
+        # 行がない(マイグレーション前に作られたなど)場合は数えて作る
+        recompute(session, [category_id])
+        first = session.execute(stmt).scalar_one()
+    return first
+
+
+# sort_order の位置に置いたタスクより後ろから払い出すようにする(並び替え・移動の後)
+def raise_next(session: Session, category_id, archived: bool, sort_order: int) -> None:
+    column = _sort_column(archived)
+    session.execute(
+        update(CategoryStats)
+        .where(
+            CategoryStats.category_id == category_id,
+            column < sort_order + SORT_GAP,
+        )
+        .values({column.key: sort_order + SORT_GAP})
+        .execution_options(synchronize_session=False)
+    )
+
+
+# リストの現在の末尾から払い出すようにする(リバランス・詰め直しの後)
+def sync_next(session: Session, category_id, archived: bool) -> None:
+    model = ArchivedTask if archived else Task
+    criteria = [model.category_id == category_id]
+    if not archived:
+        criteria.append(Task.deleted_at.is_(None))
+    max_sort = select(func.max(model.sort_order)).where(*criteria).scalar_subquery()
+    session.execute(
+        update(CategoryStats)
+        .where(CategoryStats.category_id == category_id)
+        .values({_sort_column(archived).key: func.coalesce(max_sort + SORT_GAP, 0)})
+        .execution_options(synchronize_session=False)
+    )
+
+
+# タスクから数えた件数と末尾の並び順(category_id -> 列名 -> 値)
+def _actual(session: Session, category_ids: list) -> dict:
+    actual = {
+        row.category_id: dict(
+            {name: 0 for name in COUNT_COLUMNS + SORT_COLUMNS}, user_id=row.user_id
+        )
+        for row in session.execute(
+            select(Category.category_id, Category.user_id).where(
+                Category.category_id.in_(category_ids)
+            )
+        )
+    }
+    active = session.execute(
+        select(
+            Task.category_id,
+            Task.status,
+            func.count().label("n"),
+            func.max(Task.sort_order).label("max_sort"),
+        )
+        .where(Task.category_id.in_(category_ids), Task.deleted_at.is_(None))
+        .group_by(Task.category_id, Task.status)
+    )
+    for row in active:
+        values = actual[row.category_id]
+        values[column_for(row.status)] += row.n
+        values["next_sort"] = max(values["next_sort"], next_sort_order(row.max_sort))
+    archived = session.execute(
+        select(
+            ArchivedTask.category_id,
+            func.count().label("n"),
+            func.max(ArchivedTask.sort_order).label("max_sort"),
+        )
+        .where(ArchivedTask.category_id.in_(category_ids))
+        .group_by(ArchivedTask.category_id)
+    )
+    for row in archived:
+        values = actual[row.category_id]
+        values["archived"] += row.n
+        values["next_archived_sort"] = next_sort_order(row.max_sort)
+    return actual
+
+
+# カテゴリーの件数と末尾の並び順をタスクから数え直し、ずれを
+# {"category_id", "column", "stored", "actual"} のリストで返す(dry_run なら直さない)。
+# 並び順は払い出し済みの位置より前に戻さないため、末尾より小さい場合だけずれとする
+def recompute(session: Session, category_ids: Iterable, dry_run: bool = False) -> list:
+    category_ids = sorted({int(cid) for cid in category_ids})
+    if not category_ids:
+        return []
+    # 先に行をロックし、コミット前の他のトランザクションの増減と重ならないようにする
+    stored = {
+        row.category_id: row
+        for row in session.scalars(
+            select(CategoryStats)
+            .where(CategoryStats.category_id.in_(category_ids))
+            .order_by(CategoryStats.category_id)
+            .with_for_update()
+        )
+    }
+    drift = []
+    for category_id, values in _actual(session, category_ids).items():
+        row = stored.get(category_id)
+        changed = {}
+        for name in COUNT_COLUMNS + SORT_COLUMNS:
+            current = None if row is None else getattr(row, name)
+            if current is None:
+                changed[name] = values[name]
+            elif name in SORT_COLUMNS:
+                if current < values[name]:
+                    changed[name] = values[name]
+            elif current != values[name]:
+                changed[name] = values[name]
+            if name in changed:
+                drift.append(
+                    {
+                        "category_id": category_id,
+                        "column": name,
+                        "stored": current,
+                        "actual": values[name],
+                    }
+                )
+        if dry_run or not changed:
+            continue
+        if row is None:
+            session.execute(
+                insert(CategoryStats).values(category_id=category_id, **values)
+            )
+        else:
+            session.execute(
+                update(CategoryStats)
+                .where(CategoryStats.category_id == category_id)
+                .values(changed)
+                .execution_options(synchronize_session=False)
+            )
+    return drift
+
+
+# 接続先(シャード)のすべてのカテゴリーを REPAIR_BATCH 件ずつ数え直す
+def repair(dry_run: bool = False, user_id: Optional[int] = None) -> list:
+    from database import session_scope
+
+    drift, after = [], 0
+    while True:
+        with session_scope() as session:
+            stmt = (
+                select(Category.category_id)
+                .where(Category.category_id > after)
+                .order_by(Category.category_id)
+                .limit(REPAIR_BATCH)
+            )
+            if user_id is not None:
+                stmt = stmt.where(Category.user_id == user_id)
+            category_ids = session.scalars(stmt).all()
+            if not category_ids:
+                return drift
+            drift += recompute(session, category_ids, dry_run=dry_run)
+        after = category_ids[-1]
+
+
+def main() -> None:
+    import routing
+
+    parser = argparse.ArgumentParser(
+        description="カテゴリーごとのタスク数と末尾の並び順の数え直し"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="ずれを表示するだけで直さない"
+    )
+    parser.add_argument("--user-id", type=int, help="このユーザーのカテゴリーだけ")
+    args = parser.parse_args()
+    total = 0
+    for name in routing.shard_names():
+        with routing.use_shard(name):
+            drift = repair(args.dry_run, args.user_id)
+        for d in drift:
+            print(
+                f"[stats.py] {name or 'default'}: category {d['category_id']} "
+                f"{d['column']}: {d['stored']} -> {d['actual']}"
+            )
+        total += len(drift)
+    action = "found" if args.dry_run else "fixed"
+    print(f"[stats.py] {action} {total} drifted value(s)")
+    if args.dry_run and total:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+from sqlalchemy.orm import Session
+import cache
+from config import Config
+
+# 署名付きアクセストークン(HMAC-SHA256、鍵は Config.SECRET_KEY)。
+# 形式は "<base64url(JSON)>.<base64url(署名)>"。検証に DB は使わない。
+#
+# クレーム:
+#   uid / name / email  ... ユーザー情報(/auth/me はここから返す)
+#   exp                 ... 有効期限(UNIX 秒)
+#   cats / cv           ... 発行時の所有カテゴリー ID とカテゴリーのキャッシュバージョン。
+#                           cv が現在のバージョンと一致する間は、所有確認の SELECT を省略する
+
+_PRINCIPAL = "auth_principal"
+# 先に読んでおいたカテゴリーのキャッシュバージョン(非同期スタック。session.info のキー)
+_CATEGORIES_VERSION = "auth_categories_version"
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    key = Config.SECRET_KEY.encode()
+    return _b64encode(hmac.new(key, payload.encode(), hashlib.sha256).digest())
+
+
+# トークンを発行する
+def issue(user: dict, category_ids: Optional[list], categories_version: str) -> str:
+    claims = {
+        "uid": user["user_id"],
+        "name": user["name"],
+        "email": user["email"],
+        "exp": int(time.time()) + Config.TOKEN_TTL_SECONDS,
+    }
+    if category_ids is not None and len(category_ids) <= Config.TOKEN_MAX_CATEGORIES:
+        claims["cats"] = sorted(category_ids)
+        claims["cv"] = categories_version
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+# 署名と有効期限を検証し、クレームを返す。不正なら None
+def verify(token: str) -> Optional[dict]:
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+# Authorization ヘッダーと、リクエストで指定された user_id から利用者を決める。
+# (クレーム or None, エラー結果 or None) を返す。トークンなしは
+# AUTH_REQUIRE_TOKEN が False の間だけ従来どおり user_id を信用する
+def resolve(authorization: Optional[str], claimed_user_id) -> tuple:
+    if not authorization:
+        if Config.AUTH_REQUIRE_TOKEN:
+            return None, ({"error": "認証が必要です"}, 401)
+        return None, None
+    scheme, _, token = authorization.partition(" ")
+    claims = verify(token.strip()) if scheme.lower() == "bearer" else None
+    if claims is None:
+        return None, ({"error": "トークンが不正か期限切れです"}, 401)
+    if claimed_user_id is not None and str(claimed_user_id) != str(claims["uid"]):
+        return None, ({"error": "user_id がトークンと一致しません"}, 403)
+    return claims, None
+
+
+# リクエストの利用者をセッションに紐づける(サービス側の所有確認で使う)
+def bind(session: Session, claims: Optional[dict]) -> None:
+    if claims is not None:
+        session.info[_PRINCIPAL] = claims
+
+
+# ユーザーのカテゴリーの現在のキャッシュバージョンをセッションに置く。非同期スタックは
+# キャッシュ(redis)をスレッドで読んでからこれを呼び、イベントループ上で読まない
+def bind_categories_version(session: Session, user_id: int, version: str) -> None:
+    session.info[_CATEGORIES_VERSION] = (int(user_id), version)
+
+
+# カテゴリーの現在のキャッシュバージョン(セッションに置いたものがあればそれ)
+def categories_version(session: Session, user_id: int) -> str:
+    bound = session.info.get(_CATEGORIES_VERSION)
+    if bound is not None and bound[0] == int(user_id):
+        return bound[1]
+    return cache.version(cache.categories_scope(user_id))
+
+
+# セッションに紐づいた利用者のクレーム
+def principal(session: Session) -> Optional[dict]:
+    return session.info.get(_PRINCIPAL)
+
+
+# トークンのカテゴリー一覧が最新なら、そのカテゴリー ID の集合を返す。
+# キャッシュなし(CACHE_BACKEND=none)ではバージョンを比べられないため、発行時の
+# 一覧をそのまま使う。カテゴリーの所有者は変わらないため他のユーザーのカテゴリーは
+# 通らない。発行後に作ったカテゴリーは一覧になく、DB で確認する。
+# 発行後に削除したカテゴリーは /auth/refresh で再発行するまで通る
+# (削除待ちの間に書き込んだタスクはカテゴリーと一緒に削除される)
+def owned_categories(session: Session, user_id: int) -> Optional[set]:
+    claims = principal(session)
+    if claims is None or "cats" not in claims or str(claims["uid"]) != str(user_id):
+        return None
+    if cache.enabled() and categories_version(session, user_id) != claims["cv"]:
+        return None
+    return set(claims["cats"])
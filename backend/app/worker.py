@@ -0,0 +1,208 @@
+import argparse
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import archive  # noqa: F401 (ジョブ archive.purge を登録)
+import deletion
+import jobs
+import metrics
+import routing
+from config import Config
+from database import session_scope, wait_for_db
+
+# バックグラウンドジョブのワーカー(python app/worker.py)。
+#
+# --concurrency 本のスレッドがそれぞれ jobs からジョブを 1 件ずつ取り出して実行する。
+# 別のスレッドが JOB_SCHEDULE_SECONDS ごとに
+# - 定期ジョブ(PERIODIC)が待機中・実行中でなければ、間隔後に実行するものを登録
+#   (PERIODIC_WHEN に条件がある種類は、条件を満たすときだけ)
+# - 止まったワーカーの running のジョブを戻す
+# - 待機数を /metrics 用に集計
+# を行う。ワーカーは何台動かしてもよい(取り出しは FOR UPDATE SKIP LOCKED)。
+# シャーディング中はジョブをシャードごとの jobs に置くため、各シャードを巡回する
+# (ジョブの中のセッションも routing.use_shard でそのシャードにつなぐ)。
+# SIGTERM / SIGINT では実行中のジョブを終えてから止まる。
+
+# 定期ジョブ(kind -> 間隔(秒))。key は kind と同じ
+PERIODIC = {
+    "archive.purge": Config.ARCHIVE_PURGE_INTERVAL_SECONDS,
+    "deletion.purge": Config.DELETION_POLL_SECONDS,
+    "jobs.cleanup": 3600,
+}
+
+# 定期ジョブを登録する条件(kind -> 関数(session) -> bool)。削除待ちがなければ
+# deletion.purge のジョブ行を作らない
+PERIODIC_WHEN = {"deletion.purge": deletion.has_pending}
+
+_stop = threading.Event()
+
+
+def _worker_name(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+# ジョブを 1 件取り出して実行する。取り出せなければ False。
+# シャードは毎回順番を変えて見る(先頭のシャードのジョブばかり実行しないように)
+def run_one(worker: str) -> bool:
+    names = routing.shard_names()
+    for name in random.sample(names, len(names)):
+        with routing.use_shard(name):
+            if _run_one(worker):
+                return True
+    return False
+
+
+def _run_one(worker: str) -> bool:
+    with session_scope() as session:
+        job = jobs.claim(session, worker)
+    if job is None:
+        return False
+    start = time.perf_counter()
+    try:
+        fn = jobs.handlers.get(job["kind"])
+        if fn is None:
+            raise LookupError(f"未登録のジョブです: {job['kind']}")
+        result = fn(job["payload"])
+    except Exception as e:
+        with session_scope() as session:
+            status = jobs.fail(session, job, worker, e)
+        print(
+            f"[worker.py] job {job['job_id']} ({job['kind']}) failed "
+            f"(attempt {job['attempts']}/{job['max_attempts']}, {status}): {e}"
+        )
+    else:
+        with session_scope() as session:
+            jobs.complete(session, job["job_id"], worker, result)
+        status = "done"
+        if result:
+            print(f"[worker.py] job {job['job_id']} ({job['kind']}) done: {result}")
+    metrics.observe_job(job["kind"], status, time.perf_counter() - start)
+    return True
+
+
+def _run_loop(worker: str) -> None:
+    while not _stop.is_set():
+        try:
+            if run_one(worker):
+                continue
+        except Exception as e:
+            # DB に接続できないなど。少し待って続ける
+            print(f"[worker.py] {worker}: {e}")
+        _stop.wait(Config.JOB_POLL_SECONDS)
+
+
+# 定期ジョブの登録・止まったジョブの回収・待機数の集計(シャードごと)
+def schedule() -> None:
+    requeued = 0
+    depth = Counter()
+    for name in routing.shard_names():
+        with routing.use_shard(name), session_scope() as session:
+            for kind, interval in PERIODIC.items():
+                when = PERIODIC_WHEN.get(kind)
+                if when is None or when(session):
+                    jobs.ensure(session, kind, kind, interval)
+            requeued += jobs.requeue_stale(session)
+            depth.update(jobs.queue_depth(session))
+    if requeued:
+        print(f"[worker.py] requeued {requeued} stale job(s)")
+    metrics.set_job_queue(depth)
+
+
+def _schedule_loop() -> None:
+    while not _stop.is_set():
+        try:
+            schedule()
+        except Exception as e:
+            print(f"[worker.py] schedule failed: {e}")
+        _stop.wait(Config.JOB_SCHEDULE_SECONDS)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_metrics(port: int) -> None:
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+# 実行できるジョブがなくなるまで処理する(--once)
+def drain() -> int:
+    worker = _worker_name(0)
+    count = 0
+    while run_one(worker):
+        count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="バックグラウンドジョブのワーカー")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=Config.JOB_CONCURRENCY,
+        help="同時に実行するジョブ数",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="実行できるジョブがなくなったら終了"
+    )
+    parser.add_argument(
+        "--enqueue", metavar="KIND", help="ジョブを 1 件登録して終了(例: archive.purge)"
+    )
+    parser.add_argument("--metrics-port", type=int, default=Config.JOB_METRICS_PORT)
+    args = parser.parse_args()
+    concurrency = max(args.concurrency, 1)
+    # DB の起動を待つ(スキーマは python app/migrate.py で作成しておく)
+    wait_for_db()
+
+    if args.enqueue:
+        if args.enqueue not in jobs.handlers:
+            parser.error(f"未登録のジョブです: {args.enqueue}")
+        for name in routing.shard_names():
+            with routing.use_shard(name), session_scope() as session:
+                job_id = jobs.enqueue(session, args.enqueue)
+            print(f"[worker.py] enqueued job {job_id} ({args.enqueue})")
+        return
+    if args.once:
+        print(f"[worker.py] ran {drain()} job(s)")
+        return
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: _stop.set())
+    if args.metrics_port:
+        _serve_metrics(args.metrics_port)
+    threads = [threading.Thread(target=_schedule_loop, daemon=True)]
+    threads += [
+        threading.Thread(target=_run_loop, args=(_worker_name(i),))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    print(
+        f"[worker.py] started {concurrency} worker thread(s), "
+        f"kinds: {', '.join(sorted(jobs.handlers))}"
+    )
+    for thread in threads[1:]:
+        thread.join()
+    print("[worker.py] stopped")
+
+
+if __name__ == "__main__":
+    main()
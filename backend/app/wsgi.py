@@ -0,0 +1,5 @@
+# 本番サーバー(gunicorn)用のエントリーポイント
+# gunicorn -c gunicorn.conf.py wsgi:app
+from main import app
+
+__all__ = ["app"]
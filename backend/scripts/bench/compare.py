@@ -0,0 +1,79 @@
+"""run.py の結果(JSON)2 回分の比較。
+
+操作ごとの p50 / p95 / p99・スループット・SQL 件数を並べ、変化率を表示する。
+レイテンシと SQL 件数は減れば改善、スループットは増えれば改善。
+
+    python backend/scripts/bench/compare.py before.json after.json
+"""
+
+import argparse
+import json
+
+# (キー, 見出し, 大きいほどよいか)
+COLUMNS = [
+    ("p50_ms", "p50", False),
+    ("p95_ms", "p95", False),
+    ("p99_ms", "p99", False),
+    ("throughput_rps", "rps", True),
+    ("queries_per_request", "sql/req", False),
+]
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 変化率(%)。比べられなければ None
+def change(before, after):
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def _cell(before, after, higher_is_better: bool) -> str:
+    if before is None and after is None:
+        return "-"
+    pct = change(before, after)
+    if pct is None:
+        return f"{before} -> {after}"
+    mark = ""
+    if abs(pct) >= 5:
+        mark = " +" if (pct > 0) == higher_is_better else " !"
+    return f"{before} -> {after} ({pct:+.1f}%){mark}"
+
+
+def compare(before: dict, after: dict) -> list:
+    rows = []
+    ops = list(before["ops"]) + [op for op in after["ops"] if op not in before["ops"]]
+    for name in ops + ["total"]:
+        old = before["total"] if name == "total" else before["ops"].get(name, {})
+        new = after["total"] if name == "total" else after["ops"].get(name, {})
+        rows.append(
+            [name]
+            + [_cell(old.get(key), new.get(key), higher) for key, _, higher in COLUMNS]
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    before, after = _load(args.before), _load(args.after)
+    for label, result in (("before", before), ("after", after)):
+        meta = result.get("meta", {})
+        print(f"{label}: {meta.get('git')} {meta.get('at')} {meta.get('target')}")
+    rows = compare(before, after)
+    header = ["op"] + [title for _, title, _ in COLUMNS]
+    widths = [
+        max(len(str(row[i])) for row in rows + [header]) for i in range(len(header))
+    ]
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+    print("(+ は 5% 以上の改善、! は 5% 以上の悪化)")
+
+
+if __name__ == "__main__":
+    main()
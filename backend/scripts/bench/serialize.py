@@ -0,0 +1,177 @@
+"""一覧レスポンスの JSON 化・圧縮のマイクロベンチマーク(サーバー・PostgreSQL なし)。
+
+タスク N 件(既定 10000)の SQL の結果行を、従来の方法(行ごとの辞書 +
+Flask の jsonify)と encoding.py の方法(行オブジェクト + 各エンコーダー)で
+JSON にし、所要時間(繰り返しの最小値)・途中で確保したメモリ(tracemalloc の
+ピーク)・一覧を作った時点で残っているオブジェクトの数(確保したブロック数の増分)を
+比べる。続けて JSON を各圧縮方式で圧縮したときの時間とサイズを表示する。
+
+    python backend/scripts/bench/serialize.py [--tasks 10000 --content 200] [--out ser.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from flask import Flask, jsonify  # noqa: E402
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+import encoding  # noqa: E402
+from models import Task  # noqa: E402
+from services.tasks import TASK_FIELDS, _task_columns  # noqa: E402
+
+
+# メモリ上の SQLite に tasks を作り、一覧と同じ列の結果行を返す
+def load_rows(tasks: int, content: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    letters = string.ascii_letters + "  あいうえおタスク"
+    engine = create_engine("sqlite://")
+    Task.__table__.create(engine)
+    values = [
+        {
+            "task_id": i,
+            "user_id": 1,
+            "category_id": 1 + i % 10,
+            "title": f"タスク {i}",
+            "content": "".join(rnd.choices(letters, k=content)),
+            "status": rnd.choice(("todo", "doing", "done")),
+            "sort_order": i * 1024,
+            "version": 1,
+        }
+        for i in range(1, tasks + 1)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Task.__table__), values)
+        return conn.execute(
+            select(*_task_columns(TASK_FIELDS)).order_by(Task.task_id)
+        ).all()
+
+
+# 一覧の作り方(SQL の結果行 -> body)と JSON 化(body -> bytes)の組
+def paths(app: Flask) -> dict:
+    fields = list(TASK_FIELDS)
+
+    def dicts(rows):
+        return [{name: row._mapping[name] for name in fields} for row in rows]
+
+    def flask_jsonify(body):
+        with app.app_context():
+            return jsonify(body).get_data()
+
+    result = {"dict+jsonify": (dicts, flask_jsonify)}
+    for name, dumps in encoding.ENCODERS.items():
+        result[f"rows+{name}"] = (lambda rows: encoding.rows(fields, rows), dumps)
+    return result
+
+
+def _best(fn, arg, repeat: int) -> tuple:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return value, best * 1000
+
+
+# 1 つの方法の計測結果
+def measure(build, dumps, rows: list, repeat: int) -> dict:
+    body, build_ms = _best(build, rows, repeat)
+    data, encode_ms = _best(dumps, body, repeat)
+    del body
+    blocks = sys.getallocatedblocks()
+    body = build(rows)
+    blocks = sys.getallocatedblocks() - blocks
+    del body
+    tracemalloc.start()
+    dumps(build(rows))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "build_ms": round(build_ms, 2),
+        "encode_ms": round(encode_ms, 2),
+        "total_ms": round(build_ms + encode_ms, 2),
+        "peak_kib": peak // 1024,
+        "objects": blocks,
+        "bytes": len(data),
+        "_data": data,
+    }
+
+
+def measure_compression(data: bytes, repeat: int) -> dict:
+    result = {}
+    for coding in encoding.CODINGS:
+        compressed, ms = _best(lambda d: encoding.compress(d, coding), data, repeat)
+        result[coding] = {
+            "ms": round(ms, 2),
+            "bytes": len(compressed),
+            "ratio": round(len(compressed) / len(data), 3),
+        }
+    return result
+
+
+def _print(result: dict) -> None:
+    print(
+        f"{'path':<16}{'build':>9}{'encode':>9}{'total':>9}"
+        f"{'peakKiB':>10}{'objects':>10}{'bytes':>11}"
+    )
+    for name, row in result["paths"].items():
+        print(
+            f"{name:<16}{row['build_ms']:>9}{row['encode_ms']:>9}{row['total_ms']:>9}"
+            f"{row['peak_kib']:>10}{row['objects']:>10}{row['bytes']:>11}"
+        )
+    print("(ms; objects は一覧を作った時点で残っているブロック数の増分)")
+    print(f"{'coding':<16}{'ms':>9}{'bytes':>11}{'ratio':>9}")
+    for coding, row in result["compression"].items():
+        print(f"{coding:<16}{row['ms']:>9}{row['bytes']:>11}{row['ratio']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--content", type=int, default=200, help="content の文字数")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数(最小値)")
+    parser.add_argument("--seed", type=int, default=1, help="乱数のシード")
+    parser.add_argument("--out", help="結果を保存する JSON のパス")
+    args = parser.parse_args()
+
+    rows = load_rows(args.tasks, args.content, args.seed)
+    measured = {
+        name: measure(build, dumps, rows, args.repeat)
+        for name, (build, dumps) in paths(Flask(__name__)).items()
+    }
+    # 圧縮はエンコーダーによらず同じ内容のため、現在のエンコーダーの出力で測る
+    data = encoding.dumps(encoding.rows(TASK_FIELDS, rows))
+    result = {
+        "paths": {
+            name: {k: v for k, v in row.items() if k != "_data"}
+            for name, row in measured.items()
+        },
+        "compression": measure_compression(data, args.repeat),
+    }
+    for name, row in measured.items():
+        if json.loads(row["_data"]) != json.loads(data):
+            raise SystemExit(f"{name}: 出力が一致しません")
+    result["meta"] = {
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "encoder": encoding.dumps.__name__,
+        "args": vars(args),
+    }
+    _print(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"[serialize.py] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
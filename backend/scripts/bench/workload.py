@@ -0,0 +1,247 @@
+"""ベンチマークのワークロード(操作の比率と、1 操作分のリクエスト)。
+
+仮想ユーザーは画面の操作と同じ流れでリクエストを送る。カテゴリー一覧を
+読んでからタスク一覧を開き、一覧で見えているタスクを編集・移動・並び替え・
+アーカイブ・削除する(編集などは一覧の version を If-Match に付ける)。
+同じ乱数シードなら同じ順で操作する。
+"""
+
+import http.client
+import json
+import random
+import urllib.parse
+from typing import Optional
+
+# 操作の比率(合計 100)。一覧の表示が大半で、書き込みは編集が多い
+MIX = {
+    "list": 40,
+    "board": 10,
+    "categories": 5,
+    "add": 12,
+    "edit": 15,
+    "move": 6,
+    "reorder": 3,
+    "archive": 5,
+    "delete": 4,
+}
+
+# 操作 -> (メソッド, ルートのパターン)。/metrics の SQL 件数と対応付ける
+ROUTES = {
+    "list": ("GET", "/api/tasks"),
+    "board": ("GET", "/api/board"),
+    "categories": ("GET", "/api/categories"),
+    "add": ("POST", "/api/task"),
+    "edit": ("PATCH", "/api/task/<int:task_id>"),
+    "move": ("PATCH", "/api/task/<int:task_id>/move"),
+    "reorder": ("PATCH", "/api/tasks/reorder"),
+    "archive": ("PATCH", "/api/task/<int:task_id>"),
+    "delete": ("DELETE", "/api/task/<int:task_id>"),
+}
+
+# 並び替えで送る件数の上限(ドラッグで並べ替える範囲)
+REORDER_MAX = 50
+
+
+# Flask のテストクライアント(プロセス内でアプリを直接呼ぶ)
+class TestClientTransport:
+    name = "testclient"
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, body=None, headers=None) -> tuple:
+        res = self.client.open(path, method=method, json=body, headers=headers)
+        data = res.get_data()
+        if res.mimetype == "application/json" and data:
+            return res.status_code, json.loads(data)
+        return res.status_code, data.decode("utf-8", "replace")
+
+
+# 起動中のサーバーへの HTTP(スレッドごとに keep-alive の接続を 1 本)
+class HttpTransport:
+    def __init__(self, base: str, timeout: float = 30):
+        parsed = urllib.parse.urlsplit(base)
+        self.name = base
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body=None, headers=None) -> tuple:
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                res = self.conn.getresponse()
+                data = res.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # サーバーが keep-alive の接続を閉じていた場合は 1 回だけつなぎ直す
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+        content_type = res.getheader("Content-Type", "")
+        if content_type.startswith("application/json") and data:
+            return res.status, json.loads(data)
+        return res.status, data.decode("utf-8", "replace")
+
+
+# 1 スレッド分の仮想ユーザー群。users の中から毎回 1 人を選んで操作する
+class VirtualUsers:
+    def __init__(self, transport, users: list, seed: int):
+        self.transport = transport
+        self.users = users
+        self.rng = random.Random(seed)
+        self.ops = list(MIX)
+        self.weights = [MIX[op] for op in self.ops]
+        # user_id -> カテゴリー ID の一覧、(user_id, category_id) -> 一覧のタスク
+        self.categories: dict = {}
+        self.tasks: dict = {}
+        self.counter = 0
+
+    def next_op(self) -> str:
+        return self.rng.choices(self.ops, self.weights)[0]
+
+    # 操作を 1 回行い、計測対象のリクエストの (操作名, ステータス) を返す。
+    # 操作に必要な一覧をまだ読んでいなければ、先に一覧の操作として読む
+    def step(self, op: str) -> tuple:
+        user_id = self.rng.choice(self.users)
+        if op == "categories" or user_id not in self.categories:
+            return "categories", self._categories(user_id)
+        if op == "board":
+            return op, self._get(f"/api/board?user_id={user_id}")[0]
+        category_id = self.rng.choice(self.categories[user_id])
+        key = (user_id, category_id)
+        if op == "list" or key not in self.tasks:
+            return "list", self._list(user_id, category_id)
+        if op == "add":
+            self.counter += 1
+            status, body = self.transport.request(
+                "POST",
+                "/api/task",
+                {
+                    "title": f"bench{self.counter}",
+                    "content": "x" * 200,
+                    "user_id": user_id,
+                    "category_id": category_id,
+                },
+            )
+            if status == 201:
+                self.tasks[key].append(body)
+            return op, status
+        tasks = self.tasks[key]
+        if not tasks:
+            return "add", self.step("add")[1]
+        if op == "reorder":
+            return op, self._reorder(user_id, category_id, tasks)
+        task = self.rng.choice(tasks)
+        if op == "move":
+            return op, self._move(user_id, tasks, task)
+        if op == "delete":
+            status, _ = self.transport.request(
+                "DELETE",
+                f"/api/task/{task['task_id']}?user_id={user_id}",
+                headers=_if_match(task),
+            )
+            if status == 200:
+                tasks.remove(task)
+            return op, status
+        if op == "archive":
+            values = {"status": "archived"}
+        else:
+            values = self.rng.choice(
+                [
+                    {"title": f"edited{self.rng.randrange(10**6)}"},
+                    {"content": "y" * self.rng.randrange(50, 400)},
+                    {"status": self.rng.choice(["todo", "doing", "done"])},
+                ]
+            )
+        status, body = self.transport.request(
+            "PATCH",
+            f"/api/task/{task['task_id']}",
+            {"user_id": user_id, **values},
+            headers=_if_match(task),
+        )
+        if status == 200:
+            if body["status"] == "archived":
+                tasks.remove(task)
+            else:
+                task.update(body)
+        elif status == 409:
+            task.update(body["current"])
+        return op, status
+
+    def _get(self, path: str) -> tuple:
+        return self.transport.request("GET", path)
+
+    def _categories(self, user_id: int) -> int:
+        status, body = self._get(f"/api/categories?user_id={user_id}")
+        if status == 200:
+            self.categories[user_id] = [c["category_id"] for c in body] or [0]
+        return status
+
+    def _list(self, user_id: int, category_id: int) -> int:
+        status, body = self._get(
+            f"/api/tasks?user_id={user_id}&category_id={category_id}"
+        )
+        if status == 200:
+            self.tasks[(user_id, category_id)] = body
+        return status
+
+    def _move(self, user_id: int, tasks: list, task: dict) -> int:
+        others = [t for t in tasks if t is not task]
+        if not others:
+            return self.step("add")[1]
+        idx = self.rng.randrange(len(others) + 1)
+        body = {"user_id": user_id}
+        if idx > 0:
+            body["prev_id"] = others[idx - 1]["task_id"]
+        if idx < len(others):
+            body["next_id"] = others[idx]["task_id"]
+        status, moved = self.transport.request(
+            "PATCH", f"/api/task/{task['task_id']}/move", body, _if_match(task)
+        )
+        if status == 200:
+            task.update(moved)
+            tasks.remove(task)
+            tasks.insert(idx, task)
+        elif status == 409:
+            task.update(moved["current"])
+        return status
+
+    # 先頭 REORDER_MAX 件の範囲を並べ替える(すべてのバージョンを付ける)
+    def _reorder(self, user_id: int, category_id: int, tasks: list) -> int:
+        head = tasks[:REORDER_MAX]
+        self.rng.shuffle(head)
+        status, body = self.transport.request(
+            "PATCH",
+            "/api/tasks/reorder",
+            {
+                "user_id": user_id,
+                "category_id": category_id,
+                "ordered_ids": [t["task_id"] for t in head],
+                "versions": {str(t["task_id"]): t["version"] for t in head},
+            },
+        )
+        if status == 200:
+            versions = body["versions"]
+            for idx, task in enumerate(head):
+                task["version"] = versions.get(str(task["task_id"]), task["version"])
+            tasks[: len(head)] = head
+        elif status == 409:
+            # 一覧を読み直す
+            del self.tasks[(user_id, category_id)]
+        return status
+
+
+def _if_match(task: dict) -> dict:
+    return {"If-Match": f'"v{task["version"]}"'}
@@ -0,0 +1,92 @@
+"""API の簡易負荷試験(標準ライブラリのみ)。
+
+同じ条件で開発サーバー(python app/main.py)と gunicorn(wsgi:app)に
+それぞれ実行し、スループットとレイテンシを比較する。
+
+    python backend/scripts/loadtest.py --base http://localhost:5000 \\
+        --user-id 1 --category-id 1 --concurrency 32 --duration 20
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 昇順に並んだ値からパーセンタイルを返す
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="http://localhost:5000")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--category-id", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+    args = parser.parse_args()
+
+    urls = [
+        f"{args.base}/api/categories?user_id={args.user_id}",
+        f"{args.base}/api/tasks?user_id={args.user_id}"
+        f"&category_id={args.category_id}",
+    ]
+    latencies: list = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(n: int) -> None:
+        nonlocal errors
+        i = n
+        while time.perf_counter() < deadline:
+            url = urls[i % len(urls)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as res:
+                    res.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for n in range(args.concurrency):
+            pool.submit(worker, n)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "base": args.base,
+        "concurrency": args.concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+    if args.json:
+        print(json.dumps(result))
+        return
+    for key, value in result.items():
+        print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import tempfile
+import pytest
+
+# テストの DB。TEST_DATABASE_URL(使い捨ての PostgreSQL)があればそれを使い、
+# なければ一時ディレクトリの SQLite で動かす。PostgreSQL だけの機能
+# (COPY、EXPLAIN、パーティションなど)のテストは @pytest.mark.postgres を付ける。
+# app のモジュールは import 時に Config を読むため、環境変数はここで先に設定する
+_tmp = tempfile.mkdtemp(prefix="todo-tests-")
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{_tmp}/test.db"
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+os.environ.setdefault("HASH_WORKERS", "2")
+os.environ.setdefault("REORDER_COALESCE_MS", "50")
+
+from sqlalchemy import BigInteger, text  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+
+
+# SQLite の自動採番は INTEGER PRIMARY KEY だけのため、BIGINT の主キーを INTEGER にする
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    return "INTEGER"
+
+
+import cache  # noqa: E402
+import coalesce  # noqa: E402
+import database  # noqa: E402
+import ratelimit  # noqa: E402
+from config import Config  # noqa: E402
+from migrate import migrate  # noqa: E402
+from models import Base, User  # noqa: E402
+
+POSTGRES = TEST_DATABASE_URL.startswith("postgresql")
+
+# PostgreSQL の連番と同じく、削除した行(アーカイブで移した行など)の ID を使い回さない
+for _table in Base.metadata.tables.values():
+    _table.kwargs["sqlite_autoincrement"] = True
+
+
+def pytest_collection_modifyitems(config, items):
+    if POSTGRES:
+        return
+    skip = pytest.mark.skip(reason="TEST_DATABASE_URL(PostgreSQL)が必要です")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    engine = database.get_engine()
+    if POSTGRES:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA public CASCADE"))
+            conn.execute(text("CREATE SCHEMA public"))
+        database.create_tables(engine)
+        migrate(engine)
+    return engine
+
+
+# テストごとに空の DB とプロセス内の状態(キャッシュ・ログイン試行回数など)にする
+@pytest.fixture(autouse=True)
+def db(engine, monkeypatch):
+    if POSTGRES:
+        names = ", ".join(t.name for t in Base.metadata.sorted_tables)
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {names} RESTART IDENTITY CASCADE"))
+    else:
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+    monkeypatch.setattr(cache, "backend", cache.LRUBackend())
+    # api.auth は login_limiter を import 済みのため、同じインスタンスの記録を消す
+    monkeypatch.setattr(ratelimit.login_limiter, "_counts", {})
+    monkeypatch.setattr(
+        coalesce, "reorders", coalesce.Coalescer(Config.REORDER_COALESCE_MS / 1000)
+    )
+    return engine
+
+
+@pytest.fixture
+def app():
+    from main import app
+
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# ユーザーを作成して user_id を返す
+@pytest.fixture
+def make_user():
+    def make(name: str = "user", password_hash: str = "x") -> int:
+        with database.session_scope() as session:
+            user = User(
+                name=name, email=f"{name}@example.com", password_hash=password_hash
+            )
+            session.add(user)
+            session.flush()
+            return user.user_id
+
+    return make
+
+
+@pytest.fixture
+def user_id(make_user) -> int:
+    return make_user()
+
+
+# API でカテゴリーを作成して category_id を返す
+@pytest.fixture
+def make_category(client, user_id):
+    def make(title: str = "category", uid: int = None) -> int:
+        res = client.post(
+            "/api/category", json={"title": title, "user_id": uid or user_id}
+        )
+        assert res.status_code == 201, res.get_json()
+        return res.get_json()["category_id"]
+
+    return make
+
+
+# API でタスクを作成して task_id を返す(status を指定すればその後に変更する)
+@pytest.fixture
+def make_task(client, user_id):
+    def make(
+        category_id: int, title: str = "task", status: str = None, uid: int = None
+    ) -> int:
+        uid = uid or user_id
+        res = client.post(
+            "/api/task",
+            json={"title": title, "user_id": uid, "category_id": category_id},
+        )
+        assert res.status_code == 201, res.get_json()
+        task_id = res.get_json()["task_id"]
+        if status is not None:
+            res = client.patch(
+                f"/api/task/{task_id}", json={"user_id": uid, "status": status}
+            )
+            assert res.status_code == 200, res.get_json()
+        return task_id
+
+    return make
+
+
+# カテゴリーのタスクの task_id(並び順)
+@pytest.fixture
+def task_ids(client, user_id):
+    def ids(category_id: int, status: str = None, uid: int = None) -> list:
+        query = f"user_id={uid or user_id}&category_id={category_id}"
+        if status is not None:
+            query += f"&status={status}"
+        res = client.get(f"/api/tasks?{query}")
+        assert res.status_code == 200, res.get_json()
+        return [task["task_id"] for task in res.get_json()]
+
+    return ids
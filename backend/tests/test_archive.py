@@ -0,0 +1,83 @@
+from sqlalchemy import select
+import database
+from models import ArchivedTask, Task
+
+
+def _stored(model, task_id):
+    with database.session_scope() as session:
+        return session.scalar(select(model.task_id).where(model.task_id == task_id))
+
+
+def test_archiving_moves_the_row(client, user_id, make_category, make_task, task_ids):
+    category_id = make_category()
+    task_id = make_task(category_id, status="archived")
+    assert _stored(Task, task_id) is None
+    assert _stored(ArchivedTask, task_id) == task_id
+    assert task_ids(category_id) == []
+    assert task_ids(category_id, "archived") == [task_id]
+
+
+def test_restore_moves_back_to_the_end(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    archived = make_task(category_id, "old", status="archived")
+    active = make_task(category_id, "new")
+    res = client.post(f"/api/task/{archived}/restore", json={"user_id": user_id})
+    assert res.status_code == 200
+    assert res.get_json()["status"] == "todo"
+    assert task_ids(category_id) == [active, archived]
+    assert _stored(ArchivedTask, archived) is None
+
+
+def test_reorder_archived_tasks(client, user_id, make_category, make_task, task_ids):
+    category_id = make_category()
+    a, b, c = (make_task(category_id, t, status="archived") for t in "abc")
+    res = client.patch(
+        "/api/tasks/reorder",
+        json={"user_id": user_id, "category_id": category_id, "ordered_ids": [c, a, b]},
+    )
+    assert res.status_code == 200
+    assert res.get_json()["updated"] == 3
+    assert task_ids(category_id, "archived") == [c, a, b]
+
+
+def test_reorder_archived_tasks_with_versions(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    a, b = (make_task(category_id, t, status="archived") for t in "ab")
+    body = {"user_id": user_id, "category_id": category_id, "ordered_ids": [b, a]}
+    res = client.patch("/api/tasks/reorder", json={**body, "versions": {a: 1, b: 1}})
+    assert res.status_code == 409
+    assert [row["task_id"] for row in res.get_json()["current"]] == [a, b]
+    versions = {
+        t["task_id"]: t["version"]
+        for t in client.get(
+            f"/api/tasks?user_id={user_id}&category_id={category_id}&status=archived"
+        ).get_json()
+    }
+    res = client.patch("/api/tasks/reorder", json={**body, "versions": versions})
+    assert res.status_code == 200
+    assert task_ids(category_id, "archived") == [b, a]
+
+
+def test_reorder_rejects_unknown_and_mixed_ids(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id, other = make_category("a"), make_category("b")
+    active = make_task(category_id, "active")
+    archived = make_task(category_id, "archived", status="archived")
+    elsewhere = make_task(other, "elsewhere")
+    for ordered_ids in ([active, 999], [elsewhere], [active, archived]):
+        res = client.patch(
+            "/api/tasks/reorder",
+            json={
+                "user_id": user_id,
+                "category_id": category_id,
+                "ordered_ids": ordered_ids,
+            },
+        )
+        assert res.status_code == 400, ordered_ids
+    assert task_ids(category_id) == [active]
+    assert task_ids(category_id, "archived") == [archived]
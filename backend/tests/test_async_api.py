@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import pytest
+import cache
+import routing
+from aio.database import async_url, dispose_async_engine
+from config import Config
+
+
+@pytest.fixture
+def run_async():
+    from asgi import app
+
+    # テストごとにイベントループが変わるため、終わったら接続プールを閉じる
+    def run(scenario):
+        async def main():
+            try:
+                return await scenario(app.test_client())
+            finally:
+                await dispose_async_engine()
+
+        return asyncio.run(main())
+
+    return run
+
+
+def test_async_url():
+    assert async_url("postgresql://u@h/db") == "postgresql+asyncpg://u@h/db"
+    assert async_url("postgresql+psycopg2://u@h/db") == "postgresql+asyncpg://u@h/db"
+    assert async_url("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+
+def test_async_stack_serves_the_same_api(run_async, client, user_id):
+    async def scenario(aclient):
+        res = await aclient.post(
+            "/api/category", json={"title": "c", "user_id": user_id}
+        )
+        assert res.status_code == 201
+        category_id = (await res.get_json())["category_id"]
+        for title in ("a", "b", "c"):
+            res = await aclient.post(
+                "/api/task",
+                json={"title": title, "user_id": user_id, "category_id": category_id},
+            )
+            assert res.status_code == 201
+        res = await aclient.get(
+            f"/api/tasks?user_id={user_id}&category_id={category_id}&limit=2"
+        )
+        assert res.status_code == 200
+        assert [t["task_title"] for t in await res.get_json()] == ["a", "b"]
+        assert res.headers["X-Next-Cursor"]
+        return category_id
+
+    category_id = run_async(scenario)
+    # 同期スタックから見ても同じデータ
+    res = client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    assert [t["task_title"] for t in res.get_json()] == ["a", "b", "c"]
+
+
+def test_async_stack_errors(run_async, user_id):
+    async def scenario(aclient):
+        res = await aclient.post("/api/category", json={"user_id": user_id})
+        assert res.status_code == 400
+        assert "error" in await res.get_json()
+        res = await aclient.delete(f"/api/category/999?user_id={user_id}")
+        assert res.status_code == 404
+
+    run_async(scenario)
+
+
+def test_async_login(run_async):
+    async def scenario(aclient):
+        res = await aclient.post(
+            "/api/auth/register",
+            json={"name": "a", "email": "a@example.com", "password": "secret1"},
+        )
+        assert res.status_code == 201
+        res = await aclient.post(
+            "/api/auth/login", json={"email": "a@example.com", "password": "secret1"}
+        )
+        assert res.status_code == 200
+        res = await aclient.post(
+            "/api/auth/login", json={"email": "a@example.com", "password": "wrong"}
+        )
+        assert res.status_code == 401
+
+    run_async(scenario)
+
+
+# キャッシュ・接続先の記録(redis)の読み書きはイベントループのスレッドで行わない
+def test_async_stack_reads_cache_off_the_event_loop(run_async, monkeypatch):
+    loop_threads = []
+
+    class Recording(cache.LRUBackend):
+        def get(self, key):
+            loop_threads.append((key, threading.current_thread() is main))
+            return super().get(key)
+
+        def set(self, key, value, ttl=None):
+            loop_threads.append((key, threading.current_thread() is main))
+            super().set(key, value, ttl)
+
+    main = threading.main_thread()
+    monkeypatch.setattr(cache, "backend", Recording())
+    monkeypatch.setattr(routing, "REPLICA_URLS", [Config.DATABASE_URL])
+
+    async def scenario(aclient):
+        res = await aclient.post(
+            "/api/auth/register",
+            json={"name": "a", "email": "a@example.com", "password": "secret1"},
+        )
+        user_id = (await res.get_json())["user_id"]
+        res = await aclient.post(
+            "/api/auth/login", json={"email": "a@example.com", "password": "secret1"}
+        )
+        headers = {"Authorization": f"Bearer {(await res.get_json())['token']}"}
+        res = await aclient.post("/api/category", json={"title": "c"}, headers=headers)
+        category_id = (await res.get_json())["category_id"]
+        task = {"title": "t", "category_id": category_id}
+        res = await aclient.post("/api/task", json=task, headers=headers)
+        assert res.status_code == 201
+        task_id = (await res.get_json())["task_id"]
+        for _ in range(2):
+            res = await aclient.get(
+                f"/api/tasks?category_id={category_id}", headers=headers
+            )
+            assert res.status_code == 200
+        res = await aclient.patch(
+            "/api/tasks/reorder",
+            json={"category_id": category_id, "ordered_ids": [task_id], "seq": 1},
+            headers=headers,
+        )
+        assert res.status_code == 200
+        return user_id
+
+    user_id = run_async(scenario)
+    keys = {key for key, _ in loop_threads}
+    assert {f"v:{cache.categories_scope(user_id)}", f"primary:{user_id}"} <= keys
+    assert [key for key, on_loop in loop_threads if on_loop] == []
@@ -0,0 +1,151 @@
+import os
+import subprocess
+import sys
+from sqlalchemy import select
+import database
+import hashing
+from config import Config
+from models import User
+
+PASSWORD = "password123"
+
+
+def _register(client, name="alice"):
+    res = client.post(
+        "/api/auth/register",
+        json={"name": name, "email": f"{name}@example.com", "password": PASSWORD},
+    )
+    assert res.status_code == 201, res.get_json()
+    return res.get_json()["user_id"]
+
+
+def _login(client, name="alice", password=PASSWORD):
+    return client.post(
+        "/api/auth/login",
+        json={"email": f"{name}@example.com", "password": password},
+    )
+
+
+def _stored_hash(user_id) -> str:
+    with database.session_scope() as session:
+        return session.scalar(select(User.password_hash).where(User.user_id == user_id))
+
+
+def test_expand_method():
+    assert hashing.expand_method("scrypt") == "scrypt:32768:8:1"
+    assert hashing.expand_method("scrypt:16384:8:1") == "scrypt:16384:8:1"
+    assert hashing.expand_method("pbkdf2") == hashing.expand_method("pbkdf2:sha256")
+    assert hashing.expand_method("pbkdf2:sha512:1000") == "pbkdf2:sha512:1000"
+
+
+def test_register_and_login(client):
+    user_id = _register(client)
+    res = _login(client)
+    assert res.status_code == 200
+    assert res.get_json()["user_id"] == user_id
+    assert res.get_json()["token"]
+    assert _login(client, password="wrong-password").status_code == 401
+    assert _register_conflict(client) == 409
+
+
+def _register_conflict(client) -> int:
+    return client.post(
+        "/api/auth/register",
+        json={"name": "a", "email": "alice@example.com", "password": PASSWORD},
+    ).status_code
+
+
+# 省略形の HASH_METHOD でも、方式が変わらなければログインのたびに書き換えない
+def test_login_does_not_rehash_with_short_method(client, monkeypatch):
+    monkeypatch.setattr(Config, "HASH_METHOD", "scrypt")
+    user_id = _register(client)
+    stored = _stored_hash(user_id)
+    assert stored.startswith("scrypt:32768:8:1$")
+    assert not hashing.needs_rehash(stored)
+    assert _login(client).status_code == 200
+    assert _stored_hash(user_id) == stored
+
+
+def test_login_rehashes_after_method_change(client, monkeypatch):
+    user_id = _register(client)
+    monkeypatch.setattr(Config, "HASH_METHOD", "pbkdf2:sha256:1000")
+    assert _login(client).status_code == 200
+    rehashed = _stored_hash(user_id)
+    assert rehashed.startswith("pbkdf2:sha256:1000$")
+    assert _login(client).status_code == 200
+    assert _stored_hash(user_id) == rehashed
+
+
+def test_login_attempts_are_limited(client):
+    _register(client)
+    for _ in range(Config.LOGIN_MAX_ATTEMPTS):
+        assert _login(client, password="wrong-password").status_code == 401
+    res = _login(client)
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) > 0
+
+
+def test_successful_logins_do_not_lock_the_email(client):
+    _register(client)
+    # 別々の IP から正しいパスワードで上限を超えてログインしても、本人はロックされない
+    for n in range(Config.LOGIN_MAX_ATTEMPTS + 2):
+        res = client.post(
+            "/api/auth/login",
+            json={"email": "alice@example.com", "password": PASSWORD},
+            environ_base={"REMOTE_ADDR": f"10.0.0.{n}"},
+        )
+        assert res.status_code == 200
+    res = client.post(
+        "/api/auth/login",
+        json={"email": "alice@example.com", "password": PASSWORD},
+        environ_base={"REMOTE_ADDR": "10.0.1.1"},
+    )
+    assert res.status_code == 200
+
+
+def test_failed_logins_lock_the_email_from_any_ip(client):
+    _register(client)
+    for n in range(Config.LOGIN_MAX_ATTEMPTS):
+        res = client.post(
+            "/api/auth/login",
+            json={"email": "alice@example.com", "password": "wrong-password"},
+            environ_base={"REMOTE_ADDR": f"10.0.0.{n}"},
+        )
+        assert res.status_code == 401
+    res = client.post(
+        "/api/auth/login",
+        json={"email": "alice@example.com", "password": PASSWORD},
+        environ_base={"REMOTE_ADDR": "10.0.1.1"},
+    )
+    assert res.status_code == 429
+
+
+def test_busy_rehash_still_logs_in(client, monkeypatch):
+    user_id = _register(client)
+    stored = _stored_hash(user_id)
+    monkeypatch.setattr(Config, "HASH_METHOD", "pbkdf2:sha256:1000")
+
+    def busy(password):
+        raise hashing.Busy()
+
+    monkeypatch.setattr(hashing, "hash_password", busy)
+    res = _login(client)
+    assert res.status_code == 200
+    assert res.get_json()["token"]
+    # 再ハッシュは次回に回す
+    assert _stored_hash(user_id) == stored
+
+
+# Config は import 時に環境変数を読むため、別プロセスで既定値を確かめる
+def test_hash_workers_default_shares_cpus():
+    env = {k: v for k, v in os.environ.items() if k != "HASH_WORKERS"}
+    env["WEB_WORKERS"] = "3"
+    out = subprocess.run(
+        [sys.executable, "-c", "from config import Config; print(Config.HASH_WORKERS)"],
+        cwd=os.path.dirname(hashing.__file__),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert int(out) == max(1, (os.cpu_count() or 1) // 3)
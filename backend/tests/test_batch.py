@@ -0,0 +1,126 @@
+import pytest
+from sqlalchemy import event
+import database
+
+
+def _batch(client, user_id, *operations):
+    res = client.post(
+        "/api/tasks/batch", json={"user_id": user_id, "operations": list(operations)}
+    )
+    assert res.status_code == 200, res.get_json()
+    return res.get_json()["results"]
+
+
+def test_batch_create_update_delete(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    updated, deleted = make_task(category_id, "u"), make_task(category_id, "d")
+    results = _batch(
+        client,
+        user_id,
+        {"op": "create", "title": "c1", "category_id": category_id},
+        {"op": "update", "task_id": updated, "title": "u2", "status": "done"},
+        {"op": "delete", "task_id": deleted},
+        {"op": "create", "title": "c2", "category_id": category_id},
+    )
+    assert [r["ok"] for r in results] == [True] * 4
+    created = [results[0]["task"]["task_id"], results[3]["task"]["task_id"]]
+    assert results[1]["task"]["task_title"] == "u2"
+    assert results[1]["task"]["status"] == "done"
+    # 作成したタスクは操作の順に末尾へ
+    assert task_ids(category_id) == [updated, *created]
+
+
+def test_batch_reports_errors_per_operation(
+    client, user_id, make_user, make_category, make_task
+):
+    category_id = make_category()
+    task_id = make_task(category_id)
+    other = make_user("other")
+    foreign = make_task(make_category("theirs", uid=other), uid=other)
+    results = _batch(
+        client,
+        user_id,
+        {"op": "create", "category_id": category_id},
+        {"op": "create", "title": "t", "category_id": 999},
+        {"op": "update", "task_id": foreign, "title": "x"},
+        {"op": "update", "task_id": task_id},
+        {"op": "delete", "task_id": task_id},
+        {"op": "move", "task_id": task_id},
+        {"op": "create", "title": "ok", "category_id": category_id},
+    )
+    assert [r.get("status") for r in results] == [400, 404, 404, 400, None, 400, None]
+    assert results[4]["ok"] and results[6]["ok"]
+    assert [r.get("index") for r in results] == [0, 1, 2, 3, None, 5, None]
+
+
+def test_batch_rejects_invalid_values(client, user_id, make_category, make_task):
+    category_id = make_category()
+    task_id = make_task(category_id)
+    results = _batch(
+        client,
+        user_id,
+        {"op": "update", "task_id": "abc", "title": "x"},
+        {"op": "create", "title": "t", "category_id": "abc"},
+        {"op": "create", "title": "x" * 33, "category_id": category_id},
+        {"op": "update", "task_id": task_id, "title": "x" * 33},
+        {"op": "update", "task_id": task_id, "status": "s" * 33},
+        {"op": "update", "task_id": task_id, "content": 1},
+        {"op": "delete", "task_id": True},
+        {"op": "create", "title": "x" * 32, "category_id": category_id},
+    )
+    assert [r.get("status") for r in results] == [400] * 7 + [None]
+    assert [r.get("index") for r in results[:7]] == list(range(7))
+    assert "task_id" in results[0]["error"]
+    assert "category_id" in results[1]["error"]
+    assert "32" in results[2]["error"]
+    assert results[7]["ok"]
+
+
+def test_batch_validation(client, user_id):
+    assert client.post("/api/tasks/batch", json={"user_id": user_id}).status_code == 400
+    res = client.post("/api/tasks/batch", json={"user_id": user_id, "operations": []})
+    assert res.status_code == 400
+    res = client.post(
+        "/api/tasks/batch",
+        json={"user_id": user_id, "operations": [{"op": "delete"}] * 1001},
+    )
+    assert res.status_code == 400
+
+
+def _statements(client, user_id, operations) -> list:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = database.get_engine()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        results = _batch(client, user_id, *operations)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert all(r["ok"] for r in results)
+    return statements
+
+
+# 件数によらず、操作の種別ごとに 1 文で書き込む(SQLite は RETURNING の順序を
+# 保証できないため、INSERT を 1 行ずつ実行する)
+@pytest.mark.postgres
+def test_batch_statement_count_is_constant(client, user_id, make_category):
+    category_id = make_category()
+    counts = []
+    for n in (3, 30):
+        statements = _statements(
+            client,
+            user_id,
+            [
+                {"op": "create", "title": f"t{i}", "category_id": category_id}
+                for i in range(n)
+            ],
+        )
+        inserts = [s for s in statements if s.lstrip().startswith("INSERT INTO tasks")]
+        assert len(inserts) == 1
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
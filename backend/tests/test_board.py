@@ -0,0 +1,75 @@
+from sqlalchemy import event
+
+
+def _board(client, user_id, **headers):
+    return client.get(f"/api/board?user_id={user_id}", headers=headers)
+
+
+def test_board_snapshot(client, user_id, make_category, make_task):
+    first = make_category("first")
+    second = make_category("second")
+    a = make_task(first, "a")
+    b = make_task(first, "b", status="done")
+    make_task(first, "c", status="archived")
+    d = make_task(second, "d")
+    gone = make_category("gone")
+    res = client.delete(f"/api/category/{gone}?user_id={user_id}")
+    assert res.status_code == 200
+
+    res = _board(client, user_id)
+    assert res.status_code == 200
+    categories = res.get_json()["categories"]
+    assert [c["category_title"] for c in categories] == ["first", "second"]
+    assert [t["task_id"] for t in categories[0]["tasks"]] == [a, b]
+    assert categories[0]["counts"] == {"todo": 1, "doing": 0, "done": 1, "archived": 1}
+    assert [t["task_id"] for t in categories[1]["tasks"]] == [d]
+    assert categories[1]["counts"] == {"todo": 1, "doing": 0, "done": 0, "archived": 0}
+
+
+def test_board_uses_two_queries(client, engine, user_id, make_category, make_task):
+    for title in ("x", "y", "z"):
+        category_id = make_category(title)
+        make_task(category_id)
+        make_task(category_id)
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        res = _board(client, user_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert res.status_code == 200
+    assert len(statements) == 2
+
+
+def test_board_etag_follows_task_changes(client, user_id, make_category, make_task):
+    category_id = make_category()
+    task_id = make_task(category_id)
+    etag = _board(client, user_id).headers["ETag"]
+    assert _board(client, user_id, **{"If-None-Match": etag}).status_code == 304
+
+    client.patch(f"/api/task/{task_id}", json={"user_id": user_id, "status": "done"})
+    res = _board(client, user_id, **{"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.get_json()["categories"][0]["counts"]["done"] == 1
+
+
+def test_board_requires_user(client):
+    assert client.get("/api/board").status_code == 400
+
+
+# ボードの counts は with_counts=1 のカテゴリー一覧と同じキー・値
+def test_board_counts_match_category_counts(client, user_id, make_category, make_task):
+    category_id = make_category()
+    make_task(category_id, "a")
+    make_task(category_id, "b", status="blocked")
+    make_task(category_id, "c", status="archived")
+    make_category("empty")
+    board = _board(client, user_id).get_json()["categories"]
+    res = client.get(f"/api/categories?user_id={user_id}&with_counts=1")
+    assert [c["counts"] for c in board] == [c["counts"] for c in res.get_json()]
+    assert board[0]["counts"]["other"] == 1
@@ -0,0 +1,93 @@
+import os
+import runpy
+import pytest
+import cache
+from config import Config
+
+
+def _tasks_url(user_id, category_id):
+    return f"/api/tasks?user_id={user_id}&category_id={category_id}"
+
+
+def test_etag_revalidation(client, user_id, make_category, make_task):
+    category_id = make_category()
+    make_task(category_id, "a")
+    first = client.get(_tasks_url(user_id, category_id))
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    again = client.get(
+        _tasks_url(user_id, category_id), headers={"If-None-Match": etag}
+    )
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+
+def test_writes_invalidate_lists(client, user_id, make_category, make_task):
+    category_id = make_category()
+    task_id = make_task(category_id, "a")
+    etag = client.get(_tasks_url(user_id, category_id)).headers["ETag"]
+    categories_etag = client.get(f"/api/categories?user_id={user_id}").headers["ETag"]
+
+    client.patch(f"/api/task/{task_id}", json={"user_id": user_id, "title": "b"})
+    res = client.get(_tasks_url(user_id, category_id), headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.get_json()[0]["task_title"] == "b"
+    res = client.get(
+        f"/api/categories?user_id={user_id}",
+        headers={"If-None-Match": categories_etag},
+    )
+    assert res.status_code == 304
+
+    make_category("other")
+    res = client.get(
+        f"/api/categories?user_id={user_id}",
+        headers={"If-None-Match": categories_etag},
+    )
+    assert res.status_code == 200
+    assert len(res.get_json()) == 2
+
+
+def test_rolled_back_write_does_not_invalidate(
+    client, user_id, make_category, make_task
+):
+    category_id = make_category()
+    task_id = make_task(category_id, "a")
+    etag = client.get(_tasks_url(user_id, category_id)).headers["ETag"]
+    res = client.patch(
+        f"/api/task/{task_id}",
+        json={"user_id": user_id, "title": "b"},
+        headers={"If-Match": '"v99"'},
+    )
+    assert res.status_code == 409
+    res = client.get(_tasks_url(user_id, category_id), headers={"If-None-Match": etag})
+    assert res.status_code == 304
+
+
+def test_null_backend_disables_caching(
+    client, user_id, make_category, make_task, monkeypatch
+):
+    monkeypatch.setattr(cache, "backend", cache.NullBackend())
+    category_id = make_category()
+    make_task(category_id)
+    etag = client.get(_tasks_url(user_id, category_id)).headers["ETag"]
+    res = client.get(_tasks_url(user_id, category_id), headers={"If-None-Match": etag})
+    assert res.status_code == 200
+
+
+def test_default_backend(monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_BACKEND", "none")
+    assert isinstance(cache.build_backend(), cache.NullBackend)
+    monkeypatch.setattr(Config, "CACHE_BACKEND", "redis")
+    monkeypatch.setattr(Config, "CACHE_URL", "")
+    with pytest.raises(RuntimeError):
+        cache.build_backend()
+
+
+def test_gunicorn_refuses_lru_with_several_workers(monkeypatch):
+    path = os.path.join(os.path.dirname(cache.__file__), "gunicorn.conf.py")
+    monkeypatch.setattr(Config, "CACHE_BACKEND", "lru")
+    monkeypatch.setattr(Config, "WEB_WORKERS", 3)
+    with pytest.raises(RuntimeError):
+        runpy.run_path(path)
+    monkeypatch.setattr(Config, "WEB_WORKERS", 1)
+    assert runpy.run_path(path)["workers"] == 1
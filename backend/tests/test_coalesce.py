@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import time
+import pytest
+import coalesce
+import metrics
+
+
+def _submit_all(coalescer, seqs, delay=0.02) -> dict:
+    calls, results = [], {}
+
+    def send(i, seq):
+        time.sleep(i * delay)
+        results[seq] = coalescer.submit("k", seq, lambda: calls.append(seq) or seq)
+
+    threads = [
+        threading.Thread(target=send, args=(i, seq)) for i, seq in enumerate(seqs)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return calls, results
+
+
+def test_requests_in_the_window_are_merged():
+    calls, results = _submit_all(coalesce.Coalescer(0.3), [1, 2, 3])
+    assert calls == [3]
+    assert results[3] == (coalesce.APPLIED, 3, 3)
+    assert results[1] == results[2] == (coalesce.COALESCED, 3, 3)
+
+
+def test_older_seq_is_stale():
+    calls, results = _submit_all(coalesce.Coalescer(0.3), [5, 4])
+    assert calls == [5]
+    assert results[4] == (coalesce.STALE, None, None)
+
+
+def test_errors_reach_every_request():
+    coalescer = coalesce.Coalescer(0.2)
+    errors = []
+
+    def fail():
+        raise ValueError("boom")
+
+    def send(seq):
+        try:
+            coalescer.submit("k", seq, fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=send, args=(seq,)) for seq in (1, 2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 2
+
+
+def test_submit_async():
+    coalescer = coalesce.Coalescer(0.2)
+    calls = []
+
+    async def one(i, seq):
+        await asyncio.sleep(i * 0.02)
+
+        async def apply():
+            calls.append(seq)
+            return seq
+
+        return await coalescer.submit_async("k", seq, apply)
+
+    async def main():
+        return await asyncio.gather(*(one(i, seq) for i, seq in enumerate((1, 2))))
+
+    assert asyncio.run(main()) == [(coalesce.COALESCED, 2, 2), (coalesce.APPLIED, 2, 2)]
+    assert calls == [2]
+
+
+@pytest.fixture
+def reorder(client, user_id):
+    def reorder(category_id, ordered_ids, **extra):
+        return client.patch(
+            "/api/tasks/reorder",
+            json={
+                "user_id": user_id,
+                "category_id": category_id,
+                "ordered_ids": ordered_ids,
+                **extra,
+            },
+        )
+
+    return reorder
+
+
+@pytest.fixture
+def tasks(make_category, make_task):
+    category_id = make_category()
+    return category_id, [make_task(category_id, str(n)) for n in range(3)]
+
+
+def test_reorder_storm_writes_the_last_order(
+    app, user_id, tasks, task_ids, monkeypatch
+):
+    monkeypatch.setattr(coalesce, "reorders", coalesce.Coalescer(0.3))
+    category_id, ids = tasks
+    orders = [ids[::-1], ids[1:] + ids[:1], ids[2:] + ids[:2]]
+    results = [None] * 3
+
+    def send(i):
+        time.sleep(i * 0.01)
+        res = app.test_client().patch(
+            "/api/tasks/reorder",
+            json={
+                "user_id": user_id,
+                "category_id": category_id,
+                "ordered_ids": orders[i],
+                "seq": i + 1,
+                "client": "tab",
+            },
+        )
+        results[i] = (res.status_code, res.headers.get("X-Reorder-Seq"))
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [(200, "3")] * 3
+    assert task_ids(category_id) == orders[2]
+    assert metrics._coalesced[("tasks.reorder", coalesce.APPLIED)] >= 1
+    assert metrics._coalesced[("tasks.reorder", coalesce.COALESCED)] >= 2
+
+
+def test_stale_seq_is_rejected(reorder, tasks, task_ids):
+    category_id, ids = tasks
+    assert reorder(category_id, ids[::-1], seq=5, client="a").status_code == 200
+    res = reorder(category_id, ids, seq=4, client="a")
+    assert res.status_code == 409
+    assert res.get_json()["stale"] is True
+    assert task_ids(category_id) == ids[::-1]
+    # seq はクライアントごと
+    assert reorder(category_id, ids, seq=1, client="b").status_code == 200
+    assert task_ids(category_id) == ids
+
+
+def test_stale_seq_after_another_client(reorder, tasks, task_ids):
+    category_id, ids = tasks
+    assert reorder(category_id, ids[::-1], seq=5, client="a").status_code == 200
+    assert reorder(category_id, ids, seq=1, client="b").status_code == 200
+    # 別のクライアントの並び替えを挟んでも、a の古い seq は捨てる
+    res = reorder(category_id, ids[1:] + ids[:1], seq=3, client="a")
+    assert res.status_code == 409
+    assert task_ids(category_id) == ids
+
+
+def test_invalid_request_does_not_replace_a_waiting_one(
+    app, user_id, tasks, task_ids, monkeypatch
+):
+    monkeypatch.setattr(coalesce, "reorders", coalesce.Coalescer(0.3))
+    category_id, ids = tasks
+    results = {}
+
+    def send(name, delay, **extra):
+        time.sleep(delay)
+        res = app.test_client().patch(
+            "/api/tasks/reorder",
+            json={"user_id": user_id, "category_id": category_id, **extra},
+        )
+        results[name] = res.status_code
+
+    threads = [
+        threading.Thread(
+            target=send, args=("valid", 0), kwargs={"ordered_ids": ids[::-1], "seq": 1}
+        ),
+        threading.Thread(
+            target=send,
+            args=("invalid", 0.05),
+            kwargs={"ordered_ids": ["x"], "seq": 2},
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"valid": 200, "invalid": 400}
+    assert task_ids(category_id) == ids[::-1]
+
+
+def test_stale_seq_from_another_process(reorder, tasks, monkeypatch):
+    category_id, ids = tasks
+    assert reorder(category_id, ids[::-1], seq=5, client="a").status_code == 200
+    # 別プロセス(まとめ書きの状態を共有しない)からの古い seq は DB で捨てる
+    monkeypatch.setattr(coalesce, "reorders", coalesce.Coalescer(0.01))
+    res = reorder(category_id, ids, seq=3, client="a")
+    assert res.status_code == 409
+    assert res.headers["X-Reorder-Seq"] == "3"
+
+
+@pytest.mark.parametrize("seq", [-1, "1", True, 1.5])
+def test_invalid_seq(reorder, tasks, seq):
+    category_id, ids = tasks
+    assert reorder(category_id, ids, seq=seq).status_code == 400
+
+
+def test_reorder_without_seq_is_not_coalesced(reorder, tasks):
+    category_id, ids = tasks
+    res = reorder(category_id, ids[::-1])
+    assert res.status_code == 200
+    assert "X-Reorder-Seq" not in res.headers
+
+
+def test_categories_reorder_is_coalesced(client, user_id, make_category):
+    ids = [make_category("a"), make_category("b")]
+    res = client.patch(
+        "/api/categories/reorder",
+        json={"user_id": user_id, "ordered_ids": ids[::-1], "seq": 1},
+    )
+    assert res.status_code == 200
+    assert res.headers["X-Reorder-Seq"] == "1"
+    res = client.get(f"/api/categories?user_id={user_id}")
+    assert [c["category_id"] for c in res.get_json()] == ids[::-1]
@@ -0,0 +1,85 @@
+from sqlalchemy import func, select
+import database
+import deletion
+from models import ArchivedTask, Category, CategoryStats, Task
+
+
+def _count(model) -> int:
+    with database.session_scope() as session:
+        return session.scalar(select(func.count()).select_from(model))
+
+
+def test_deleted_category_is_hidden_and_recreatable(
+    client, user_id, make_category, make_task
+):
+    category_id = make_category("work")
+    make_task(category_id)
+    res = client.delete(f"/api/category/{category_id}?user_id={user_id}")
+    assert res.status_code == 200
+    assert client.get(f"/api/categories?user_id={user_id}").get_json() == []
+    assert client.get(f"/api/board?user_id={user_id}").get_json()["categories"] == []
+    res = client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    assert res.status_code == 404
+    assert make_category("work") != category_id
+
+
+def test_no_writes_into_deleted_category(client, user_id, make_category):
+    category_id = make_category()
+    client.delete(f"/api/category/{category_id}?user_id={user_id}")
+    res = client.post(
+        "/api/task",
+        json={"title": "t", "user_id": user_id, "category_id": category_id},
+    )
+    assert res.status_code == 404
+    res = client.post(
+        "/api/tasks/batch",
+        json={
+            "user_id": user_id,
+            "operations": [{"op": "create", "title": "t", "category_id": category_id}],
+        },
+    )
+    assert res.status_code == 200
+    (result,) = res.get_json()["results"]
+    assert result["ok"] is False and result["status"] == 404
+    assert _count(Task) == 0
+
+
+def test_deleted_task_is_hidden(client, user_id, make_category, make_task, task_ids):
+    category_id = make_category()
+    a, b = make_task(category_id, "a"), make_task(category_id, "b")
+    assert client.delete(f"/api/task/{a}?user_id={user_id}").status_code == 200
+    assert task_ids(category_id) == [b]
+    assert (
+        client.patch(
+            f"/api/task/{a}", json={"user_id": user_id, "title": "x"}
+        ).status_code
+        == 404
+    )
+    assert client.delete(f"/api/task/{a}?user_id={user_id}").status_code == 404
+
+
+def test_purge_removes_rows(client, user_id, make_category, make_task):
+    category_id, kept = make_category("gone"), make_category("kept")
+    for i in range(5):
+        make_task(category_id, f"t{i}")
+    make_task(category_id, "old", status="archived")
+    removed = make_task(kept, "removed")
+    make_task(kept, "stays")
+    client.delete(f"/api/category/{category_id}?user_id={user_id}")
+    client.delete(f"/api/task/{removed}?user_id={user_id}")
+    status = client.get(f"/api/category/{category_id}/deletion?user_id={user_id}")
+    assert status.get_json()["done"] is False
+
+    deletion.purge(batch=2)
+
+    assert _count(Task) == 1
+    assert _count(ArchivedTask) == 0
+    with database.session_scope() as session:
+        assert session.scalars(select(Category.category_id)).all() == [kept]
+        assert session.scalars(select(CategoryStats.category_id)).all() == [kept]
+    status = client.get(f"/api/category/{category_id}/deletion?user_id={user_id}")
+    assert status.get_json() == {
+        "category_id": category_id,
+        "done": True,
+        "remaining_tasks": 0,
+    }
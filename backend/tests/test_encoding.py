@@ -0,0 +1,81 @@
+import gzip
+import json
+from datetime import datetime
+import brotli
+import pytest
+import encoding
+from config import Config
+
+
+def test_rows_drop_extra_columns():
+    rows = encoding.rows(("a", "b"), [(1, 2, "cursor"), (3, 4, "cursor")])
+    assert [(row.a, row.b) for row in rows] == [(1, 2), (3, 4)]
+    assert encoding.row_type(("a", "b")) is type(rows[0])
+
+
+@pytest.mark.parametrize("name", sorted(encoding.ENCODERS))
+def test_encoders_agree(name):
+    row = encoding.rows(("title", "at"), [("タスク", datetime(2024, 1, 2, 3, 4, 5))])
+    body = {"items": row, "n": 1}
+    assert json.loads(encoding.ENCODERS[name](body)) == {
+        "items": [{"title": "タスク", "at": "2024-01-02T03:04:05"}],
+        "n": 1,
+    }
+
+
+def test_unknown_objects_are_rejected():
+    with pytest.raises(TypeError):
+        encoding._dumps_json({"x": object()})
+
+
+@pytest.fixture
+def big_list(client, user_id, make_category):
+    category_id = make_category()
+    res = client.post(
+        "/api/tasks/batch",
+        json={
+            "user_id": user_id,
+            "operations": [
+                {"op": "create", "category_id": category_id, "title": f"task {n}"}
+                for n in range(40)
+            ],
+        },
+    )
+    assert res.status_code == 200, res.get_json()
+    return f"/api/tasks?user_id={user_id}&category_id={category_id}"
+
+
+def test_list_is_compressed(client, big_list):
+    plain = client.get(big_list)
+    assert "Content-Encoding" not in plain.headers
+    assert len(plain.data) >= Config.COMPRESS_MIN_BYTES
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    res = client.get(big_list, headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(res.data) == plain.data
+
+    # キャッシュ済みの本文も、要求ごとの Accept-Encoding で圧縮する
+    res = client.get(big_list, headers={"Accept-Encoding": "gzip, br"})
+    assert res.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(res.data) == plain.data
+    res = client.get(big_list, headers={"Accept-Encoding": "br;q=0.5, gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    # ETag は圧縮方式によらず同じ
+    assert res.headers["ETag"] == plain.headers["ETag"]
+
+
+def test_small_responses_are_not_compressed(client, user_id, make_category):
+    make_category()
+    res = client.get(
+        f"/api/categories?user_id={user_id}", headers={"Accept-Encoding": "gzip"}
+    )
+    assert res.status_code == 200
+    assert "Content-Encoding" not in res.headers
+
+
+def test_errors_are_not_compressed(client, monkeypatch):
+    monkeypatch.setattr(Config, "COMPRESS_MIN_BYTES", 0)
+    res = client.get("/api/tasks", headers={"Accept-Encoding": "gzip"})
+    assert res.status_code == 400
+    assert "error" in res.get_json()
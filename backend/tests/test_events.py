@@ -0,0 +1,151 @@
+import json
+import queue
+import threading
+import pytest
+import database
+import events
+from config import Config
+
+
+@pytest.fixture(autouse=True)
+def hub(monkeypatch):
+    hub = events.Hub(Config.EVENTS_BUFFER)
+    monkeypatch.setattr(events, "hub", hub)
+    return hub
+
+
+@pytest.fixture
+def inbox(hub, user_id):
+    inbox = queue.Queue()
+    hub.subscribe(user_id, inbox.put)
+    yield inbox
+    hub.unsubscribe(user_id, inbox.put)
+
+
+def _drain(inbox) -> list:
+    deltas = []
+    while not inbox.empty():
+        deltas.append(inbox.get_nowait())
+    return deltas
+
+
+def test_writes_are_published(client, user_id, make_category, inbox):
+    category_id = make_category()
+    res = client.post(
+        "/api/task", json={"title": "t", "user_id": user_id, "category_id": category_id}
+    )
+    task_id = res.get_json()["task_id"]
+    client.delete(f"/api/task/{task_id}?user_id={user_id}")
+
+    deltas = _drain(inbox)
+    assert [(d["entity"], d["op"]) for d in deltas] == [
+        ("category", "create"),
+        ("task", "create"),
+        ("task", "delete"),
+    ]
+    assert deltas[1]["id"] == task_id
+    assert deltas[1]["fields"]["task_title"] == "t"
+    assert len({d["event_id"] for d in deltas}) == 3
+
+
+def test_rolled_back_writes_are_not_published(user_id, inbox):
+    with pytest.raises(RuntimeError):
+        with database.session_scope() as session:
+            events.record(session, user_id, "task", "create", 1)
+            raise RuntimeError
+    assert _drain(inbox) == []
+
+
+def test_large_commits_become_reload(user_id, inbox, monkeypatch):
+    monkeypatch.setattr(Config, "EVENTS_MAX_PER_COMMIT", 2)
+    with database.session_scope() as session:
+        for task_id in (1, 2, 3):
+            events.record(session, user_id, "task", "update", task_id)
+    deltas = _drain(inbox)
+    assert [(d["entity"], d["op"]) for d in deltas] == [("board", "reload")]
+
+
+def test_only_the_users_events_are_delivered(make_user, user_id, inbox):
+    other = make_user("other")
+    with database.session_scope() as session:
+        events.record(session, other, "task", "create", 1)
+    assert _drain(inbox) == []
+
+
+def test_replay_after_last_event_id(hub):
+    for n in range(3):
+        hub.publish({"event_id": f"e{n}", "user_id": 1, "entity": "task", "op": "x"})
+    hub.publish({"event_id": "o", "user_id": 2, "entity": "task", "op": "x"})
+    hub.publish({"event_id": "e3", "user_id": 1, "entity": "task", "op": "x"})
+    callback = queue.Queue().put
+    replay = hub.subscribe(1, callback, "e1")
+    assert [e["event_id"] for e in replay] == ["e2", "e3"]
+    assert hub.subscribe(1, callback, "unknown") is None
+    hub.reset()
+    assert hub.subscribe(1, callback, "e1") is None
+
+
+def test_stream_sends_reload_for_unknown_last_event_id(user_id):
+    stream = events.stream(user_id, "unknown")
+    assert next(stream) == "retry: 3000\n\n"
+    chunk = next(stream)
+    assert "event: board" in chunk
+    assert json.loads(chunk.split("data: ")[1]) == {"entity": "board", "op": "reload"}
+    stream.close()
+
+
+def test_events_endpoint(client, user_id, hub):
+    hub.publish({"event_id": "e0", "user_id": user_id, "entity": "task", "op": "x"})
+    hub.publish({"event_id": "e1", "user_id": user_id, "entity": "task", "op": "y"})
+    res = client.get(
+        f"/api/events?user_id={user_id}",
+        headers={"Last-Event-ID": "e0"},
+        buffered=False,
+    )
+    assert res.status_code == 200
+    assert res.mimetype == "text/event-stream"
+    chunks = res.response
+    assert next(chunks) == b"retry: 3000\n\n"
+    assert next(chunks).startswith(b"id: e1\nevent: task\n")
+    res.close()
+    assert client.get("/api/events").status_code == 400
+
+
+# LISTEN/NOTIFY 経由(コミット後に別接続の LISTEN から届く)
+@pytest.mark.postgres
+def test_notifications_arrive_through_listen(engine, user_id, make_category, inbox):
+    events.ensure_listener(engine)
+    # LISTEN はバックグラウンドで始まるため、届くまで書き込みを繰り返す
+    for _ in range(50):
+        make_category()
+        try:
+            delta = inbox.get(timeout=0.2)
+            break
+        except queue.Empty:
+            continue
+    else:
+        pytest.fail("通知が届きません")
+    assert (delta["entity"], delta["op"]) == ("category", "create")
+
+
+# LISTEN をつなぎ直した後は、切れていた間の差分の代わりに全員へ reload を送る
+def test_reload_all_reaches_every_subscriber(hub, make_user, user_id, inbox):
+    other = make_user("other")
+    other_inbox = queue.Queue()
+    hub.subscribe(other, other_inbox.put)
+    hub.reload_all()
+    assert _drain(inbox) == [{"event_id": "", **events._reload(user_id)}]
+    assert _drain(other_inbox) == [{"event_id": "", **events._reload(other)}]
+
+
+def test_sync_streams_are_limited(client, user_id, monkeypatch):
+    monkeypatch.setattr(events, "sync_streams", threading.BoundedSemaphore(1))
+    url = f"/api/events?user_id={user_id}"
+    first = client.get(url, buffered=False)
+    assert first.status_code == 200
+    res = client.get(url, buffered=False)
+    assert res.status_code == 503
+    first.close()
+    res = client.get(url, buffered=False)
+    assert res.status_code == 200
+    res.close()
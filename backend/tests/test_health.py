@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import database
+import health
+import migrate
+import routing
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(health, "_schema_ready", set())
+
+
+def _mark_migrated(engine):
+    migrate.applied_versions(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:v)"),
+            {"v": migrate.latest_version()},
+        )
+
+
+def test_healthz(client):
+    assert client.get("/healthz").get_json() == {"status": "ok"}
+
+
+@pytest.mark.skipif(
+    os.getenv("TEST_DATABASE_URL"), reason="SQLite のスキーマで確認する"
+)
+def test_readyz_waits_for_migrations(client, engine):
+    res = client.get("/readyz")
+    assert res.status_code == 503
+    assert res.get_json()["error"] == "未適用のマイグレーションがあります"
+    _mark_migrated(engine)
+    try:
+        res = client.get("/readyz")
+        assert res.status_code == 200
+        assert res.get_json() == {"status": "ready"}
+    finally:
+        # schema_migrations はモデルにないため、drop_all では消えない
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE schema_migrations"))
+
+
+def test_readyz_reports_unreachable_database(client, monkeypatch, tmp_path):
+    url = f"sqlite:///{tmp_path}/missing/db.sqlite"
+    monkeypatch.setattr(routing, "all_urls", lambda: [url])
+    res = client.get("/readyz")
+    assert res.status_code == 503
+    assert res.get_json()["error"] == "DB に接続できません: OperationalError"
+
+
+def test_wait_for_db_gives_up(monkeypatch, tmp_path):
+    sleeps = []
+    monkeypatch.setattr(database.time, "sleep", sleeps.append)
+    with pytest.raises(OperationalError):
+        database.wait_for_db(0.05, f"sqlite:///{tmp_path}/missing/db.sqlite")
+    assert sleeps and sleeps[0] <= 0.1
+
+
+# import しただけでは DB に接続せず、エンジンも作らない(DB がなくても起動できる)
+def test_app_starts_without_database():
+    app_dir = os.path.dirname(database.__file__)
+    env = dict(os.environ, DATABASE_URL="postgresql://u:p@127.0.0.1:1/db")
+    code = (
+        "import main, asgi, database\n"
+        "assert database._engines == {}\n"
+        "client = main.app.test_client()\n"
+        "assert client.get('/healthz').status_code == 200\n"
+        "assert client.get('/readyz').status_code == 503\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code], cwd=app_dir, env=env, check=True, timeout=60
+    )
+
+
+def test_split_statements():
+    sql = "-- comment\nCREATE INDEX a ON t (x);\n\nCREATE INDEX b ON t (y);\n"
+    assert migrate._statements(sql) == [
+        "CREATE INDEX a ON t (x)",
+        "CREATE INDEX b ON t (y)",
+    ]
+
+
+@pytest.mark.postgres
+def test_migrations_are_applied_once(engine, client):
+    with engine.connect() as conn:
+        assert migrate.schema_is_current(conn)
+    assert migrate.migrate(engine) == []
+    assert client.get("/readyz").status_code == 200
@@ -0,0 +1,138 @@
+from datetime import timedelta
+import pytest
+from sqlalchemy import select, update
+import database
+import jobs
+import worker
+from config import Config
+from models import Job
+
+
+def _job(job_id) -> Job:
+    with database.session_scope() as session:
+        job = session.get(Job, job_id)
+        session.expunge(job)
+        return job
+
+
+def _enqueue(kind, **kwargs) -> int:
+    with database.session_scope() as session:
+        return jobs.enqueue(session, kind, **kwargs)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def succeed(payload):
+        calls.append(payload)
+        return {"n": payload["n"] * 2}
+
+    def explode(payload):
+        calls.append(payload)
+        raise ValueError("boom")
+
+    monkeypatch.setitem(jobs.handlers, "test.ok", succeed)
+    monkeypatch.setitem(jobs.handlers, "test.fail", explode)
+    return calls
+
+
+def test_run_job(calls):
+    job_id = _enqueue("test.ok", payload={"n": 2})
+    assert worker.drain() == 1
+    assert calls == [{"n": 2}]
+    job = _job(job_id)
+    assert job.status == "done"
+    assert job.attempts == 1
+    assert job.result == {"n": 4}
+    assert worker.drain() == 0
+
+
+def test_enqueue_rolls_back_with_the_request(calls):
+    with pytest.raises(RuntimeError):
+        with database.session_scope() as session:
+            jobs.enqueue(session, "test.ok", payload={"n": 1})
+            raise RuntimeError
+    assert worker.drain() == 0
+
+
+def test_delayed_job_waits(calls):
+    _enqueue("test.ok", payload={"n": 1}, delay=60)
+    assert worker.drain() == 0
+
+
+def test_same_key_reuses_queued_job(calls):
+    first = _enqueue("test.ok", payload={"n": 1}, key="k", delay=60)
+    second = _enqueue("test.ok", payload={"n": 1}, key="k")
+    assert first == second
+    # 実行予定は早い方に合わせる
+    assert worker.drain() == 1
+
+
+def test_failed_job_is_retried_then_failed(calls, monkeypatch):
+    job_id = _enqueue("test.fail", payload={"n": 1}, max_attempts=2)
+    assert worker.drain() == 1
+    job = _job(job_id)
+    assert (job.status, job.attempts) == ("queued", 1)
+    assert "ValueError: boom" in job.last_error
+    assert worker.drain() == 0  # 待ち時間の間は実行しない
+
+    with database.session_scope() as session:
+        session.execute(update(Job).values(run_at=jobs._now()))
+    assert worker.drain() == 1
+    assert _job(job_id).status == "failed"
+    assert len(calls) == 2
+
+
+def test_unknown_kind_fails():
+    job_id = _enqueue("test.unknown", max_attempts=1)
+    assert worker.drain() == 1
+    job = _job(job_id)
+    assert job.status == "failed"
+    assert "未登録のジョブです" in job.last_error
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(Config, "JOB_BACKOFF_SECONDS", 10)
+    monkeypatch.setattr(Config, "JOB_BACKOFF_MAX_SECONDS", 30)
+    assert 5 <= jobs.backoff_seconds(1) <= 10
+    assert 10 <= jobs.backoff_seconds(2) <= 20
+    assert 15 <= jobs.backoff_seconds(10) <= 30
+
+
+def test_stale_running_job_is_requeued(calls):
+    job_id = _enqueue("test.ok", payload={"n": 1})
+    with database.session_scope() as session:
+        assert jobs.claim(session, "lost")["job_id"] == job_id
+    with database.session_scope() as session:
+        assert jobs.requeue_stale(session) == 0
+        old = jobs._now() - timedelta(seconds=Config.JOB_TIMEOUT_SECONDS + 1)
+        session.execute(update(Job).values(locked_at=old))
+    with database.session_scope() as session:
+        assert jobs.requeue_stale(session) == 1
+    assert worker.drain() == 1
+    assert _job(job_id).status == "done"
+
+
+def _queued_kinds() -> list:
+    with database.session_scope() as session:
+        kinds = session.scalars(select(Job.kind).where(Job.status == "queued")).all()
+    return sorted(kinds)
+
+
+def test_schedule_registers_periodic_jobs_once():
+    worker.schedule()
+    worker.schedule()
+    # 削除待ちがなければ deletion.purge は登録しない
+    assert _queued_kinds() == sorted(set(worker.PERIODIC) - {"deletion.purge"})
+
+
+def test_schedule_registers_deletion_purge_when_rows_are_pending(
+    client, user_id, make_category, make_task
+):
+    task_id = make_task(make_category())
+    res = client.delete(f"/api/task/{task_id}?user_id={user_id}")
+    assert res.status_code == 200
+    worker.schedule()
+    worker.schedule()
+    assert _queued_kinds() == sorted(worker.PERIODIC)
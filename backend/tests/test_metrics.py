@@ -0,0 +1,68 @@
+import logging
+import pytest
+import metrics
+from config import Config
+
+LIST = ("GET", "/api/tasks")
+
+
+# 集計はプロセス内で累積するため、テストごとに空にする
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "_latency", {})
+    monkeypatch.setattr(metrics, "_queries", {})
+    monkeypatch.setattr(
+        metrics,
+        "_counters",
+        {"rows": {}, "n_plus_one": {}, "requests": {}, "slow_queries": 0},
+    )
+
+
+def test_histogram_is_cumulative():
+    hist = metrics.Histogram((1, 5))
+    for value in (0.5, 3, 10):
+        hist.observe(value)
+    assert hist.counts == [1, 2]
+    assert hist.count == 3
+    assert hist.sum == 13.5
+
+
+def test_requests_are_counted_per_route(client, user_id, make_category):
+    category_id = make_category()
+    for _ in range(2):
+        client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    client.get("/api/tasks")
+
+    assert metrics._counters["requests"][LIST + (200,)] == 2
+    assert metrics._counters["requests"][LIST + (400,)] == 1
+    assert metrics._latency[LIST].count == 3
+    # 成功した一覧は SQL を実行している
+    assert metrics._queries[LIST].sum > 0
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert (
+        'todo_requests_total{method="GET",endpoint="/api/tasks",status="200"} 2' in text
+    )
+    assert 'todo_request_queries_count{method="GET",endpoint="/api/tasks"} 3' in text
+    # パスのパラメータは値ではなくルートのパターンで集計する
+    client.delete(f"/api/category/{category_id}?user_id={user_id}")
+    assert ("DELETE", "/api/category/<int:category_id>", 200) in metrics._counters[
+        "requests"
+    ]
+
+
+def test_query_count_warning(client, user_id, make_category, monkeypatch, caplog):
+    monkeypatch.setattr(Config, "QUERY_COUNT_WARN", 0)
+    category_id = make_category()
+    with caplog.at_level(logging.WARNING, logger="todo.metrics"):
+        client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    assert metrics._counters["n_plus_one"][LIST] == 1
+    assert any("N+1" in record.message for record in caplog.records)
+
+
+def test_slow_query_log(client, user_id, monkeypatch, caplog):
+    monkeypatch.setattr(Config, "SLOW_QUERY_MS", 0.000001)
+    with caplog.at_level(logging.WARNING, logger="todo.metrics"):
+        client.get(f"/api/categories?user_id={user_id}")
+    assert metrics._counters["slow_queries"] > 0
+    assert any("スロークエリー" in record.message for record in caplog.records)
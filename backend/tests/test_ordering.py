@@ -0,0 +1,111 @@
+import pytest
+from ordering import SORT_GAP, sort_order_between
+
+
+def test_sort_order_between():
+    assert sort_order_between(None, None) == 0
+    assert sort_order_between(None, 0) == -SORT_GAP
+    assert sort_order_between(SORT_GAP, None) == 2 * SORT_GAP
+    assert sort_order_between(0, SORT_GAP) == SORT_GAP // 2
+    assert sort_order_between(4, 5) is None
+
+
+def test_add_appends_with_gap(client, user_id, make_category, make_task):
+    category_id = make_category()
+    for title in ("a", "b", "c"):
+        make_task(category_id, title)
+    tasks = client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    assert [t["sort_order"] for t in tasks.get_json()] == [0, SORT_GAP, 2 * SORT_GAP]
+
+
+def test_move_task_updates_only_that_row(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    a, b, c = (make_task(category_id, title) for title in "abc")
+    res = client.patch(
+        f"/api/task/{c}/move", json={"user_id": user_id, "prev_id": a, "next_id": b}
+    )
+    assert res.status_code == 200
+    assert res.get_json()["sort_order"] == SORT_GAP // 2
+    assert task_ids(category_id) == [a, c, b]
+
+    res = client.patch(f"/api/task/{a}/move", json={"user_id": user_id, "prev_id": b})
+    assert res.status_code == 200
+    assert task_ids(category_id) == [c, b, a]
+
+
+def test_move_task_rebalances_when_gap_is_exhausted(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    first, second = make_task(category_id, "first"), make_task(category_id, "second")
+    moved = [make_task(category_id, f"t{i}") for i in range(12)]
+    # 毎回 first と(前回移動した)タスクの間に入れると隙間が半分ずつ減る
+    upper = second
+    for task_id in moved:
+        res = client.patch(
+            f"/api/task/{task_id}/move",
+            json={"user_id": user_id, "prev_id": first, "next_id": upper},
+        )
+        assert res.status_code == 200, res.get_json()
+        upper = task_id
+    assert task_ids(category_id) == [first, *reversed(moved), second]
+    tasks = client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    orders = [t["sort_order"] for t in tasks.get_json()]
+    assert orders == sorted(set(orders))
+
+
+def test_move_task_rejects_bad_neighbours(client, user_id, make_category, make_task):
+    category_id, other = make_category("a"), make_category("b")
+    a, b = make_task(category_id, "a"), make_task(category_id, "b")
+    elsewhere = make_task(other, "x")
+    url = f"/api/task/{a}/move"
+    assert client.patch(url, json={"user_id": user_id}).status_code == 400
+    res = client.patch(url, json={"user_id": user_id, "prev_id": elsewhere})
+    assert res.status_code == 400
+    res = client.patch(url, json={"user_id": user_id, "prev_id": b, "next_id": a})
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "values",
+    [{"prev_id": "abc"}, {"next_id": "1"}, {"prev_id": True}, {"next_id": 1.5}],
+)
+def test_move_task_rejects_non_integer_ids(
+    client, user_id, make_category, make_task, values
+):
+    category_id = make_category()
+    a, b = make_task(category_id, "a"), make_task(category_id, "b")
+    res = client.patch(f"/api/task/{a}/move", json={"user_id": user_id, **values})
+    assert res.status_code == 400
+    res = client.patch(
+        f"/api/task/{a}/move",
+        json={"user_id": user_id, "prev_id": b, "version": "abc"},
+    )
+    assert res.status_code == 400
+    res = client.patch(
+        f"/api/task/{a}", json={"user_id": user_id, "title": "x", "version": "abc"}
+    )
+    assert res.status_code == 400
+
+
+def test_delete_keeps_other_sort_orders(client, user_id, make_category, make_task):
+    category_id = make_category()
+    a, b, c = (make_task(category_id, title) for title in "abc")
+    assert client.delete(f"/api/task/{b}?user_id={user_id}").status_code == 200
+    tasks = client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    assert [(t["task_id"], t["sort_order"]) for t in tasks.get_json()] == [
+        (a, 0),
+        (c, 2 * SORT_GAP),
+    ]
+
+
+def test_move_category(client, user_id, make_category):
+    a, b, c = (make_category(title) for title in "abc")
+    res = client.patch(
+        f"/api/category/{a}/move", json={"user_id": user_id, "prev_id": c}
+    )
+    assert res.status_code == 200
+    categories = client.get(f"/api/categories?user_id={user_id}").get_json()
+    assert [cat["category_id"] for cat in categories] == [b, c, a]
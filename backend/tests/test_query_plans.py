@@ -0,0 +1,42 @@
+import pytest
+
+# scripts/explain_check.py と同じチェック。大量のデータを投入してから各エンドポイントを
+# 呼び出し、発行された文の実行計画に tasks/categories の Seq Scan や Sort がないことを確かめる
+
+
+@pytest.fixture
+def explain_check():
+    import explain_check
+
+    explain_check.seed(users=200, categories=20, tasks=200)
+    return explain_check
+
+
+@pytest.mark.postgres
+def test_endpoints_use_indexes(explain_check):
+    results = explain_check.explain(explain_check.capture_statements())
+    checked = {name for name, _, _ in results}
+    assert {"GET /tasks", "GET /board", "GET /tasks/search"} <= checked
+    problems = [
+        f"{name}: {', '.join(found)}: {' '.join(statement.split())}"
+        for name, statement, found in results
+        if found
+    ]
+    assert problems == []
+
+
+def test_find_problems():
+    from explain_check import find_problems
+
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [
+            {
+                "Node Type": "Sort",
+                "Plans": [{"Node Type": "Seq Scan", "Relation Name": "tasks"}],
+            }
+        ],
+    }
+    assert find_problems(plan) == ["Sort", "Seq Scan on tasks"]
+    assert find_problems(plan, allow_sort=True) == ["Seq Scan on tasks"]
+    assert find_problems({"Node Type": "Seq Scan", "Relation Name": "users"}) == []
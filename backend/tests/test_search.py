@@ -0,0 +1,85 @@
+import pytest
+
+
+@pytest.fixture
+def add(client, user_id):
+    def add(category_id, title, content="", uid=None):
+        res = client.post(
+            "/api/task",
+            json={
+                "title": title,
+                "content": content,
+                "user_id": uid or user_id,
+                "category_id": category_id,
+            },
+        )
+        assert res.status_code == 201, res.get_json()
+        return res.get_json()["task_id"]
+
+    return add
+
+
+def _search(client, user_id, query):
+    return client.get(f"/api/tasks/search?user_id={user_id}&{query}")
+
+
+def test_title_matches_rank_first(client, user_id, make_category, add):
+    category_id = make_category()
+    in_content = add(category_id, "other", "buy milk today")
+    in_title = add(category_id, "Milk")
+    add(category_id, "unrelated")
+    res = _search(client, user_id, "q=milk")
+    assert res.status_code == 200
+    assert [t["task_id"] for t in res.get_json()] == [in_title, in_content]
+    assert res.get_json()[0]["rank"] > res.get_json()[1]["rank"]
+
+
+def test_wildcards_are_literal(client, user_id, make_category, add):
+    category_id = make_category()
+    percent = add(category_id, "100% done")
+    add(category_id, "100 done")
+    res = _search(client, user_id, "q=100%25")
+    assert [t["task_id"] for t in res.get_json()] == [percent]
+
+
+def test_search_pages_with_cursor(client, user_id, make_category, add):
+    category_id = make_category()
+    ids = {add(category_id, f"task {n}") for n in range(5)}
+    seen = []
+    res = _search(client, user_id, "q=task&limit=2")
+    while True:
+        seen += [t["task_id"] for t in res.get_json()]
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        res = _search(client, user_id, f"q=task&limit=2&cursor={cursor}")
+    assert sorted(seen) == sorted(ids)
+
+
+def test_search_filters(client, user_id, make_user, make_category, make_task, add):
+    first = make_category("first")
+    second = make_category("second")
+    a = add(first, "report")
+    b = add(second, "report")
+    archived = make_task(second, "report", status="archived")
+    other = make_user("other")
+    add(make_category("theirs", other), "report", uid=other)
+
+    res = _search(client, user_id, "q=report")
+    assert sorted(t["task_id"] for t in res.get_json()) == [a, b]
+    res = _search(client, user_id, f"q=report&category_id={first}")
+    assert [t["task_id"] for t in res.get_json()] == [a]
+    res = _search(client, user_id, "q=report&status=archived")
+    assert [t["task_id"] for t in res.get_json()] == [archived]
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["q=", "q=" + "x" * 101, "q=a&limit=0", "q=a&limit=101", "q=a&cursor=broken"],
+)
+def test_search_validation(client, user_id, query):
+    assert _search(client, user_id, query).status_code == 400
+
+
+def test_search_in_unknown_category(client, user_id):
+    assert _search(client, user_id, "q=a&category_id=999").status_code == 404
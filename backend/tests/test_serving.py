@@ -0,0 +1,70 @@
+import os
+import runpy
+import database
+from config import Config
+
+
+def _engine_options(monkeypatch, url):
+    captured = {}
+
+    def create_engine(url, **options):
+        captured.update(options)
+
+    monkeypatch.setattr(database, "create_engine", create_engine)
+    database.build_engine(url)
+    return captured
+
+
+def test_postgres_engine_uses_pool_settings(monkeypatch):
+    monkeypatch.setattr(Config, "DB_POOL_SIZE", 7)
+    monkeypatch.setattr(Config, "DB_MAX_OVERFLOW", 3)
+    monkeypatch.setattr(Config, "DB_STATEMENT_TIMEOUT_MS", 1500)
+    options = _engine_options(monkeypatch, "postgresql://u:p@localhost/db")
+    assert options["pool_size"] == 7
+    assert options["max_overflow"] == 3
+    assert options["pool_pre_ping"] == Config.DB_POOL_PRE_PING
+    assert options["connect_args"] == {
+        "connect_timeout": Config.DB_CONNECT_TIMEOUT,
+        "options": "-c statement_timeout=1500",
+    }
+
+
+def test_statement_timeout_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(Config, "DB_STATEMENT_TIMEOUT_MS", 0)
+    options = _engine_options(monkeypatch, "postgresql://u:p@localhost/db")
+    assert "options" not in options["connect_args"]
+
+
+def test_sqlite_engine_has_no_pool_options(monkeypatch):
+    options = _engine_options(monkeypatch, "sqlite:///x.db")
+    assert "pool_size" not in options
+    assert options["connect_args"] == {}
+
+
+def test_gunicorn_settings_come_from_config(monkeypatch):
+    path = os.path.join(os.path.dirname(database.__file__), "gunicorn.conf.py")
+    monkeypatch.setattr(Config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(Config, "WEB_WORKERS", 4)
+    monkeypatch.setattr(Config, "WEB_THREADS", 8)
+    conf = runpy.run_path(path)
+    assert conf["workers"] == 4
+    assert conf["threads"] == 8
+    assert conf["worker_class"] == "gthread"
+    assert conf["preload_app"] is True
+
+    monkeypatch.setattr(Config, "WEB_THREADS", 1)
+    assert runpy.run_path(path)["worker_class"] == "sync"
+
+
+def test_post_fork_discards_inherited_connections(monkeypatch):
+    disposed = []
+
+    class Engine:
+        def dispose(self, close=True):
+            disposed.append(close)
+
+    monkeypatch.setattr(database, "_engines", {"a": Engine(), "b": Engine()})
+    path = os.path.join(os.path.dirname(database.__file__), "gunicorn.conf.py")
+    monkeypatch.setattr(Config, "CACHE_BACKEND", "none")
+    runpy.run_path(path)["post_fork"](None, None)
+    assert disposed == [False, False]
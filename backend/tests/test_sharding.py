@@ -0,0 +1,185 @@
+import pytest
+from sqlalchemy import func, insert, select
+import cache
+import database
+import routing
+import sharding
+from config import Config
+from models import Category, User
+
+
+# ディレクトリはテストの DB、シャード s0・s1 は一時ディレクトリの SQLite。
+# 最初はすべてのバケットが s0
+@pytest.fixture
+def shard_map(tmp_path, monkeypatch):
+    shards = {}
+    for name in ("s0", "s1"):
+        url = f"sqlite:///{tmp_path}/{name}.db"
+        database.create_tables(database.engine_for(url))
+        shards[name] = {"url": url, "id_base": 0}
+    path = str(tmp_path / "shards.json")
+    sharding.save(
+        path, sharding.ShardMap({"buckets": 1, "shards": shards, "map": ["s0"]})
+    )
+    monkeypatch.setattr(Config, "SHARD_MAP", path)
+    monkeypatch.setattr(Config, "SHARD_MAP_RELOAD_SECONDS", 0)
+    monkeypatch.setattr(sharding, "_map", None)
+    return path
+
+
+def _count(name: str, model, user_id) -> int:
+    url = sharding.current().url(name)
+    with database.engine_for(url).connect() as conn:
+        return conn.scalar(
+            select(func.count()).select_from(model).where(model.user_id == user_id)
+        )
+
+
+def _register(client, name: str) -> int:
+    res = client.post(
+        "/api/auth/register",
+        json={"name": name, "email": f"{name}@example.com", "password": "password"},
+    )
+    assert res.status_code == 201, res.get_json()
+    return res.get_json()["user_id"]
+
+
+def test_user_rows_live_on_their_shard(client, shard_map):
+    user_id = _register(client, "alice")
+    res = client.post("/api/category", json={"title": "c", "user_id": user_id})
+    assert res.status_code == 201
+    assert _count("s0", User, user_id) == 1
+    assert _count("s0", Category, user_id) == 1
+    assert _count("s1", User, user_id) == 0
+    with database.session_scope() as session:
+        assert session.scalar(select(func.count()).select_from(Category)) == 0
+
+
+def test_move_bucket(client, shard_map, monkeypatch):
+    user_id = _register(client, "alice")
+    category_id = client.post(
+        "/api/category", json={"title": "c", "user_id": user_id}
+    ).get_json()["category_id"]
+    client.post(
+        "/api/task",
+        json={"title": "t", "user_id": user_id, "category_id": category_id},
+    )
+    states = []
+
+    # 移動中は読み取り・変更通知の購読はできるが更新は 503
+    def settle(seconds):
+        if not states:
+            res = client.get(f"/api/categories?user_id={user_id}")
+            states.append(res.status_code)
+            res = client.post("/api/category", json={"title": "x", "user_id": user_id})
+            states.append((res.status_code, res.headers.get("Retry-After")))
+            res = client.get(f"/api/events?user_id={user_id}", buffered=False)
+            states.append(res.status_code)
+            res.close()
+
+    monkeypatch.setattr(sharding.time, "sleep", settle)
+    assert sharding.move_bucket(shard_map, 0, "s1", settle=0) == 1
+    assert states == [200, (503, str(sharding.MOVING_RETRY_AFTER)), 200]
+    assert sharding.load(shard_map).assignment == ["s1"]
+    assert sharding.load(shard_map).moving == {}
+    assert _count("s0", Category, user_id) == 0
+    assert _count("s1", Category, user_id) == 1
+    tasks = client.get(f"/api/tasks?user_id={user_id}&category_id={category_id}")
+    assert [t["task_title"] for t in tasks.get_json()] == ["t"]
+
+
+# 移動中にする直前に登録されたユーザー(移動中をまだ読み込んでいないプロセスの登録)も移す
+def test_move_bucket_includes_users_registered_before_settling(
+    client, shard_map, monkeypatch
+):
+    early = _register(client, "early")
+    late = {}
+
+    def settle(seconds):
+        if late:
+            return
+        with database.session_scope() as session:
+            user = User(name="late", email="late@example.com", password_hash="x")
+            session.add(user)
+            session.flush()
+            late["user_id"] = user.user_id
+        with database.engine_for(sharding.current().url("s0")).begin() as conn:
+            conn.execute(
+                insert(User).values(
+                    user_id=late["user_id"],
+                    name="late",
+                    email="late@example.com",
+                    password_hash=sharding.NO_PASSWORD,
+                )
+            )
+
+    monkeypatch.setattr(sharding.time, "sleep", settle)
+    assert sharding.move_bucket(shard_map, 0, "s1", settle=0) == 2
+    for user_id in (early, late["user_id"]):
+        assert _count("s1", User, user_id) == 1
+        assert _count("s0", User, user_id) == 0
+    res = client.post("/api/category", json={"title": "c", "user_id": late["user_id"]})
+    assert res.status_code == 201
+    assert _count("s1", Category, late["user_id"]) == 1
+
+
+REPLICA = "sqlite:///replica.db"
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    monkeypatch.setattr(routing, "REPLICA_URLS", [REPLICA])
+    monkeypatch.setattr(routing, "_local_marks", cache.LRUBackend())
+    return REPLICA
+
+
+def test_reads_go_to_the_replica_until_the_user_writes(replica, monkeypatch):
+    assert routing.target(1, readonly=True) == replica
+    assert routing.target(1) == Config.DATABASE_URL
+    routing.mark_written(1)
+    # 自分の更新の直後はプライマリで読む(他のユーザーはレプリカのまま)
+    assert routing.target(1, readonly=True) == Config.DATABASE_URL
+    assert routing.target(2, readonly=True) == replica
+    later = routing.time.time() + Config.REPLICA_STICKY_SECONDS + 1
+    monkeypatch.setattr(routing.time, "time", lambda: later)
+    assert routing.target(1, readonly=True) == replica
+
+
+def test_sticky_reads_without_a_cache(replica, monkeypatch):
+    monkeypatch.setattr(cache, "backend", cache.NullBackend())
+    routing.mark_written(1)
+    assert routing.target(1, readonly=True) == Config.DATABASE_URL
+
+
+def test_committed_writes_mark_the_user(replica, user_id):
+    with database.session_scope(user_id):
+        pass
+    assert routing.target(user_id, readonly=True) == Config.DATABASE_URL
+
+
+# 更新直後のレプリカの読み取り(スティッキーの記録がない別プロセスなど)は、
+# 古いかもしれないため現在のバージョンでキャッシュせず、ETag も付けない
+def test_recent_writes_are_not_cached_from_replicas(
+    client, user_id, make_category, monkeypatch
+):
+    monkeypatch.setattr(routing, "REPLICA_URLS", [Config.DATABASE_URL])
+    monkeypatch.setattr(routing, "_sticky", lambda user_id: False)
+    make_category()
+    url = f"/api/categories?user_id={user_id}"
+    res = client.get(url)
+    assert res.status_code == 200
+    assert "ETag" not in res.headers
+    assert not routing.cacheable(cache.categories_scope(user_id))
+    later = cache.time.time() + Config.REPLICA_STICKY_SECONDS + 1
+    monkeypatch.setattr(cache.time, "time", lambda: later)
+    assert client.get(url).headers["ETag"]
+
+
+def test_sharding_ignores_replicas(client, shard_map, replica):
+    user_id = _register(client, "alice")
+    s0 = sharding.current().url("s0")
+    assert routing.target(user_id, readonly=True) == s0
+    assert routing.target(None, readonly=True) == Config.DATABASE_URL
+    with routing.use_shard("s1"):
+        assert routing.target() == sharding.current().url("s1")
+    assert routing.all_urls() == [Config.DATABASE_URL, s0, sharding.current().url("s1")]
@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import delete, select, update
+import database
+import stats
+from models import CategoryStats
+
+
+def _counts(client, user_id) -> dict:
+    res = client.get(f"/api/categories?user_id={user_id}&with_counts=1")
+    assert res.status_code == 200
+    return {c["category_id"]: c["counts"] for c in res.get_json()}
+
+
+def _drift() -> list:
+    return stats.repair(dry_run=True)
+
+
+def test_counts_follow_task_changes(client, user_id, make_category, make_task):
+    category_id = make_category()
+    a = make_task(category_id, "a")
+    b = make_task(category_id, "b", status="doing")
+    make_task(category_id, "c", status="archived")
+    make_task(category_id, "d", status="blocked")
+    assert _counts(client, user_id)[category_id] == {
+        "todo": 1,
+        "doing": 1,
+        "done": 0,
+        "other": 1,
+        "archived": 1,
+    }
+
+    client.patch(f"/api/task/{a}", json={"user_id": user_id, "status": "done"})
+    client.delete(f"/api/task/{b}?user_id={user_id}")
+    counts = _counts(client, user_id)[category_id]
+    assert (counts["todo"], counts["doing"], counts["done"]) == (0, 0, 1)
+    assert _drift() == []
+
+
+def test_batch_updates_counts(client, user_id, make_category):
+    category_id = make_category()
+    res = client.post(
+        "/api/tasks/batch",
+        json={
+            "user_id": user_id,
+            "operations": [
+                {"op": "create", "category_id": category_id, "title": "a"},
+                {"op": "create", "category_id": category_id, "title": "b"},
+            ],
+        },
+    )
+    assert res.status_code == 200, res.get_json()
+    assert _counts(client, user_id)[category_id]["todo"] == 2
+    assert _drift() == []
+
+
+def test_rolled_back_counts_are_discarded(user_id, make_category):
+    category_id = make_category()
+    with pytest.raises(RuntimeError):
+        with database.session_scope() as session:
+            stats.count(session, category_id, "todo", 5)
+            raise RuntimeError
+    assert _drift() == []
+
+
+def test_repair_fixes_drift(client, user_id, make_category, make_task):
+    category_id = make_category()
+    make_task(category_id)
+    with database.session_scope() as session:
+        session.execute(update(CategoryStats).values(todo=7, next_sort=0))
+
+    drift = _drift()
+    columns = {d["column"]: d for d in drift}
+    assert sorted(columns) == ["next_sort", "todo"]
+    assert (columns["todo"]["stored"], columns["todo"]["actual"]) == (7, 1)
+    assert columns["next_sort"]["actual"] > 0
+    assert _drift() == drift  # dry_run では直さない
+
+    assert stats.repair() == drift
+    assert _drift() == []
+    assert _counts(client, user_id)[category_id]["todo"] == 1
+
+
+def test_missing_stats_row_is_rebuilt(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    first = make_task(category_id, "a")
+    with database.session_scope() as session:
+        session.execute(delete(CategoryStats))
+    # 末尾の並び順を払い出すときに数え直して作る
+    second = make_task(category_id, "b")
+    assert task_ids(category_id) == [first, second]
+    with database.session_scope() as session:
+        row = session.scalar(select(CategoryStats))
+        assert row.todo == 2
+    assert _drift() == []
+
+
+def test_dry_run_exit_code(monkeypatch, user_id, make_category):
+    make_category()
+    with database.session_scope() as session:
+        session.execute(update(CategoryStats).values(todo=3))
+    monkeypatch.setattr("sys.argv", ["stats.py", "--dry-run"])
+    with pytest.raises(SystemExit) as exc:
+        stats.main()
+    assert exc.value.code == 1
+    monkeypatch.setattr("sys.argv", ["stats.py"])
+    stats.main()
+    assert _drift() == []
@@ -0,0 +1,64 @@
+def _get(client, query):
+    return client.get(f"/api/tasks?{query}")
+
+
+def test_keyset_pages_cover_the_list_once(
+    client, user_id, make_category, make_task, task_ids
+):
+    category_id = make_category()
+    created = [make_task(category_id, f"t{i}") for i in range(7)]
+    # 並び順が同じタスクも task_id で順序が決まる
+    client.patch(
+        f"/api/task/{created[3]}/move",
+        json={"user_id": user_id, "prev_id": created[0], "next_id": created[1]},
+    )
+    expected = task_ids(category_id)
+    pages, cursor = [], None
+    while True:
+        query = f"user_id={user_id}&category_id={category_id}&limit=3"
+        if cursor:
+            query += f"&cursor={cursor}"
+        res = _get(client, query)
+        assert res.status_code == 200
+        pages.append([t["task_id"] for t in res.get_json()])
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == expected
+
+
+def test_last_full_page_has_no_cursor(client, user_id, make_category, make_task):
+    category_id = make_category()
+    for i in range(3):
+        make_task(category_id, f"t{i}")
+    res = _get(client, f"user_id={user_id}&category_id={category_id}&limit=3")
+    assert len(res.get_json()) == 3
+    assert "X-Next-Cursor" not in res.headers
+
+
+def test_fields_projection(client, user_id, make_category, make_task):
+    category_id = make_category()
+    make_task(category_id, "a")
+    res = _get(
+        client, f"user_id={user_id}&category_id={category_id}&fields=task_id,task_title"
+    )
+    assert res.status_code == 200
+    (task,) = res.get_json()
+    assert set(task) == {"task_id", "task_title"}
+    # カーソル用の列はレスポンスに含めない
+    res = _get(
+        client, f"user_id={user_id}&category_id={category_id}&fields=status&limit=1"
+    )
+    assert res.get_json() == [{"status": "todo"}]
+
+
+def test_list_validation(client, user_id, make_category):
+    category_id = make_category()
+    base = f"user_id={user_id}&category_id={category_id}"
+    assert _get(client, f"user_id={user_id}").status_code == 400
+    assert _get(client, f"{base}&limit=0").status_code == 400
+    assert _get(client, f"{base}&limit=501").status_code == 400
+    assert _get(client, f"{base}&cursor=!!!").status_code == 400
+    assert _get(client, f"{base}&fields=task_id,password").status_code == 400
+    assert _get(client, f"user_id={user_id}&category_id=999").status_code == 404
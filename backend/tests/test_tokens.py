@@ -0,0 +1,172 @@
+import pytest
+from sqlalchemy import event
+import cache
+import database
+import tokens
+from config import Config
+from services.utils import owned_category_ids
+
+USER = {"user_id": 1, "name": "alice", "email": "alice@example.com"}
+
+
+def _bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _login(client, name="alice"):
+    client.post(
+        "/api/auth/register",
+        json={"name": name, "email": f"{name}@example.com", "password": "password123"},
+    )
+    res = client.post(
+        "/api/auth/login",
+        json={"email": f"{name}@example.com", "password": "password123"},
+    )
+    assert res.status_code == 200, res.get_json()
+    return res.get_json()
+
+
+def test_issue_and_verify():
+    token = tokens.issue(USER, [3, 1], "v1")
+    claims = tokens.verify(token)
+    assert claims["uid"] == 1
+    assert claims["cats"] == [1, 3]
+    assert claims["cv"] == "v1"
+
+    payload, _, signature = token.partition(".")
+    assert tokens.verify(f"{payload}x.{signature}") is None
+    assert tokens.verify(payload) is None
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(Config, "TOKEN_TTL_SECONDS", -1)
+    assert tokens.verify(tokens.issue(USER, [], "v1")) is None
+
+
+def test_too_many_categories_are_not_embedded(monkeypatch):
+    monkeypatch.setattr(Config, "TOKEN_MAX_CATEGORIES", 2)
+    claims = tokens.verify(tokens.issue(USER, [1, 2, 3], "v1"))
+    assert "cats" not in claims
+
+
+def test_resolve():
+    token = tokens.issue(USER, [], "v1")
+    claims, err = tokens.resolve(f"Bearer {token}", "1")
+    assert claims["uid"] == 1 and err is None
+    assert tokens.resolve(f"Basic {token}", None)[1][1] == 401
+    assert tokens.resolve("Bearer broken", None)[1][1] == 401
+    assert tokens.resolve(f"Bearer {token}", 2)[1][1] == 403
+    assert tokens.resolve(None, 2) == (None, None)
+
+
+def test_token_required(client, monkeypatch, user_id):
+    monkeypatch.setattr(Config, "AUTH_REQUIRE_TOKEN", True)
+    res = client.get(f"/api/categories?user_id={user_id}")
+    assert res.status_code == 401
+
+
+def test_token_identifies_the_user(client):
+    alice = _login(client)
+    bob = _login(client, "bob")
+    res = client.get("/api/auth/me", headers=_bearer(alice["token"]))
+    assert res.get_json()["email"] == "alice@example.com"
+
+    res = client.post(
+        "/api/category", json={"title": "c"}, headers=_bearer(alice["token"])
+    )
+    assert res.status_code == 201
+    res = client.get("/api/categories", headers=_bearer(alice["token"]))
+    assert [c["category_title"] for c in res.get_json()] == ["c"]
+
+    res = client.get(
+        f"/api/categories?user_id={bob['user_id']}", headers=_bearer(alice["token"])
+    )
+    assert res.status_code == 403
+
+
+def test_owned_categories_follow_the_cache_version():
+    version = cache.version(cache.categories_scope(1))
+    claims = tokens.verify(tokens.issue(USER, [5], version))
+    with database.session_scope() as session:
+        tokens.bind(session, claims)
+        # 最新のトークンなら DB を読まない(カテゴリー 5 は DB にない)
+        assert owned_category_ids(session, 1, [5, 6]) == {5}
+        assert tokens.owned_categories(session, 2) is None
+
+        cache.bump(cache.categories_scope(1))
+        assert tokens.owned_categories(session, 1) is None
+        assert owned_category_ids(session, 1, [5]) == set()
+
+
+def test_stale_token_still_sees_new_categories(client):
+    alice = _login(client)
+    headers = _bearer(alice["token"])
+    res = client.post("/api/category", json={"title": "new"}, headers=headers)
+    category_id = res.get_json()["category_id"]
+    # トークン発行後に作ったカテゴリーでも、cv が古いので DB で所有を確認する
+    res = client.post(
+        "/api/task", json={"title": "t", "category_id": category_id}, headers=headers
+    )
+    assert res.status_code == 201
+
+    res = client.post("/api/auth/refresh", headers=headers)
+    assert tokens.verify(res.get_json()["token"])["cats"] == [category_id]
+
+
+# 既定の設定(CACHE_URL なし = キャッシュなし)でもトークンの一覧で所有を確認する
+@pytest.fixture
+def default_cache(monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_URL", "")
+    monkeypatch.setattr(Config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(cache, "backend", cache.build_backend())
+    assert not cache.enabled()
+
+
+def _category_selects(engine, action) -> int:
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if "FROM categories" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        action()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+def test_default_cache_uses_the_embedded_categories(client, engine, default_cache):
+    alice = _login(client)
+    headers = _bearer(alice["token"])
+    category_id = client.post(
+        "/api/category", json={"title": "c"}, headers=headers
+    ).get_json()["category_id"]
+    # 発行後に作ったカテゴリーはトークンにないため DB で確認する
+    res = client.post(
+        "/api/task", json={"title": "t", "category_id": category_id}, headers=headers
+    )
+    assert res.status_code == 201
+
+    headers = _bearer(
+        client.post("/api/auth/refresh", headers=headers).get_json()["token"]
+    )
+
+    def add():
+        res = client.post(
+            "/api/task",
+            json={"title": "t", "category_id": category_id},
+            headers=headers,
+        )
+        assert res.status_code == 201
+
+    assert _category_selects(engine, add) == 0
+    # 他のユーザーのカテゴリーは通らない
+    bob = _login(client, "bob")
+    res = client.post(
+        "/api/task",
+        json={"title": "t", "category_id": category_id},
+        headers=_bearer(bob["token"]),
+    )
+    assert res.status_code == 404
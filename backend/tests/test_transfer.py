@@ -0,0 +1,109 @@
+import json
+import pytest
+
+
+def _ndjson(*records) -> str:
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+
+def _import(client, user_id, body: str):
+    return client.post(
+        f"/api/import?user_id={user_id}",
+        data=body.encode(),
+        content_type="application/x-ndjson",
+    )
+
+
+def _export(client, user_id) -> list:
+    res = client.get(f"/api/export?user_id={user_id}")
+    assert res.status_code == 200
+    assert res.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+
+
+def test_export_then_import_round_trip(client, make_user, make_category, make_task):
+    source = make_user("source")
+    work = make_category("work", uid=source)
+    a = make_task(work, "a", uid=source)
+    make_task(work, "b", uid=source)
+    make_task(work, "old", status="archived", uid=source)
+    client.patch(f"/api/task/{a}", json={"user_id": source, "content": "本文"})
+    exported = _export(client, source)
+    assert [r["type"] for r in exported] == ["category", "task", "task", "task"]
+
+    target = make_user("target")
+    res = _import(client, target, "".join(json.dumps(r) + "\n" for r in exported))
+    assert res.status_code == 200, res.get_json()
+    assert res.get_json() == {"categories": 1, "tasks": 3}
+    (category,) = client.get(f"/api/categories?user_id={target}").get_json()
+    tasks = client.get(
+        f"/api/tasks?user_id={target}&category_id={category['category_id']}"
+    ).get_json()
+    assert [(t["task_title"], t["content"]) for t in tasks] == [
+        ("a", "本文"),
+        ("b", ""),
+    ]
+    archived = client.get(
+        f"/api/tasks?user_id={target}&category_id={category['category_id']}"
+        "&status=archived"
+    ).get_json()
+    assert [t["task_title"] for t in archived] == ["old"]
+
+
+def test_import_appends_to_existing_category(client, user_id, make_category, make_task):
+    category_id = make_category("work")
+    existing = make_task(category_id, "existing")
+    body = _ndjson(
+        {"type": "category", "category_id": 7, "title": "work"},
+        {"type": "task", "category_id": 7, "title": "second", "sort_order": 2},
+        {"type": "task", "category_id": 7, "title": "first", "sort_order": 1},
+    )
+    res = _import(client, user_id, body)
+    assert res.status_code == 200, res.get_json()
+    assert res.get_json() == {"categories": 0, "tasks": 2}
+    tasks = client.get(
+        f"/api/tasks?user_id={user_id}&category_id={category_id}"
+    ).get_json()
+    assert [t["task_title"] for t in tasks] == ["existing", "first", "second"]
+    assert tasks[0]["task_id"] == existing
+    board = client.get(f"/api/board?user_id={user_id}").get_json()
+    assert board["categories"][0]["counts"]["todo"] == 3
+
+
+# 不正な行は(PostgreSQL の COPY の途中で見つかっても)行番号付きの 400 にする
+@pytest.mark.parametrize(
+    "record, message",
+    [
+        ({"type": "task", "category_id": "x", "title": "t"}, "category_id"),
+        ({"type": "task", "category_id": 1, "title": "t" * 33}, "32 文字"),
+        (
+            {"type": "task", "category_id": 1, "title": "t", "status": "s" * 33},
+            "status",
+        ),
+        (
+            {"type": "task", "category_id": 1, "title": "t", "sort_order": 2**63},
+            "sort_order",
+        ),
+        ({"type": "task", "category_id": -(2**63) - 1, "title": "t"}, "category_id"),
+        ({"type": "note", "category_id": 1, "title": "t"}, "type"),
+    ],
+)
+def test_import_rejects_invalid_line(client, user_id, record, message):
+    body = _ndjson({"type": "category", "category_id": 1, "title": "c"}, record)
+    res = _import(client, user_id, body + "not json\n")
+    assert res.status_code == 400
+    error = res.get_json()["error"]
+    assert error.startswith("2 行目") and message in error
+    assert client.get(f"/api/categories?user_id={user_id}").get_json() == []
+
+
+def test_import_rejects_broken_json_and_orphans(client, user_id):
+    res = _import(client, user_id, _ndjson({"type": "category"}) + "{broken\n")
+    assert res.status_code == 400
+    body = _ndjson({"type": "task", "category_id": 3, "title": "t"})
+    res = _import(client, user_id, body)
+    assert res.status_code == 400
+    assert "1 行目" in res.get_json()["error"]
+    # 失敗した取り込みの後も続けて取り込める
+    body = _ndjson({"type": "category", "category_id": 3, "title": "ok"})
+    assert _import(client, user_id, body).status_code == 200
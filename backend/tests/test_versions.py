@@ -0,0 +1,135 @@
+import pytest
+from services.utils import parse_if_match
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("*", None),
+        ('"v3"', 3),
+        ('W/"v3"', 3),
+        ("4", 4),
+        ('"v5", "v6"', 5),
+        ('"abc"', 0),
+    ],
+)
+def test_parse_if_match(header, expected):
+    assert parse_if_match(header) == expected
+
+
+def _patch(client, user_id, task_id, etag=None, **values):
+    headers = {} if etag is None else {"If-Match": etag}
+    return client.patch(
+        f"/api/task/{task_id}", json={"user_id": user_id, **values}, headers=headers
+    )
+
+
+def test_update_with_if_match(client, user_id, make_category, make_task):
+    task_id = make_task(make_category())
+    res = _patch(client, user_id, task_id, title="a")
+    assert res.status_code == 200
+    etag = res.headers["ETag"]
+    assert etag == f'"v{res.get_json()["version"]}"'
+
+    res = _patch(client, user_id, task_id, etag, title="b")
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+
+    # 古いバージョンでの更新は 409 と現在の状態
+    res = _patch(client, user_id, task_id, etag, title="c")
+    assert res.status_code == 409
+    current = res.get_json()["current"]
+    assert current["task_title"] == "b"
+    assert res.headers["ETag"] == f'"v{current["version"]}"'
+
+    # If-Match なしは従来どおり上書き
+    assert _patch(client, user_id, task_id, title="d").status_code == 200
+
+
+def test_version_in_body(client, user_id, make_category, make_task):
+    task_id = make_task(make_category())
+    version = _patch(client, user_id, task_id, title="a").get_json()["version"]
+    res = _patch(client, user_id, task_id, title="b", version=version - 1)
+    assert res.status_code == 409
+    res = _patch(client, user_id, task_id, title="b", version=version)
+    assert res.status_code == 200
+
+
+def test_conditional_delete(client, user_id, make_category, make_task):
+    task_id = make_task(make_category())
+    url = f"/api/task/{task_id}?user_id={user_id}"
+    assert client.delete(url, headers={"If-Match": '"v99"'}).status_code == 409
+    assert client.delete(url, headers={"If-Match": '"v1"'}).status_code == 200
+    assert client.delete(url, headers={"If-Match": '"v1"'}).status_code == 404
+
+
+def test_conditional_move(client, user_id, make_category, make_task):
+    category_id = make_category()
+    a = make_task(category_id, "a")
+    b = make_task(category_id, "b")
+    url = f"/api/task/{b}/move"
+    res = client.patch(
+        url, json={"user_id": user_id, "next_id": a}, headers={"If-Match": '"v9"'}
+    )
+    assert res.status_code == 409
+    res = client.patch(
+        url, json={"user_id": user_id, "next_id": a}, headers={"If-Match": '"v1"'}
+    )
+    assert res.status_code == 200
+
+
+def test_reorder_with_versions(client, user_id, make_category, make_task, task_ids):
+    category_id = make_category()
+    a = make_task(category_id, "a")
+    b = make_task(category_id, "b")
+    body = {"user_id": user_id, "category_id": category_id, "ordered_ids": [b, a]}
+
+    res = client.patch("/api/tasks/reorder", json={**body, "versions": {str(a): 1}})
+    assert res.status_code == 400
+
+    _patch(client, user_id, a, title="changed")
+    res = client.patch(
+        "/api/tasks/reorder", json={**body, "versions": {str(a): 1, str(b): 1}}
+    )
+    assert res.status_code == 409
+    assert {row["task_id"]: row["version"] for row in res.get_json()["current"]} == {
+        a: 2,
+        b: 1,
+    }
+    assert task_ids(category_id) == [a, b]
+
+    res = client.patch(
+        "/api/tasks/reorder", json={**body, "versions": {str(a): 2, str(b): 1}}
+    )
+    assert res.status_code == 200
+    assert res.get_json()["versions"] == {str(a): 3, str(b): 2}
+    assert task_ids(category_id) == [b, a]
+
+
+def test_category_rename_with_if_match(client, user_id, make_category):
+    category_id = make_category()
+    url = f"/api/category/{category_id}"
+    body = {"user_id": user_id, "title": "new"}
+    res = client.patch(url, json=body, headers={"If-Match": '"v2"'})
+    assert res.status_code == 409
+    assert res.get_json()["current"]["category_title"] == "category"
+    res = client.patch(url, json=body, headers={"If-Match": '"v1"'})
+    assert res.status_code == 200
+    assert res.headers["ETag"] == '"v2"'
+
+
+@pytest.mark.parametrize(
+    "values",
+    [{"prev_id": "abc"}, {"next_id": "1"}, {"prev_id": 1, "version": "abc"}],
+)
+def test_category_move_rejects_non_integer_values(
+    client, user_id, make_category, values
+):
+    a, b = make_category("a"), make_category("b")
+    res = client.patch(f"/api/category/{b}/move", json={"user_id": user_id, **values})
+    assert res.status_code == 400
+    res = client.patch(
+        f"/api/category/{a}", json={"user_id": user_id, "title": "x", "version": "v1"}
+    )
+    assert res.status_code == 400
@@ -19,6 +19,11 @@ export type Task = {
 };
 
 const BASE = "";
+
+// 並べ替えの連番（このページ内で増やす）。連続したドロップはサーバーでまとめられ、
+// 古い連番の並べ替えは 409（stale）で捨てられる
+const REORDER_CLIENT = Math.random().toString(36).slice(2, 12);
+let reorderSeq = 0;
 // 認証ユーザーIDの共通取得
 function currentUserId(): number {
   const v = localStorage.getItem("user_id");
@@ -176,13 +181,26 @@ export async function reorderCategories(
   const res = await fetch(`${BASE}/api/categories/reorder`, {
     method: "PATCH",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ user_id: uid, ordered_ids: orderedIds }),
+    body: JSON.stringify({
+      user_id: uid,
+      ordered_ids: orderedIds,
+      client: REORDER_CLIENT,
+      seq: ++reorderSeq,
+    }),
   });
+  if (await isStaleReorder(res)) return 0;
   if (!res.ok) throw new Error("Failed to reorder categories");
   const data = await res.json();
   return data.updated ?? 0;
 }
 
+// より新しい並べ替えが反映済み（この並べ替えは不要）か
+async function isStaleReorder(res: Response): Promise<boolean> {
+  if (res.status !== 409) return false;
+  const data = await res.clone().json().catch(() => ({}));
+  return data.stale === true;
+}
+
 // タスクの並べ替え（カテゴリ内）
 export async function reorderTasks(
   categoryId: number,
@@ -197,8 +215,11 @@ export async function reorderTasks(
       user_id: uid,
       category_id: categoryId,
       ordered_ids: orderedIds,
+      client: REORDER_CLIENT,
+      seq: ++reorderSeq,
     }),
   });
+  if (await isStaleReorder(res)) return 0;
   if (!res.ok) throw new Error("Failed to reorder tasks");
   const data = await res.json();
   return data.updated ?? 0;